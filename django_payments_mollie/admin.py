@@ -0,0 +1,67 @@
+from collections import defaultdict
+from typing import Any, DefaultDict, List
+
+from django.contrib import admin, messages
+from django.db import models
+from django.http import HttpRequest
+from django.utils.translation import gettext_lazy as _
+from payments.core import provider_factory
+from payments.models import BasePayment
+
+
+@admin.action(description=_("Refresh selected payments from Mollie"))
+def refresh_from_mollie(
+    modeladmin: admin.ModelAdmin,  # type: ignore[type-arg]
+    request: HttpRequest,
+    queryset: "models.QuerySet[Any]",
+) -> None:
+    """
+    Retrieve the selected payments at Mollie, and update them.
+
+    The payments of each variant are retrieved concurrently and updated in few
+    queries, see `MollieProvider.bulk_update_from_mollie()`. Payments that were never
+    sent to Mollie are skipped.
+    """
+    payments_by_variant: DefaultDict[str, List[BasePayment]] = defaultdict(list)
+    for payment in queryset.exclude(transaction_id=""):
+        payments_by_variant[payment.variant].append(payment)
+
+    counts = {"changed": 0, "unchanged": 0, "errors": 0}
+    failed_ids: List[int] = []
+    for variant, payments in payments_by_variant.items():
+        provider = provider_factory(variant)
+        results = provider.bulk_update_from_mollie(
+            payments, max_workers=getattr(modeladmin, "refresh_max_workers", 8)
+        )
+        for key, result_payments in results.items():
+            counts[key] += len(result_payments)
+        failed_ids.extend(payment.id for payment in results["errors"])
+
+    modeladmin.message_user(
+        request,
+        _(
+            "Refreshed payments from Mollie: %(changed)d changed, "
+            "%(unchanged)d unchanged, %(errors)d failed."
+        )
+        % counts,
+        level=messages.SUCCESS,
+    )
+    if failed_ids:
+        modeladmin.message_user(
+            request,
+            _("Failed to retrieve payments %(ids)s at Mollie.")
+            % {"ids": ", ".join(str(payment_id) for payment_id in failed_ids)},
+            level=messages.WARNING,
+        )
+
+
+class MolliePaymentAdminMixin:
+    """
+    Mixin for the ModelAdmin of a payment model, to refresh payments from Mollie.
+
+    Adds the `refresh_from_mollie` action, which retrieves the selected payments
+    concurrently using at most `refresh_max_workers` threads per variant.
+    """
+
+    actions = [refresh_from_mollie]
+    refresh_max_workers = 8
@@ -0,0 +1,7 @@
+from django.apps import AppConfig
+
+
+class DjangoPaymentsMollieConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "django_payments_mollie"
+    verbose_name = "Django Payments Mollie"
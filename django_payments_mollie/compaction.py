@@ -0,0 +1,246 @@
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from django.db import transaction
+from django.db.models import Case, TextField, Value, When
+from payments import PaymentStatus, get_payment_model
+
+from .models import CompactionCheckpoint, PaymentArchive
+
+logger = logging.getLogger(__name__)
+
+# Payments in these statuses are only updated by refunds and chargebacks. ERROR
+# isn't final, the reconciliation still updates those payments from Mollie.
+FINAL_STATUSES = [
+    PaymentStatus.CONFIRMED,
+    PaymentStatus.REJECTED,
+    PaymentStatus.REFUNDED,
+]
+
+# The fields of a Mollie payment that are kept in compacted extra_data, which are
+# enough for `Facade.parse_payment_status()` to reach the same decision
+COMPACTED_FIELDS = [
+    "resource",
+    "id",
+    "mode",
+    "status",
+    "method",
+    "amount",
+    "amountCaptured",
+    "amountRefunded",
+    "amountChargedBack",
+    "createdAt",
+    "paidAt",
+    "canceledAt",
+    "expiresAt",
+    "expiredAt",
+    "failedAt",
+]
+COMPACTED_DETAILS = ["failureReason", "failureMessage"]
+# Marks compacted extra_data, so it isn't compacted or archived again
+COMPACTED_KEY = "_compacted"
+
+ARCHIVE_TABLE = "table"
+ARCHIVE_FILE = "file"
+ARCHIVE_NONE = "none"
+
+# The payment id, variant, transaction id and extra_data of a payment
+PaymentRow = Tuple[int, str, str, str]
+
+
+def compact_extra_data(extra_data: str) -> Optional[str]:
+    """
+    Return the essential fields of a Mollie payment saved in extra_data.
+
+    Returns None if the extra_data isn't a Mollie payment, or is already compacted.
+    """
+    try:
+        data = json.loads(extra_data)
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or not data.get("id") or COMPACTED_KEY in data:
+        return None
+
+    compacted = {key: data[key] for key in COMPACTED_FIELDS if key in data}
+    details = {
+        key: value
+        for key, value in (data.get("details") or {}).items()
+        if key in COMPACTED_DETAILS
+    }
+    if details:
+        compacted["details"] = details
+    compacted[COMPACTED_KEY] = True
+    return json.dumps(compacted)
+
+
+class ExtraDataCompaction:
+    """
+    Compact the `extra_data` of final payments that weren't modified since a cutoff.
+
+    Only the fields in `COMPACTED_FIELDS` are kept. The full extra_data is archived
+    first, in the `PaymentArchive` table (`archive="table"`), or in a gzipped JSON
+    lines file per batch in `archive_dir` (`archive="file"`), or not at all
+    (`archive="none"`).
+
+    Payments are processed in batches in the order of their id. Every batch is
+    updated by a single query in a short transaction, that only touches payments
+    that weren't modified in the meantime, followed by a pause of `throttle`
+    seconds, so the compaction can run on a live database. The last processed
+    payment is stored in a `CompactionCheckpoint`, so an interrupted job continues
+    where it stopped.
+
+    Updates that save the full Mollie payment again, like tracking a refund or
+    refreshing the payment in the admin, inflate the extra_data of a compacted
+    payment again. They also set `modified`, so the payment is compacted again by
+    a later job, or by this job after `reset()`.
+    """
+
+    def __init__(
+        self,
+        variant: str,
+        cutoff: datetime,
+        job: str = "",
+        batch_size: int = 500,
+        throttle: float = 0.1,
+        archive: str = ARCHIVE_TABLE,
+        archive_dir: Union[str, Path, None] = None,
+    ) -> None:
+        if archive == ARCHIVE_FILE and not archive_dir:
+            raise ValueError("An archive directory is required to archive to files")
+        self.variant = variant
+        self.cutoff = cutoff
+        self.job = job or f"compact-{variant}"
+        self.batch_size = batch_size
+        self.throttle = throttle
+        self.archive = archive
+        self.archive_dir = Path(archive_dir) if archive_dir else None
+
+    def get_checkpoint(self) -> CompactionCheckpoint:
+        checkpoint: CompactionCheckpoint
+        checkpoint, _ = CompactionCheckpoint.objects.get_or_create(job=self.job)
+        return checkpoint
+
+    def get_batch(self, after_id: int) -> List[PaymentRow]:
+        """Return the next batch of final payments that weren't modified recently."""
+        return list(
+            get_payment_model()
+            .objects.filter(
+                id__gt=after_id,
+                variant=self.variant,
+                status__in=FINAL_STATUSES,
+                modified__lt=self.cutoff,
+            )
+            .order_by("id")
+            .values_list("id", "variant", "transaction_id", "extra_data")[
+                : self.batch_size
+            ]
+        )
+
+    def archive_to_file(self, rows: List[PaymentRow]) -> None:
+        """Write the full extra_data of the payments to a gzipped JSON lines file."""
+        assert self.archive_dir is not None
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        path = self.archive_dir / f"{self.job}-{rows[0][0]}-{rows[-1][0]}.jsonl.gz"
+        with gzip.open(path, "wt", encoding="utf-8") as file:
+            for payment_id, variant, transaction_id, extra_data in rows:
+                record = {
+                    "payment_id": payment_id,
+                    "variant": variant,
+                    "transaction_id": transaction_id,
+                    "extra_data": extra_data,
+                }
+                file.write(json.dumps(record) + "\n")
+        # Make sure the archive is stored before the payments are compacted
+        with path.open("rb") as archive_file:
+            os.fsync(archive_file.fileno())
+
+    def compact(self, rows: List[PaymentRow]) -> int:
+        """Archive and compact a batch of payments, returns the number compacted."""
+        compacted_rows = []
+        for row in rows:
+            compacted = compact_extra_data(row[3] or "")
+            if compacted is not None:
+                compacted_rows.append((row, compacted))
+        if not compacted_rows:
+            return 0
+
+        if self.archive == ARCHIVE_FILE:
+            # A payment that is archived but not compacted is archived again later
+            self.archive_to_file([row for row, _compacted in compacted_rows])
+
+        Payment = get_payment_model()
+        with transaction.atomic():
+            # Skip payments that were updated since they were read, every update
+            # sets `modified`, which was before the cutoff when they were read
+            compacted_ids = set(
+                Payment.objects.select_for_update()
+                .filter(
+                    id__in=[row[0] for row, _compacted in compacted_rows],
+                    modified__lt=self.cutoff,
+                )
+                .values_list("id", flat=True)
+            )
+            if not compacted_ids:
+                return 0
+
+            Payment.objects.filter(id__in=compacted_ids).update(
+                extra_data=Case(
+                    *[
+                        When(id=row[0], then=Value(compacted))
+                        for row, compacted in compacted_rows
+                        if row[0] in compacted_ids
+                    ],
+                    output_field=TextField(),
+                )
+            )
+            if self.archive == ARCHIVE_TABLE:
+                PaymentArchive.objects.bulk_create(
+                    [
+                        PaymentArchive.from_extra_data(*row)
+                        for row, _compacted in compacted_rows
+                        if row[0] in compacted_ids
+                    ]
+                )
+        return len(compacted_ids)
+
+    def run(self, max_batches: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Compact the payments after the checkpoint of the job, in batches.
+
+        Stops after `max_batches` batches, if given. Returns the number of compacted
+        payments, and the id of the last processed payment.
+        """
+        checkpoint = self.get_checkpoint()
+        compacted = 0
+        batches = 0
+        rows = self.get_batch(checkpoint.last_payment_id)
+        while rows:
+            batch_compacted = self.compact(rows)
+            compacted += batch_compacted
+            checkpoint.last_payment_id = rows[-1][0]
+            checkpoint.compacted += batch_compacted
+            checkpoint.save(update_fields=["last_payment_id", "compacted", "modified"])
+            logger.info(
+                "Compacted %s payments up to payment %s",
+                batch_compacted,
+                checkpoint.last_payment_id,
+            )
+
+            batches += 1
+            if max_batches is not None and batches >= max_batches:
+                break
+            # Leave the database some room for other queries
+            time.sleep(self.throttle)
+            rows = self.get_batch(checkpoint.last_payment_id)
+
+        return {"compacted": compacted, "last_payment_id": checkpoint.last_payment_id}
+
+    def reset(self) -> None:
+        """Start the job over from the first payment."""
+        CompactionCheckpoint.objects.filter(job=self.job).delete()
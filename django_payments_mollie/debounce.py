@@ -0,0 +1,84 @@
+import logging
+import threading
+from typing import Callable, Optional
+
+from django.core.cache import caches
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Calls a function after a delay in seconds, without waiting for it
+Scheduler = Callable[[float, Callable[[], None]], None]
+
+
+def schedule_in_thread(delay: float, func: Callable[[], None]) -> None:
+    """Call `func` after `delay` seconds in a background thread."""
+
+    def run() -> None:
+        try:
+            func()
+        except Exception:
+            logger.exception("Delayed webhook call failed")
+        finally:
+            # The thread ends, so don't leave its database connections open
+            connections.close_all()
+
+    timer = threading.Timer(delay, run)
+    # Don't keep the process alive for a delayed call
+    timer.daemon = True
+    timer.start()
+
+
+class WebhookDebouncer:
+    """
+    Collapse bursts of webhook notifications for the same payment.
+
+    The first notification for a payment is processed right away, and opens a window
+    of `window` seconds. Of all notifications that arrive within the window, only the
+    first schedules a trailing call after the window has passed, the others are
+    skipped. That trailing call happens after all skipped notifications arrived, so
+    it always sees the final state at Mollie. The notification that schedules the
+    trailing call returns right away, so it doesn't keep a worker busy.
+
+    The coordination uses `cache.add()`, so it works across all workers that share
+    the cache. Use a cache backend that is shared between workers, like Redis or
+    Memcached.
+    """
+
+    CACHE_KEY_PREFIX = "django_payments_mollie:webhook"
+
+    def __init__(self, window: float, cache_alias: str = "default") -> None:
+        self.window = window
+        self.cache = caches[cache_alias]
+
+    def debounce(
+        self,
+        key: str,
+        func: Callable[[], None],
+        schedule: Optional[Scheduler] = None,
+    ) -> bool:
+        """
+        Call `func` unless it is debounced, returns True if it was called or scheduled.
+
+        The trailing call is scheduled with `schedule`, which defaults to a
+        background thread of this process.
+        """
+        window_key = f"{self.CACHE_KEY_PREFIX}:{key}"
+        if self.cache.add(window_key, True, timeout=self.window):
+            func()
+            return True
+
+        trailing_key = f"{window_key}:trailing"
+        if not self.cache.add(trailing_key, True, timeout=self.window * 2):
+            # Another worker already makes the trailing call
+            logger.debug("Skipped debounced webhook for %s", key)
+            return False
+
+        def trailing_call() -> None:
+            # Allow the next trailing call before this one, so no notification that
+            # arrives after this point is skipped
+            self.cache.delete(trailing_key)
+            func()
+
+        (schedule or schedule_in_thread)(self.window, trailing_call)
+        return True
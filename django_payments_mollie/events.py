@@ -0,0 +1,165 @@
+import json
+import logging
+import os
+from abc import ABC, abstractmethod
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+from uuid import uuid4
+
+import requests
+from django.utils import timezone
+
+from . import leases
+from .models import PaymentEvent
+from .provider import MollieProvider
+from .transport import Timeout
+from .workers import get_worker_id
+
+logger = logging.getLogger(__name__)
+
+
+class BaseEventSink(ABC):
+    """
+    Base class for the destinations of published payment events.
+
+    `send()` receives a batch of events as dicts, in the order they were recorded,
+    and raises an exception if the batch wasn't delivered. A failed batch is sent
+    again later, so sinks may receive an event more than once: consumers should
+    ignore events with an `id` they already processed.
+    """
+
+    @abstractmethod
+    def send(self, events: List[Dict[str, Any]]) -> None:
+        """Deliver a batch of events, or raise an exception."""
+
+
+class HTTPEventSink(BaseEventSink):
+    """POST every batch of events as JSON to a URL, as `{"events": [...]}`."""
+
+    def __init__(
+        self,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Timeout = 10,
+    ) -> None:
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(headers or {})
+
+    def send(self, events: List[Dict[str, Any]]) -> None:
+        response = self.session.post(
+            self.url, json={"events": events}, timeout=self.timeout
+        )
+        response.raise_for_status()
+
+
+class FileEventSink(BaseEventSink):
+    """
+    Append every event as a line of JSON to a file.
+
+    The file is synced to disk before the batch counts as delivered, so it can serve
+    as a local queue for another process, or as a stand-in for a message broker.
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+
+    def send(self, events: List[Dict[str, Any]]) -> None:
+        with self.path.open("a") as file:
+            for event in events:
+                file.write(json.dumps(event) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+
+class PaymentEventPublisher:
+    """
+    Deliver the payment events in the outbox to the event sinks of the provider.
+
+    Events are claimed in batches through a lease in the database, so several
+    publishers can run at the same time. A claimed batch is sent to every sink, and
+    only marked as delivered when all sinks accepted it. A failed batch is retried
+    after a delay that doubles with every attempt, and the events of a crashed
+    publisher are claimed again when their lease expires. Events are delivered at
+    least once, in the order they were recorded within a batch.
+    """
+
+    def __init__(
+        self,
+        provider: MollieProvider,
+        variant: str,
+        batch_size: int = 100,
+        lease_duration: timedelta = timedelta(minutes=5),
+        retry_delay: timedelta = timedelta(seconds=30),
+        max_retry_delay: timedelta = timedelta(hours=1),
+    ) -> None:
+        self.provider = provider
+        self.variant = variant
+        self.batch_size = batch_size
+        # Longer than delivering a batch to all sinks takes
+        self.lease_duration = lease_duration
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+
+    def claim(self) -> List[PaymentEvent]:
+        """Claim the lease of the next batch of undelivered events."""
+        return leases.claim(
+            PaymentEvent.objects.filter(
+                variant=self.variant, delivered_at__isnull=True
+            ).order_by("id"),
+            f"{get_worker_id()}:{uuid4().hex}",
+            self.lease_duration,
+            limit=self.batch_size,
+        )
+
+    def deliver(self, events: List[PaymentEvent]) -> bool:
+        """Send a batch of claimed events to all sinks, returns True if delivered."""
+        payload = [event.as_dict() for event in events]
+        event_ids = [event.id for event in events]
+        try:
+            for sink in self.provider.event_sinks:
+                sink.send(payload)
+        except Exception as exc:
+            attempts = leases.fail(
+                events, events[0].owner, exc, self.retry_delay, self.max_retry_delay
+            )
+            logger.warning(
+                "Failed to publish %s payment events, attempt %s: %s",
+                len(events),
+                attempts,
+                exc,
+            )
+            return False
+
+        PaymentEvent.objects.filter(id__in=event_ids).update(
+            delivered_at=timezone.now(), leased_until=None
+        )
+        return True
+
+    def purge(self, retention: timedelta) -> int:
+        """Delete the events that were delivered longer than `retention` ago."""
+        deleted, _ = PaymentEvent.objects.filter(
+            variant=self.variant, delivered_at__lt=timezone.now() - retention
+        ).delete()
+        return deleted
+
+    def run(self) -> Dict[str, int]:
+        """
+        Deliver the available events in batches, until a batch fails or none are left.
+
+        Returns the number of delivered events, and the number of events of the
+        failed batch.
+        """
+        totals = {"delivered": 0, "failed": 0}
+        events = self.claim()
+        while events:
+            if not self.deliver(events):
+                # Don't hammer a sink that is down, the batch is retried later
+                totals["failed"] += len(events)
+                break
+            totals["delivered"] += len(events)
+            events = self.claim()
+
+        return totals
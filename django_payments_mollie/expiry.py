@@ -0,0 +1,182 @@
+import logging
+import math
+import random
+from datetime import timedelta
+from typing import Any, Dict, List
+
+from django.db import transaction
+from django.utils import timezone
+from payments import PaymentError, PaymentStatus, get_payment_model
+from payments.signals import status_changed
+
+from .models import PaymentCheckout
+from .provider import MollieProvider
+
+logger = logging.getLogger(__name__)
+
+# The status message of swept payments, the same as for payments that Mollie
+# reported as expired
+EXPIRED_MESSAGE = "Mollie payment failed with status 'expired'"
+
+
+class ExpiredPaymentSweeper:
+    """
+    Reject local payments of which the Mollie checkout expired long ago.
+
+    Mollie calls the webhook when a payment expires, but a notification can be
+    missed or lost, like when the site was down, or the payment was created without
+    a webhook URL. The local payment then stays in INPUT. As a backstop, the sweeper
+    finds these payments by the stored expiry of their checkout, which requires the
+    `track_checkouts` or `reuse_checkout` option of the provider, and rejects them
+    with one UPDATE query per batch, instead of retrieving every payment from
+    Mollie.
+
+    A `sample_rate` fraction of every batch is retrieved from Mollie to confirm
+    that the payments really expired. When a sampled payment turns out not to be
+    expired, all payments of the batch are retrieved from Mollie instead.
+    """
+
+    def __init__(
+        self,
+        provider: MollieProvider,
+        variant: str,
+        batch_size: int = 1000,
+        grace_period: timedelta = timedelta(hours=1),
+        sample_rate: float = 0.01,
+    ) -> None:
+        self.provider = provider
+        self.variant = variant
+        self.batch_size = batch_size
+        # Leave payments alone while a late payment can still be reported by Mollie
+        self.grace_period = grace_period
+        self.sample_rate = sample_rate
+
+    def get_expired_checkouts(self, after_id: int = 0) -> List[PaymentCheckout]:
+        """Return the next batch of checkouts that expired before the grace period."""
+        return list(
+            PaymentCheckout.objects.filter(
+                variant=self.variant,
+                expires_at__lt=timezone.now() - self.grace_period,
+                id__gt=after_id,
+            ).order_by("id")[: self.batch_size]
+        )
+
+    def get_open_payments(self, checkouts: List[PaymentCheckout]) -> List[Any]:
+        """Return the payments that are still in INPUT, with the same transaction."""
+        transaction_ids = {
+            checkout.payment_id: checkout.transaction_id for checkout in checkouts
+        }
+        payments = get_payment_model().objects.filter(
+            id__in=transaction_ids, status=PaymentStatus.INPUT
+        )
+        return [
+            payment
+            for payment in payments
+            if payment.transaction_id == transaction_ids[payment.id]
+        ]
+
+    def confirm(self, payments: List[Any]) -> bool:
+        """
+        Update the payments from Mollie, returns True if all of them expired.
+
+        Raises PaymentError if a payment can't be retrieved.
+        """
+        expired = True
+        for payment in payments:
+            self.provider.update_from_mollie(payment)
+            if payment.status != PaymentStatus.REJECTED:
+                logger.warning(
+                    "Payment %s didn't expire at Mollie, its status is '%s'",
+                    payment.id,
+                    payment.status,
+                )
+                expired = False
+        return expired
+
+    def reject(self, payments: List[Any]) -> int:
+        """
+        Reject the payments with a single UPDATE, and send the `status_changed` signal.
+
+        Payments that were changed concurrently, for example by a webhook, are left
+        alone: the payments that are still in INPUT are locked, and exactly those are
+        rejected. The status changes are recorded in the outbox of the provider.
+        Returns the number of rejected payments.
+        """
+        if not payments:
+            return 0
+
+        Payment = get_payment_model()
+        with transaction.atomic():
+            rejected_payments = list(
+                Payment.objects.select_for_update().filter(
+                    id__in=[payment.id for payment in payments],
+                    status=PaymentStatus.INPUT,
+                )
+            )
+            rejected: int = Payment.objects.filter(
+                id__in=[payment.id for payment in rejected_payments]
+            ).update(
+                status=PaymentStatus.REJECTED,
+                message=EXPIRED_MESSAGE,
+                modified=timezone.now(),
+            )
+            for payment in rejected_payments:
+                payment.status = PaymentStatus.REJECTED
+                payment.message = EXPIRED_MESSAGE
+            self.provider.record_status_changes(
+                [(payment, PaymentStatus.INPUT) for payment in rejected_payments]
+            )
+
+        for payment in rejected_payments:
+            status_changed.send(sender=type(payment), instance=payment)
+        return rejected
+
+    def sweep(self, checkouts: List[PaymentCheckout]) -> Dict[str, int]:
+        """Sweep the payments of a batch of expired checkouts."""
+        payments = self.get_open_payments(checkouts)
+        sample_size = min(len(payments), math.ceil(len(payments) * self.sample_rate))
+        sample = random.sample(payments, sample_size)
+        sample_ids = {payment.id for payment in sample}
+        others = [payment for payment in payments if payment.id not in sample_ids]
+
+        if self.confirm(sample):
+            rejected = self.reject(others)
+            confirmed = len(sample)
+        else:
+            # The batch can't be trusted, check every payment at Mollie
+            self.confirm(others)
+            rejected = 0
+            confirmed = len(payments)
+
+        # The checkouts can't be reused anymore, so they are removed, unless they were
+        # refreshed by an update from Mollie
+        PaymentCheckout.objects.filter(
+            id__in=[checkout.id for checkout in checkouts],
+            expires_at__lt=timezone.now() - self.grace_period,
+        ).delete()
+        return {"rejected": rejected, "confirmed": confirmed}
+
+    def run(self) -> Dict[str, int]:
+        """
+        Sweep all expired checkouts in batches.
+
+        Batches that can't be confirmed at Mollie are skipped, and retried by the next
+        run. Returns the number of payments that were rejected without a request to
+        Mollie, and the number of payments that were updated from Mollie.
+        """
+        totals = {"rejected": 0, "confirmed": 0}
+        checkouts = self.get_expired_checkouts()
+        while checkouts:
+            try:
+                results = self.sweep(checkouts)
+            except PaymentError as exc:
+                logger.warning(
+                    "Failed to confirm expired payments at Mollie: %s",
+                    exc.gateway_message,
+                )
+            else:
+                for key, value in results.items():
+                    totals[key] += value
+            checkouts = self.get_expired_checkouts(after_id=checkouts[-1].id)
+
+        return totals
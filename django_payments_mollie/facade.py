@@ -1,16 +1,73 @@
 import json
+import threading
 import warnings
+from contextlib import contextmanager
 from decimal import Decimal
-from typing import Any, Dict, Tuple
-
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NoReturn,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+import requests
 from django.utils.translation import gettext_lazy as _
 from mollie.api.client import Client as MollieClient
 from mollie.api.error import Error as MollieError
+from mollie.api.error import RequestError, ResponseError, ResponseHandlingError
+from mollie.api.objects.base import ObjectBase as MollieObject
+from mollie.api.objects.capture import Capture
+from mollie.api.objects.chargeback import Chargeback
+from mollie.api.objects.list import PaginationList as MollieList
 from mollie.api.objects.payment import Payment as MolliePayment
+from mollie.api.objects.refund import Refund
+from mollie.api.objects.settlement import Settlement as MollieSettlement
+from mollie.api.resources.base import ResourceListMixin as MollieListResource
+from mollie.api.resources.chargebacks import PaymentChargebacks
+from mollie.api.resources.refunds import PaymentRefunds
 from payments import FraudStatus, PaymentError, PaymentStatus
 from payments.models import BasePayment
 
 from . import __version__ as version
+from .objects import AnyMolliePayment, SlimMolliePayment, get_embedded
+from .streaming import ListStreamError, iter_list_stream
+from .transport import RequestsTransport, Timeout, Transport
+
+
+class Client(MollieClient):
+    """
+    Mollie client of which the timeout can be overridden for the current thread.
+
+    A Facade is shared by all threads of a process, so changing the timeout of its
+    client would affect concurrent requests as well.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        self.local = threading.local()
+        super().__init__(*args, **kwargs)
+
+    @property
+    def timeout(self) -> Union[int, Tuple[int, int]]:
+        return getattr(self.local, "timeout", None) or self.default_timeout
+
+    @timeout.setter
+    def timeout(self, timeout: Union[int, Tuple[int, int]]) -> None:
+        self.default_timeout = timeout
+
+    @contextmanager
+    def override_timeout(self, timeout: Timeout) -> Iterator[None]:
+        """Use the timeout for all requests in the current thread within the block."""
+        self.local.timeout = timeout
+        try:
+            yield
+        finally:
+            self.local.timeout = None
 
 
 class Facade:
@@ -20,23 +77,97 @@ class Facade:
     In this class, all functionality that actually touches Mollie is implemented.
     """
 
-    client: MollieClient
+    client: Client
+    slim_payments: bool
+    stream_lists: bool
+
+    # The maximum page size that Mollie allows for list requests
+    LIST_PAGE_SIZE = 250
+    # The size of the chunks in which streamed list responses are parsed
+    STREAM_CHUNK_SIZE = 16384
+    # The number of parsed objects of a streamed list that are kept ahead
+    STREAM_PREFETCH = 1
+
+    # The transaction types that can be part of a settlement
+    SETTLEMENT_TRANSACTION_TYPES = ("payments", "refunds", "chargebacks")
+
+    # The object types of the collections that can be embedded in a payment
+    EMBEDDED_OBJECT_TYPES = {
+        "refunds": Refund,
+        "chargebacks": Chargeback,
+        "captures": Capture,
+    }
+
+    def __init__(
+        self,
+        slim_payments: bool = False,
+        transport: Optional[Transport] = None,
+        stream_lists: bool = False,
+    ) -> None:
+        """
+        Init a new Facade.
 
-    def __init__(self) -> None:
-        self.client = MollieClient()
+        When `slim_payments` is enabled, payments are returned as `SlimMolliePayment`
+        projections instead of full Mollie `Payment` objects. A `transport` replaces
+        the default `requests` session of the Mollie client. When `stream_lists` is
+        enabled, list responses are parsed while they are received, see
+        `_iter_list_stream()`.
+        """
+        self.slim_payments = slim_payments
+        self.stream_lists = stream_lists
+        self.client = Client()
         self.client.set_user_agent_component("Django Payments Mollie", version)
+        if transport is not None:
+            self.set_transport(transport)
+
+    def set_transport(self, transport: Transport) -> None:
+        """Perform all requests to Mollie using the transport."""
+        self.client._client = transport  # type: ignore[assignment]
 
     def setup_with_api_key(self, api_key: str) -> None:
         """Setup the Mollie client using an API key."""
         self.client.set_api_key(api_key)
 
-    def retrieve_payment(self, payment: BasePayment) -> MolliePayment:
-        """Retrieve a payment at Mollie."""
+    def setup_with_access_token(
+        self, access_token: str, testmode: bool = False
+    ) -> None:
+        """Setup the Mollie client using an organization or OAuth access token."""
+        self.client.set_access_token(access_token)
+        self.client.set_testmode(testmode)
+
+    def retrieve_payment(
+        self,
+        payment: BasePayment,
+        embed: Sequence[str] = (),
+        include: Sequence[str] = (),
+    ) -> AnyMolliePayment:
+        """
+        Retrieve a payment at Mollie.
+
+        Related objects in `embed`, like "refunds", "chargebacks" or "captures", are
+        embedded in the response, so they don't need a request of their own. Use
+        `get_embedded_objects()` to get them. Details in `include`, like
+        "details.qrCode", are included in the payment.
+        """
         if not payment.transaction_id:
             raise PaymentError(_("Mollie payment id is unknown"))
 
+        params = {}
+        if embed:
+            params["embed"] = ",".join(embed)
+        if include:
+            params["include"] = ",".join(include)
+
+        mollie_payment: AnyMolliePayment
         try:
-            mollie_payment = self.client.payments.get(payment.transaction_id)
+            if self.slim_payments:
+                mollie_payment = self._retrieve_slim_payment(
+                    payment.transaction_id, params
+                )
+            else:
+                mollie_payment = self.client.payments.get(
+                    payment.transaction_id, **params
+                )
         except MollieError as exc:
             raise PaymentError(
                 _("Failed to retrieve payment at Mollie"),
@@ -45,8 +176,65 @@ class Facade:
 
         return mollie_payment
 
-    def create_payment(self, payment: BasePayment, return_url: str) -> MolliePayment:
-        """Create a new payment at Mollie."""
+    def _retrieve_slim_payment(
+        self, transaction_id: str, params: Optional[Dict[str, str]] = None
+    ) -> SlimMolliePayment:
+        """Retrieve a payment at Mollie, and build the projection from the response."""
+        self.client.payments.validate_resource_id(transaction_id, "payment ID")
+        resp = self.client.perform_http_call(
+            "GET", f"payments/{transaction_id}", params=params or None
+        )
+        if 200 <= resp.status_code <= 299:
+            return SlimMolliePayment.from_response(resp.content)
+        self._raise_response_error(resp)
+
+    @staticmethod
+    def _raise_response_error(resp: Any) -> NoReturn:
+        """Raise the same errors for a failed response as the Mollie client does."""
+        try:
+            result = resp.json()
+        except ValueError:
+            result = {}
+        if "status" in result:
+            raise ResponseError.factory(result)  # type: ignore[no-untyped-call]
+        raise ResponseHandlingError(  # type: ignore[no-untyped-call]
+            f"Unable to decode Mollie API response (status code: {resp.status_code}): "
+            f"'{resp.text}'."
+        )
+
+    def iter_payments(self, **params: Any) -> Iterator[AnyMolliePayment]:
+        """
+        Iterate over all payments at Mollie, newest first.
+
+        Pages are only requested from Mollie when the iteration reaches them. When
+        `slim_payments` is enabled, the payments are yielded as projections.
+        """
+        if self.slim_payments:
+            return self._iter_list(
+                self.client.payments, object_factory=SlimMolliePayment, **params
+            )
+        return self._iter_list(self.client.payments, **params)
+
+    def create_payment(
+        self,
+        payment: BasePayment,
+        return_url: str,
+        idempotency_key: str = "",
+        timeout: Timeout = None,
+        webhook_url: str = "",
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> MolliePayment:
+        """
+        Create a new payment at Mollie.
+
+        Requests with the same `idempotency_key` create only one payment at Mollie, so
+        they can be repeated when the outcome of a request is unknown. In that case,
+        a failing request doesn't change the status of the payment to ERROR. The
+        `timeout` overrides the timeout of the Mollie client for this request.
+
+        Mollie calls the `webhook_url` when the status of the payment changes, and
+        stores the `metadata` with the payment.
+        """
         if payment.status != PaymentStatus.WAITING:
             raise PaymentError(_("Payment status is not WAITING"))
 
@@ -57,11 +245,17 @@ class Facade:
             # This is a programming error
             raise ValueError("The payment has no total amount, but it is required")
 
-        payload = self._generate_new_payment_payload(payment, return_url)
+        payload = self._generate_new_payment_payload(
+            payment, return_url, webhook_url, metadata
+        )
         try:
-            mollie_payment = self.client.payments.create(payload)
+            with self.client.override_timeout(timeout):
+                mollie_payment = self.client.payments.create(
+                    payload, idempotency_key=idempotency_key
+                )
         except MollieError as exc:
-            payment.change_status(PaymentStatus.ERROR, str(exc))
+            if not (idempotency_key and isinstance(exc, RequestError)):
+                payment.change_status(PaymentStatus.ERROR, str(exc))
             raise PaymentError(
                 _("Failed to create payment at Mollie"),
                 gateway_message=exc,
@@ -69,9 +263,211 @@ class Facade:
 
         return mollie_payment  # type: ignore[no-any-return]  # .get() has generic type
 
+    def get_embedded_objects(
+        self, mollie_payment: AnyMolliePayment, name: str
+    ) -> Optional[List[MollieObject]]:
+        """
+        Return the Mollie objects of a collection embedded in the payment.
+
+        Returns None if the collection wasn't embedded when the payment was retrieved.
+        """
+        data = get_embedded(mollie_payment, name)
+        if data is None:
+            return None
+        object_type = self.EMBEDDED_OBJECT_TYPES[name]
+        return [
+            object_type(item, self.client)  # type: ignore[no-untyped-call]
+            for item in data
+        ]
+
+    def iter_payment_refunds(self, mollie_payment: AnyMolliePayment) -> Iterator[Any]:
+        """Iterate over all refunds of a payment, the embedded ones if available."""
+        embedded = self.get_embedded_objects(mollie_payment, "refunds")
+        if embedded is not None:
+            return iter(embedded)
+        return self._iter_list(
+            PaymentRefunds(self.client, mollie_payment)  # type: ignore[arg-type]
+        )
+
+    def iter_payment_chargebacks(
+        self, mollie_payment: AnyMolliePayment
+    ) -> Iterator[Any]:
+        """Iterate over all chargebacks of a payment, the embedded ones if available."""
+        embedded = self.get_embedded_objects(mollie_payment, "chargebacks")
+        if embedded is not None:
+            return iter(embedded)
+        return self._iter_list(
+            PaymentChargebacks(self.client, mollie_payment)  # type: ignore[arg-type]
+        )
+
+    def retrieve_settlement(self, settlement_id: str) -> MollieSettlement:
+        """Retrieve a settlement at Mollie, by ID or bank reference."""
+        try:
+            settlement = self.client.settlements.get(settlement_id)
+        except MollieError as exc:
+            raise PaymentError(
+                _("Failed to retrieve settlement at Mollie"),
+                gateway_message=exc,
+            )
+
+        return settlement
+
+    def iter_settlements(self, **params: Any) -> Iterator[MollieSettlement]:
+        """
+        Iterate over all settlements at Mollie, newest first.
+
+        Pages are only requested from Mollie when the iteration reaches them.
+        """
+        return self._iter_list(self.client.settlements, **params)
+
+    def iter_settlement_transactions(
+        self, settlement: MollieSettlement
+    ) -> Iterator[Tuple[str, MollieObject]]:
+        """
+        Iterate over all payments, refunds and chargebacks in a settlement.
+
+        Yields tuples of the transaction type (one of `SETTLEMENT_TRANSACTION_TYPES`)
+        and the Mollie object. Pages are only requested from Mollie when the iteration
+        reaches them, so a settlement of any size can be processed in bounded memory.
+        """
+        for transaction_type in self.SETTLEMENT_TRANSACTION_TYPES:
+            resource = getattr(settlement, transaction_type)
+            for transaction in self._iter_list(resource):
+                yield transaction_type, transaction
+
+    def _iter_list(
+        self,
+        resource: MollieListResource,
+        object_factory: Optional[Callable[[Dict[str, Any]], Any]] = None,
+        **params: Any,
+    ) -> Iterator[Any]:
+        """
+        Iterate over all objects of a Mollie list resource, one page at a time.
+
+        With `stream_lists`, the objects are parsed from the responses while they are
+        received, instead of decoding a page at once.
+
+        The objects are created from the data in the page using `object_factory`, or
+        as Mollie objects of the type of the resource.
+        """
+        params.setdefault("limit", self.LIST_PAGE_SIZE)
+        if self.stream_lists:
+            return self._iter_list_stream(resource, object_factory, params)
+
+        return self._iter_list_pages(resource, object_factory, params)
+
+    def _iter_list_pages(
+        self,
+        resource: MollieListResource,
+        object_factory: Optional[Callable[[Dict[str, Any]], Any]],
+        params: Dict[str, Any],
+    ) -> Iterator[Any]:
+        """Iterate over the objects of a Mollie list, decoding one page at a time."""
+        try:
+            page: Optional[MollieList] = resource.list(**params)
+            while page is not None:
+                if object_factory is None:
+                    yield from page
+                else:
+                    object_name = page.object_type.get_object_name()
+                    for data in page["_embedded"][object_name]:
+                        yield object_factory(data)
+                page = page.get_next()  # type: ignore[no-untyped-call]
+        except MollieError as exc:
+            raise PaymentError(
+                _("Failed to retrieve list at Mollie"),
+                gateway_message=exc,
+            )
+
+    def _iter_list_stream(
+        self,
+        resource: MollieListResource,
+        object_factory: Optional[Callable[[Dict[str, Any]], Any]],
+        params: Dict[str, Any],
+    ) -> Iterator[Any]:
+        """
+        Iterate over the objects of a Mollie list, as the responses are received.
+
+        The objects are parsed from each response while it is received, and created
+        one at a time, so the memory usage doesn't depend on the page size. The pages
+        are requested and parsed in a background thread, so processing the objects
+        overlaps with receiving the next ones. See `streaming.iter_list_stream()`.
+        """
+        object_type = resource.object_type
+
+        def create_object(data: Dict[str, Any]) -> Any:
+            if object_factory is None:
+                return object_type(data, self.client)
+            return object_factory(data)
+
+        try:
+            for data in iter_list_stream(
+                self._stream_http_call,
+                resource.get_resource_path(),
+                params,
+                object_type.get_object_name(),  # type: ignore[no-untyped-call]
+                prefetch=self.STREAM_PREFETCH,
+            ):
+                yield create_object(data)
+        except (MollieError, ListStreamError) as exc:
+            raise PaymentError(
+                _("Failed to retrieve list at Mollie"),
+                gateway_message=exc,
+            )
+
+    def _stream_http_call(
+        self, path: str, params: Optional[Dict[str, Any]]
+    ) -> Iterator[bytes]:
+        """
+        Perform a GET request at Mollie, and yield the response body in chunks.
+
+        The request is made like the Mollie client does. Transports based on a
+        `requests` session receive the body while it is read, other transports yield
+        the body they received in chunks.
+        """
+        client = self.client
+        if not hasattr(client, "_client"):
+            self.set_transport(RequestsTransport())
+        transport: Any = client._client
+        url, _payload, params = client._format_request_data(
+            path, None, params or {}, "GET"
+        )
+        headers = {
+            "Accept": "application/json",
+            "Authorization": f"Bearer {client.api_key}",
+            "User-Agent": client.user_agent,
+            "X-Mollie-Client-Info": client.UNAME,
+        }
+        stream = isinstance(transport, requests.Session)
+        try:
+            resp = transport.request(
+                "GET",
+                url,
+                headers=headers,
+                params=params,
+                timeout=client.timeout,
+                **({"stream": True} if stream else {}),
+            )
+        except requests.exceptions.RequestException as exc:
+            raise RequestError(f"Unable to communicate with Mollie: {exc}")
+
+        try:
+            if not 200 <= resp.status_code <= 299:
+                self._raise_response_error(resp)
+            if stream:
+                yield from resp.iter_content(self.STREAM_CHUNK_SIZE)
+            else:
+                content = resp.content
+                for start in range(0, len(content), self.STREAM_CHUNK_SIZE):
+                    end = start + self.STREAM_CHUNK_SIZE
+                    yield content[start:end]
+        finally:
+            if stream:
+                resp.close()
+
     @staticmethod
     def parse_payment_status(
-        mollie_payment: MolliePayment,
+        mollie_payment: AnyMolliePayment,
     ) -> Tuple[str, str, Dict[str, Any]]:
         """
         Parse a Mollie payment response and extract all relevant status data.
@@ -84,9 +480,13 @@ class Facade:
         next_status = ""
         next_status_message = ""
         # Save the full payment response to the extra_data field for later reference
-        payment_updates = {"extra_data": json.dumps(mollie_payment)}
+        if isinstance(mollie_payment, SlimMolliePayment):
+            extra_data = mollie_payment.to_json()
+        else:
+            extra_data = json.dumps(mollie_payment)
+        payment_updates = {"extra_data": extra_data}
 
-        if mollie_payment.is_paid():  # type: ignore[no-untyped-call]
+        if mollie_payment.is_paid():
             next_status = PaymentStatus.CONFIRMED
             if mollie_payment.amount_captured:
                 payment_updates[
@@ -95,12 +495,12 @@ class Facade:
                     mollie_payment.amount_captured["value"]
                 )
 
-        elif mollie_payment.is_canceled() or mollie_payment.is_expired():  # type: ignore[no-untyped-call]  # noqa: E501
+        elif mollie_payment.is_canceled() or mollie_payment.is_expired():
             next_status = PaymentStatus.REJECTED
             next_status_message = (
                 f"Mollie payment failed with status '{mollie_payment.status}'"
             )
-        elif mollie_payment.is_failed():  # type: ignore[no-untyped-call]
+        elif mollie_payment.is_failed():
             next_status = PaymentStatus.REJECTED
             next_status_message = (
                 f"Mollie payment failed with status '{mollie_payment.status}'"
@@ -119,7 +519,7 @@ class Facade:
                     payment_updates["fraud_status"] = FraudStatus.REJECT
                     payment_updates["fraud_message"] = failure_message
 
-        elif mollie_payment.is_open() or mollie_payment.is_pending():  # type: ignore[no-untyped-call]  # noqa: E501
+        elif mollie_payment.is_open() or mollie_payment.is_pending():
             # Payment flow isn't completed by the User or Mollie (yet)
             pass
 
@@ -138,9 +538,11 @@ class Facade:
         cls,
         payment: BasePayment,
         return_url: str,
+        webhook_url: str = "",
+        metadata: Optional[Dict[str, Any]] = None,
     ) -> Dict[str, Any]:
         """Generate the payload for a new Mollie payment request."""
-        payload = {
+        payload: Dict[str, Any] = {
             "amount": {
                 "currency": payment.currency,
                 "value": str(payment.total),
@@ -148,6 +550,10 @@ class Facade:
             "description": payment.description,
             "redirectUrl": return_url,
         }
+        if webhook_url:
+            payload["webhookUrl"] = webhook_url
+        if metadata:
+            payload["metadata"] = metadata
 
         # Add billing address if possible
         billing_address = cls._generate_billing_address(payment)
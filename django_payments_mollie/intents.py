@@ -0,0 +1,122 @@
+import logging
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+
+from django.db.models import F
+from django.utils import timezone
+from payments import PaymentError, PaymentStatus, get_payment_model
+
+from .models import PaymentIntent
+from .provider import MollieProvider
+
+logger = logging.getLogger(__name__)
+
+
+class PaymentIntentRecovery:
+    """
+    Create the Mollie payments of intents that are still pending.
+
+    An intent stays pending when the request to create the payment failed or timed
+    out during checkout. The request is repeated with the idempotency key of the
+    intent, so Mollie returns the payment if it was created after all.
+
+    Intents are claimed by a conditional UPDATE of their attempt counter, so several
+    workers can run at the same time without processing an intent twice.
+    """
+
+    def __init__(
+        self,
+        provider: MollieProvider,
+        variant: str,
+        batch_size: int = 100,
+        min_age: timedelta = timedelta(minutes=1),
+        max_attempts: int = 10,
+    ) -> None:
+        self.provider = provider
+        self.variant = variant
+        self.batch_size = batch_size
+        # Leave intents alone while the checkout that recorded them may still run
+        self.min_age = min_age
+        self.max_attempts = max_attempts
+
+    def get_pending_intents(self, after_id: int = 0) -> List[PaymentIntent]:
+        """Return the next batch of pending intents that are old enough to recover."""
+        return list(
+            PaymentIntent.objects.filter(
+                variant=self.variant,
+                status=PaymentIntent.STATUS_PENDING,
+                created__lte=timezone.now() - self.min_age,
+                id__gt=after_id,
+            ).order_by("id")[: self.batch_size]
+        )
+
+    def claim(self, intent: PaymentIntent) -> bool:
+        """Claim the intent, returns False if another worker already attempted it."""
+        claimed = PaymentIntent.objects.filter(
+            id=intent.id,
+            status=PaymentIntent.STATUS_PENDING,
+            attempts=intent.attempts,
+        ).update(attempts=F("attempts") + 1)
+        intent.attempts += 1
+        return bool(claimed)
+
+    def fail(self, intent: PaymentIntent, error: str, final: bool = False) -> None:
+        """Store the error of an attempt, and give up on the intent if `final`."""
+        updates: Dict[str, Any] = {"last_error": error}
+        if final or intent.attempts >= self.max_attempts:
+            updates["status"] = PaymentIntent.STATUS_FAILED
+        PaymentIntent.objects.filter(
+            id=intent.id, status=PaymentIntent.STATUS_PENDING
+        ).update(**updates)
+        logger.warning("Failed to recover payment intent %s: %s", intent.id, error)
+
+    def recover(self, intent: PaymentIntent, payment: Optional[Any]) -> bool:
+        """Create the Mollie payment of the intent, returns True if it was linked."""
+        if not self.claim(intent):
+            return False
+
+        if payment is None:
+            self.fail(intent, "The payment was deleted", final=True)
+            return False
+        if payment.status != PaymentStatus.WAITING:
+            self.fail(intent, f"The payment status is '{payment.status}'", final=True)
+            return False
+
+        try:
+            mollie_payment = self.provider.get_facade(payment).create_payment(
+                payment,
+                self.provider.get_return_url(payment),
+                idempotency_key=intent.idempotency_key,
+                **self.provider.get_create_options(payment),
+            )
+        except PaymentError as exc:
+            # The facade only sets the ERROR status if Mollie refused the payment
+            self.provider.record_create_error(payment)
+            self.fail(
+                intent,
+                f"{exc}: {exc.gateway_message}",
+                final=payment.status == PaymentStatus.ERROR,
+            )
+            return False
+
+        if not self.provider.complete_payment_intent(
+            payment, intent, mollie_payment.id
+        ):
+            return False
+        self.provider.save_checkout(payment, mollie_payment)
+        return True
+
+    def run(self) -> int:
+        """Recover all pending intents in batches, returns the number recovered."""
+        recovered = 0
+        intents = self.get_pending_intents()
+        while intents:
+            payments = get_payment_model().objects.in_bulk(
+                [intent.payment_id for intent in intents]
+            )
+            for intent in intents:
+                if self.recover(intent, payments.get(intent.payment_id)):
+                    recovered += 1
+            intents = self.get_pending_intents(after_id=intents[-1].id)
+
+        return recovered
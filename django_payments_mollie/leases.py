@@ -0,0 +1,104 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Any, List, Optional, Sequence
+
+from django.db import models
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import LeasedModel
+
+logger = logging.getLogger(__name__)
+
+
+def get_available(now: Optional[datetime] = None) -> Q:
+    """Return the filter for rows that aren't leased, or of which the lease expired."""
+    return Q(leased_until__isnull=True) | Q(leased_until__lt=now or timezone.now())
+
+
+def get_retry_delay(
+    attempts: int, retry_delay: timedelta, max_retry_delay: timedelta
+) -> timedelta:
+    """Return the delay before the next attempt, which doubles with every attempt."""
+    delay: timedelta = min(retry_delay * 2 ** (attempts - 1), max_retry_delay)
+    return delay
+
+
+def claim(
+    queryset: "models.QuerySet[Any]",
+    owner: str,
+    lease_duration: timedelta,
+    limit: int = 1,
+) -> List[Any]:
+    """
+    Lease the first `limit` available rows of an ordered queryset to the owner.
+
+    Rows are claimed with a conditional UPDATE instead of row locks, so workers never
+    block each other. Rows that another worker claimed in the meantime are left out,
+    and the next available rows are tried when all of them were. Returns the claimed
+    rows, in the order of the queryset.
+    """
+    model = queryset.model
+    while True:
+        now = timezone.now()
+        available = get_available(now)
+        candidates = dict(queryset.filter(available).values_list("id", "owner")[:limit])
+        if not candidates:
+            return []
+
+        if queryset.filter(available, id__in=list(candidates)).update(
+            owner=owner, leased_until=now + lease_duration
+        ):
+            claimed = list(
+                model.objects.filter(id__in=list(candidates), owner=owner).order_by(
+                    *queryset.query.order_by
+                )
+            )
+            for obj in claimed:
+                # Failed rows are released, so the previous owner stopped
+                if candidates[obj.id]:
+                    logger.info(
+                        "Reclaimed %s %s from %s",
+                        model._meta.verbose_name,
+                        obj.id,
+                        candidates[obj.id],
+                    )
+            return claimed
+
+
+def renew(
+    queryset: "models.QuerySet[Any]", owner: str, lease_duration: timedelta
+) -> Optional[datetime]:
+    """
+    Extend the lease of the owner on the rows of the queryset.
+
+    Returns the new end of the lease, or None if the owner lost the lease.
+    """
+    leased_until = timezone.now() + lease_duration
+    if not queryset.filter(owner=owner).update(leased_until=leased_until):
+        return None
+    return leased_until
+
+
+def fail(
+    objs: Sequence[LeasedModel],
+    owner: str,
+    exc: Exception,
+    retry_delay: timedelta,
+    max_retry_delay: timedelta,
+) -> int:
+    """
+    Release the leased rows of the owner, to retry them after a delay.
+
+    The delay is based on the attempts of the row that failed most often. Returns the
+    number of that attempt.
+    """
+    attempts = max(obj.attempts for obj in objs) + 1
+    type(objs[0]).objects.filter(id__in=[obj.id for obj in objs], owner=owner).update(
+        owner="",
+        attempts=F("attempts") + 1,
+        last_error=str(exc),
+        leased_until=timezone.now()
+        + get_retry_delay(attempts, retry_delay, max_retry_delay),
+    )
+    return attempts
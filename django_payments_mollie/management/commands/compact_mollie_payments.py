@@ -0,0 +1,86 @@
+from datetime import timedelta
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.utils import timezone
+
+from ...compaction import (
+    ARCHIVE_FILE,
+    ARCHIVE_NONE,
+    ARCHIVE_TABLE,
+    ExtraDataCompaction,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compact the Mollie data in `extra_data` of final payments to its essential "
+        "fields, after archiving the full data. The command continues where a "
+        "previous run stopped."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--variant",
+            default="mollie",
+            help="The payment variant to compact payments of.",
+        )
+        parser.add_argument(
+            "--older-than-days",
+            type=int,
+            default=365,
+            help="Only compact payments that weren't modified for this many days.",
+        )
+        parser.add_argument(
+            "--archive",
+            choices=[ARCHIVE_TABLE, ARCHIVE_FILE, ARCHIVE_NONE],
+            default=ARCHIVE_TABLE,
+            help="Where to archive the full data: the PaymentArchive table, gzipped "
+            "files in --archive-dir, or nowhere.",
+        )
+        parser.add_argument(
+            "--archive-dir",
+            help="The directory for the archive files of --archive=file.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="The number of payments that is updated in one transaction.",
+        )
+        parser.add_argument(
+            "--throttle",
+            type=float,
+            default=0.1,
+            help="The pause in seconds between batches.",
+        )
+        parser.add_argument(
+            "--max-batches",
+            type=int,
+            help="Stop after this many batches, the next run continues from there.",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Start over from the first payment, instead of continuing.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if options["archive"] == ARCHIVE_FILE and not options["archive_dir"]:
+            raise CommandError("--archive=file requires --archive-dir")
+
+        compaction = ExtraDataCompaction(
+            options["variant"],
+            timezone.now() - timedelta(days=options["older_than_days"]),
+            batch_size=options["batch_size"],
+            throttle=options["throttle"],
+            archive=options["archive"],
+            archive_dir=options["archive_dir"],
+        )
+        if options["restart"]:
+            compaction.reset()
+        results = compaction.run(max_batches=options["max_batches"])
+        self.stdout.write(
+            f"Compacted {results['compacted']} payments, up to payment "
+            f"{results['last_payment_id']}"
+        )
@@ -0,0 +1,202 @@
+import csv
+import json
+from datetime import date
+from io import TextIOBase
+from typing import Any, Dict, Iterator, List, Optional
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from mollie.api.objects.base import ObjectBase as MollieObject
+from mollie.api.objects.settlement import Settlement as MollieSettlement
+from payments import PaymentError, get_payment_model
+from payments.core import provider_factory
+
+from ...facade import Facade
+
+EXPORT_FIELDS = [
+    "settlement_id",
+    "settlement_reference",
+    "settled_at",
+    "type",
+    "mollie_id",
+    "transaction_id",
+    "status",
+    "created_at",
+    "amount",
+    "currency",
+    "settlement_amount",
+    "settlement_currency",
+    "payment_id",
+    "payment_status",
+    "payment_total",
+    "payment_captured_amount",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Export the payments, refunds and chargebacks in Mollie settlements, "
+        "joined with the local payments."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--variant",
+            default="mollie",
+            help="The payment variant to use for Mollie API access.",
+        )
+        parser.add_argument(
+            "--tenant",
+            help="The tenant to export the settlements of, required for a variant "
+            "with OAuth2 authentication and a `tenant_resolver`.",
+        )
+        parser.add_argument(
+            "--settlement",
+            action="append",
+            dest="settlements",
+            metavar="ID",
+            help=(
+                "A settlement ID or bank reference to export, can be repeated. "
+                "Exports all settlements if omitted."
+            ),
+        )
+        parser.add_argument(
+            "--since",
+            type=date.fromisoformat,
+            help="Only export settlements created on or after this date (YYYY-MM-DD).",
+        )
+        parser.add_argument(
+            "--format",
+            choices=["csv", "jsonl"],
+            default="csv",
+        )
+        parser.add_argument(
+            "--output",
+            help="The file to write the export to, defaults to stdout.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="The number of transactions to join and write at once.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        facade = self.get_facade(options["variant"], options["tenant"])
+
+        if options["output"]:
+            with open(options["output"], "w", newline="") as stream:
+                self.export(facade, stream, **options)
+        else:
+            self.export(facade, self.stdout, **options)
+
+    @staticmethod
+    def get_facade(variant: str, tenant: Optional[str]) -> Facade:
+        """Return the Facade of the tenant, which is set up for OAuth2."""
+        provider = provider_factory(variant)
+        if provider.has_tenants and tenant is None:
+            raise CommandError(
+                f"The variant {variant!r} has a Mollie organization per tenant, "
+                "select one with --tenant."
+            )
+        try:
+            facade: Facade = provider.get_tenant_facade(tenant or "")
+        except PaymentError as exc:
+            raise CommandError(f"{exc}: {exc.gateway_message}")
+        return facade
+
+    def export(self, facade: Facade, stream: TextIOBase, **options: Any) -> None:
+        writer = self.get_writer(stream, options["format"])
+        batch: List[Dict[str, Any]] = []
+        try:
+            for settlement in self.get_settlements(facade, **options):
+                for (
+                    transaction_type,
+                    transaction,
+                ) in facade.iter_settlement_transactions(settlement):
+                    batch.append(
+                        self.get_row(settlement, transaction_type, transaction)
+                    )
+                    if len(batch) >= options["batch_size"]:
+                        self.write_batch(writer, batch)
+                        batch = []
+        except PaymentError as exc:
+            raise CommandError(f"{exc}: {exc.gateway_message}")
+
+        self.write_batch(writer, batch)
+
+    @staticmethod
+    def get_settlements(
+        facade: Facade,
+        settlements: Optional[List[str]] = None,
+        since: Optional[date] = None,
+        **options: Any,
+    ) -> Iterator[MollieSettlement]:
+        if settlements:
+            for settlement_id in settlements:
+                yield facade.retrieve_settlement(settlement_id)
+            return
+
+        for settlement in facade.iter_settlements():
+            if since and date.fromisoformat(settlement.created_at[:10]) < since:
+                # Settlements are listed newest first, we're done
+                break
+            yield settlement
+
+    @staticmethod
+    def get_row(
+        settlement: MollieSettlement, transaction_type: str, transaction: MollieObject
+    ) -> Dict[str, Any]:
+        amount = transaction.get("amount") or {}
+        settlement_amount = transaction.get("settlementAmount") or {}
+        if transaction_type == "payments":
+            transaction_id = transaction["id"]
+        else:
+            transaction_id = transaction.get("paymentId", "")
+
+        return {
+            "settlement_id": settlement.id,
+            "settlement_reference": settlement.reference,
+            "settled_at": settlement.settled_at,
+            "type": transaction_type[:-1],
+            "mollie_id": transaction["id"],
+            "transaction_id": transaction_id,
+            "status": transaction.get("status", ""),
+            "created_at": transaction.get("createdAt", ""),
+            "amount": amount.get("value", ""),
+            "currency": amount.get("currency", ""),
+            "settlement_amount": settlement_amount.get("value", ""),
+            "settlement_currency": settlement_amount.get("currency", ""),
+        }
+
+    @staticmethod
+    def join_payments(batch: List[Dict[str, Any]]) -> None:
+        """Add the local payment data to the rows, using a single query."""
+        payments = {
+            payment["transaction_id"]: payment
+            for payment in get_payment_model()
+            .objects.filter(transaction_id__in={row["transaction_id"] for row in batch})
+            .values("id", "transaction_id", "status", "total", "captured_amount")
+        }
+        for row in batch:
+            payment = payments.get(row["transaction_id"], {})
+            row["payment_id"] = payment.get("id", "")
+            row["payment_status"] = payment.get("status", "")
+            row["payment_total"] = str(payment.get("total", ""))
+            row["payment_captured_amount"] = str(payment.get("captured_amount", ""))
+
+    @staticmethod
+    def get_writer(output: TextIOBase, format: str) -> Any:
+        if format == "csv":
+            writer = csv.DictWriter(output, EXPORT_FIELDS, lineterminator="\n")
+            writer.writeheader()
+            return writer.writerows
+
+        def write_jsonl(rows: List[Dict[str, Any]]) -> None:
+            output.write("".join(f"{json.dumps(row)}\n" for row in rows))
+
+        return write_jsonl
+
+    def write_batch(self, writer: Any, batch: List[Dict[str, Any]]) -> None:
+        if batch:
+            self.join_payments(batch)
+            writer(batch)
@@ -0,0 +1,51 @@
+import time
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+from payments.core import provider_factory
+
+from ...workers import WebhookQueue
+
+
+class Command(BaseCommand):
+    help = (
+        "Process the stored webhook notifications that weren't processed by a worker, "
+        "because the process stopped or processing failed. Used with the "
+        "`webhook_workers` and `webhook_debounce` options of the provider."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--variant",
+            default="mollie",
+            help="The payment variant to process webhooks for.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="The number of webhooks that is claimed at once.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Keep processing webhooks that are left behind, checking for them "
+            "every this many seconds. By default, the command stops when all "
+            "webhooks are processed.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        provider = provider_factory(options["variant"])
+        webhook_queue = WebhookQueue(provider.update_from_mollie)
+        while True:
+            results = webhook_queue.process_pending(
+                options["variant"], batch_size=options["batch_size"]
+            )
+            self.stdout.write(
+                f"Processed {results['processed']} webhooks, "
+                f"{results['failed']} failed"
+            )
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
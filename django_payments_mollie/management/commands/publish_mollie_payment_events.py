@@ -0,0 +1,58 @@
+import time
+from datetime import timedelta
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+from payments.core import provider_factory
+
+from ...events import PaymentEventPublisher
+
+
+class Command(BaseCommand):
+    help = (
+        "Publish the recorded payment status changes to the event sinks of the "
+        "provider. Requires the `event_sinks` option of the provider."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--variant",
+            default="mollie",
+            help="The payment variant to publish events for.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="The number of events that is sent to the sinks at once.",
+        )
+        parser.add_argument(
+            "--retention-days",
+            type=int,
+            default=7,
+            help="Delete events that were delivered this many days ago.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Keep publishing new events, checking for them every this many "
+            "seconds. By default, the command stops when all events are published.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        publisher = PaymentEventPublisher(
+            provider_factory(options["variant"]),
+            options["variant"],
+            batch_size=options["batch_size"],
+        )
+        while True:
+            results = publisher.run()
+            purged = publisher.purge(timedelta(days=options["retention_days"]))
+            self.stdout.write(
+                f"Published {results['delivered']} events, "
+                f"{results['failed']} failed, deleted {purged} delivered events"
+            )
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
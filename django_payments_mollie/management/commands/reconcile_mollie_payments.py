@@ -0,0 +1,71 @@
+from datetime import timedelta
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+from payments.core import provider_factory
+
+from ...reconciliation import PartitionedReconciliation
+
+
+class Command(BaseCommand):
+    help = (
+        "Update local payments that aren't final yet from Mollie. Run this command on "
+        "several nodes or in several processes to reconcile in parallel."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--variant",
+            default="mollie",
+            help="The payment variant to reconcile.",
+        )
+        parser.add_argument(
+            "--job",
+            default="",
+            help=(
+                "The name of the reconciliation job, workers with the same job name "
+                "share the work. Use a new name for every run, like one with the "
+                "date, to start a new run. Defaults to 'reconcile-<variant>'."
+            ),
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help=(
+                "Start a new run of a completed job. Only use this when no other "
+                "workers are running the job."
+            ),
+        )
+        parser.add_argument(
+            "--worker-id",
+            default="",
+            help="A unique name for this worker, defaults to '<hostname>:<pid>'.",
+        )
+        parser.add_argument(
+            "--partition-size",
+            type=int,
+            default=1000,
+            help="The size of the payment id range in a partition.",
+        )
+        parser.add_argument(
+            "--lease-seconds",
+            type=int,
+            default=300,
+            help="The time after which partitions of a crashed worker are reclaimed.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        provider = provider_factory(options["variant"])
+        reconciliation = PartitionedReconciliation(
+            provider,
+            options["variant"],
+            job=options["job"],
+            worker_id=options["worker_id"],
+            partition_size=options["partition_size"],
+            lease_duration=timedelta(seconds=options["lease_seconds"]),
+            read_database=provider.read_database,
+        )
+        if options["restart"]:
+            reconciliation.restart()
+        processed = reconciliation.run()
+        self.stdout.write(f"Reconciled {processed} payments")
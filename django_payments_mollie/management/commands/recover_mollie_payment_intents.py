@@ -0,0 +1,50 @@
+from datetime import timedelta
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+from payments.core import provider_factory
+
+from ...intents import PaymentIntentRecovery
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the Mollie payments of checkouts that didn't get a response from "
+        "Mollie in time. Requires the `payment_intents` option of the provider."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--variant",
+            default="mollie",
+            help="The payment variant to recover intents for.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="The number of intents that is loaded from the database at once.",
+        )
+        parser.add_argument(
+            "--min-age-seconds",
+            type=int,
+            default=60,
+            help="Only recover intents that were recorded at least this long ago.",
+        )
+        parser.add_argument(
+            "--max-attempts",
+            type=int,
+            default=10,
+            help="The number of attempts after which an intent is marked as failed.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        recovery = PaymentIntentRecovery(
+            provider_factory(options["variant"]),
+            options["variant"],
+            batch_size=options["batch_size"],
+            min_age=timedelta(seconds=options["min_age_seconds"]),
+            max_attempts=options["max_attempts"],
+        )
+        recovered = recovery.run()
+        self.stdout.write(f"Recovered {recovered} payments")
@@ -0,0 +1,73 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+
+from ...replay import WebhookReplay
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay the Mollie payments saved in `extra_data` offline, and report the "
+        "throughput and the status decisions that differ from the stored statuses."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--variant",
+            default="mollie",
+            help="The payment variant to replay payments of.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="The number of payments that is loaded from the database at once.",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            help="Stop after replaying this many payments.",
+        )
+        parser.add_argument(
+            "--process-data",
+            action="store_true",
+            help="Also replay the webhook through `process_data()`, in a transaction "
+            "that is rolled back. The `status_changed` signal isn't sent.",
+        )
+        parser.add_argument(
+            "--allow-signals",
+            action="store_true",
+            help="Send the `status_changed` signal for replayed webhooks. Only use "
+            "this on a copy of the database, the effects of the signal receivers "
+            "aren't rolled back.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        replay = WebhookReplay(
+            options["variant"],
+            batch_size=options["batch_size"],
+            process_data=options["process_data"],
+            limit=options["limit"],
+            allow_signals=options["allow_signals"],
+        )
+        report = replay.run()
+
+        for stage, duration in report["durations"].items():
+            rate = report["payments"] / duration if duration else 0
+            self.stdout.write(
+                f"{stage}: replayed {report['payments']} payments in "
+                f"{duration:.2f}s ({rate:.0f} payments/s)"
+            )
+        for difference in report["differences"]:
+            self.stdout.write(
+                f"Payment {difference['payment_id']} "
+                f"({difference['transaction_id']}) {difference['stage']}: recorded "
+                f"{difference['recorded']!r}, replayed {difference['replayed']!r}"
+            )
+        for error in report["errors"]:
+            self.stdout.write(
+                f"Payment {error['payment_id']} {error['stage']}: {error['error']}"
+            )
+        self.stdout.write(
+            f"{len(report['differences'])} differences, {len(report['errors'])} errors"
+        )
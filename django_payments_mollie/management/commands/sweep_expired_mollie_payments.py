@@ -0,0 +1,59 @@
+from datetime import timedelta
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from payments.core import provider_factory
+
+from ...expiry import ExpiredPaymentSweeper
+
+
+class Command(BaseCommand):
+    help = (
+        "Reject payments of which the Mollie checkout expired, but of which the "
+        "webhook notification was missed, using the stored expiry of the checkout."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--variant",
+            default="mollie",
+            help="The payment variant to sweep expired payments for.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="The number of payments that is rejected with a single query.",
+        )
+        parser.add_argument(
+            "--grace-period-seconds",
+            type=int,
+            default=3600,
+            help="Only sweep payments of which the checkout expired this long ago.",
+        )
+        parser.add_argument(
+            "--sample-rate",
+            type=float,
+            default=0.01,
+            help="The fraction of every batch that is confirmed at Mollie.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        provider = provider_factory(options["variant"])
+        if not provider.track_checkouts:
+            raise CommandError(
+                f"The variant {options['variant']!r} doesn't store checkouts, enable "
+                "its `track_checkouts` option."
+            )
+        sweeper = ExpiredPaymentSweeper(
+            provider,
+            options["variant"],
+            batch_size=options["batch_size"],
+            grace_period=timedelta(seconds=options["grace_period_seconds"]),
+            sample_rate=options["sample_rate"],
+        )
+        results = sweeper.run()
+        self.stdout.write(
+            f"Rejected {results['rejected']} expired payments, "
+            f"updated {results['confirmed']} payments from Mollie"
+        )
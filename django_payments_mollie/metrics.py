@@ -0,0 +1,25 @@
+import threading
+
+
+class Counter:
+    """A counter that can be incremented from several threads."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__} {self.name}={self.value}>"
+
+    def increment(self, amount: int = 1) -> None:
+        with self.lock:
+            self.value += amount
+
+    def reset(self) -> None:
+        with self.lock:
+            self.value = 0
+
+
+# Updates from Mollie that were skipped, because the Mollie payment didn't change
+skipped_updates = Counter("skipped_updates")
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="ReconciliationPartition",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("job", models.CharField(max_length=255)),
+                ("start_id", models.BigIntegerField()),
+                ("end_id", models.BigIntegerField()),
+                ("owner", models.CharField(blank=True, max_length=255)),
+                ("leased_until", models.DateTimeField(blank=True, null=True)),
+                ("completed_at", models.DateTimeField(blank=True, null=True)),
+                ("processed", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["job", "completed_at", "leased_until"],
+                        name="django_paym_job_7139e5_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("job", "start_id"),
+                        name="unique_reconciliation_partition",
+                    )
+                ],
+            },
+        ),
+    ]
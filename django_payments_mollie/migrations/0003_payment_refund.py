@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_payments_mollie", "0002_payment_intent"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PaymentRefund",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("payment_id", models.BigIntegerField()),
+                ("mollie_id", models.CharField(max_length=255, unique=True)),
+                (
+                    "type",
+                    models.CharField(
+                        choices=[("refund", "Refund"), ("chargeback", "Chargeback")],
+                        max_length=10,
+                    ),
+                ),
+                ("amount", models.DecimalField(decimal_places=2, max_digits=9)),
+                ("currency", models.CharField(max_length=10)),
+                ("status", models.CharField(max_length=20)),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("modified", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["payment_id", "type"],
+                        name="django_paym_payment_567feb_idx",
+                    )
+                ],
+            },
+        ),
+    ]
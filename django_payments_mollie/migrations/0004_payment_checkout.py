@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_payments_mollie", "0003_payment_refund"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PaymentCheckout",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("payment_id", models.BigIntegerField(unique=True)),
+                ("variant", models.CharField(max_length=255)),
+                ("transaction_id", models.CharField(max_length=255)),
+                ("checkout_url", models.URLField(max_length=2048)),
+                ("expires_at", models.DateTimeField(null=True)),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("modified", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_payments_mollie", "0004_payment_checkout"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="paymentcheckout",
+            index=models.Index(
+                fields=["variant", "expires_at"], name="django_paym_variant_b9b574_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_payments_mollie", "0005_payment_checkout_expiry_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PaymentEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("payment_id", models.BigIntegerField()),
+                ("variant", models.CharField(max_length=255)),
+                ("transaction_id", models.CharField(blank=True, max_length=255)),
+                ("previous_status", models.CharField(max_length=10)),
+                ("status", models.CharField(max_length=10)),
+                ("message", models.TextField(blank=True)),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("owner", models.CharField(blank=True, max_length=255)),
+                ("leased_until", models.DateTimeField(blank=True, null=True)),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("last_error", models.TextField(blank=True)),
+                ("delivered_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["variant", "delivered_at", "id"],
+                        name="django_paym_variant_2605d5_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_payments_mollie", "0006_payment_event"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CompactionCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("job", models.CharField(max_length=255, unique=True)),
+                ("last_payment_id", models.BigIntegerField(default=0)),
+                ("compacted", models.PositiveBigIntegerField(default=0)),
+                ("modified", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="PaymentArchive",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("payment_id", models.BigIntegerField()),
+                ("variant", models.CharField(max_length=255)),
+                ("transaction_id", models.CharField(blank=True, max_length=255)),
+                ("data", models.BinaryField()),
+                ("created", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["payment_id"], name="django_paym_payment_9f2c30_idx"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_payments_mollie", "0008_webhook_task"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="reconciliationpartition",
+            name="attempts",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="reconciliationpartition",
+            name="last_error",
+            field=models.TextField(blank=True),
+        ),
+    ]
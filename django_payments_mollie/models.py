@@ -1,21 +1,96 @@
+import zlib
+from datetime import datetime, timedelta
 from decimal import Decimal
-from typing import Any, List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+from uuid import uuid4
 
 from django.core.exceptions import ValidationError
+from django.db import models
+from django.db.models import Sum
+from django.utils import timezone
 from payments.models import BasePayment
 
+MOLLIE_REQUIRED_FIELDS = ("total", "currency", "description")
+
+
+def _is_empty_mollie_value(field_name: str, value: Any) -> bool:
+    """Check if a value for a field required by Mollie is considered empty."""
+    if not value:
+        return True
+    if field_name == "total" and not isinstance(value, Decimal):
+        # The default value of the total field is the string "0.0"
+        return not Decimal(value)
+    return False
+
+
+class MolliePaymentQuerySet(models.QuerySet):  # type: ignore[type-arg]
+    """QuerySet that validates fields required by Mollie during bulk operations."""
+
+    def bulk_create(
+        self, objs: Iterable["BaseMolliePayment"], *args: Any, **kwargs: Any
+    ) -> List["BaseMolliePayment"]:
+        objs = list(objs)
+        self.model.validate_mollie_required_fields_bulk(objs)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(  # type: ignore[override]
+        self,
+        objs: Iterable["BaseMolliePayment"],
+        fields: Sequence[str],
+        *args: Any,
+        **kwargs: Any,
+    ) -> int:
+        objs = list(objs)
+        self.model.validate_mollie_required_fields_bulk(objs, fields)
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
 
 class BaseMolliePayment(BasePayment):  # type: ignore[misc]
     """Abstract base model for Django Payments, targeted at Mollie transactions."""
 
+    objects = MolliePaymentQuerySet.as_manager()
+
     class Meta:
         abstract = True
 
+    @classmethod
+    def from_db(cls, *args: Any, **kwargs: Any) -> "BaseMolliePayment":
+        instance = super().from_db(*args, **kwargs)
+        instance._store_mollie_saved_values(MOLLIE_REQUIRED_FIELDS)
+        return instance  # type: ignore[no-any-return]
+
+    def _store_mollie_saved_values(self, field_names: Iterable[str]) -> None:
+        """Remember the database values of required fields, to detect changes."""
+        saved_values: Dict[str, Any] = self.__dict__.setdefault(
+            "_mollie_saved_values", {}
+        )
+        for field_name in field_names:
+            # Deferred fields are not in the instance dict, don't load them
+            if field_name in self.__dict__:
+                saved_values[field_name] = self.__dict__[field_name]
+
+    def get_changed_mollie_required_fields(self) -> List[str]:
+        """
+        Return the fields required by Mollie that changed since they were saved.
+
+        New instances have not been saved yet, so all required fields are returned.
+        """
+        saved_values = self.__dict__.get("_mollie_saved_values")
+        if self._state.adding or saved_values is None:
+            return list(MOLLIE_REQUIRED_FIELDS)
+
+        return [
+            field_name
+            for field_name in MOLLIE_REQUIRED_FIELDS
+            if field_name not in saved_values
+            or self.__dict__.get(field_name) != saved_values[field_name]
+        ]
+
     def validate_mollie_required_fields(
         self, update_fields: Optional[List[str]] = None
     ) -> None:
         """Validate all fields that Mollie requires."""
-        required_fields = ["total", "currency", "description"]
+        required_fields: Sequence[str] = MOLLIE_REQUIRED_FIELDS
         if update_fields:
             required_fields = [
                 value for value in required_fields if value in update_fields
@@ -24,7 +99,7 @@ class BaseMolliePayment(BasePayment):  # type: ignore[misc]
         errors = {}
         for field_name in required_fields:
             value = getattr(self, field_name)
-            if not value or (field_name == "total" and not Decimal(value)):
+            if _is_empty_mollie_value(field_name, value):
                 errors[field_name] = ValidationError(
                     f"Mollie requires '{field_name}' to be set", code="required"
                 )
@@ -32,12 +107,439 @@ class BaseMolliePayment(BasePayment):  # type: ignore[misc]
         if errors:
             raise ValidationError(errors)
 
+    @classmethod
+    def validate_mollie_required_fields_bulk(
+        cls,
+        objs: Sequence["BaseMolliePayment"],
+        update_fields: Optional[Sequence[str]] = None,
+    ) -> None:
+        """
+        Validate the fields that Mollie requires for a batch of payments.
+
+        All payments are checked in one pass, and a single error is raised for each
+        invalid field, listing the positions of the offending payments.
+        """
+        required_fields: Sequence[str] = MOLLIE_REQUIRED_FIELDS
+        if update_fields is not None:
+            required_fields = [
+                value for value in required_fields if value in update_fields
+            ]
+
+        errors = {}
+        for field_name in required_fields:
+            indexes = [
+                index
+                for index, obj in enumerate(objs)
+                if _is_empty_mollie_value(field_name, getattr(obj, field_name))
+            ]
+            if indexes:
+                errors[field_name] = ValidationError(
+                    f"Mollie requires '{field_name}' to be set "
+                    f"({len(indexes)} of {len(objs)} payments)",
+                    code="required",
+                    params={"indexes": indexes},
+                )
+
+        if errors:
+            raise ValidationError(errors)
+
     def save(
         self, *args: Any, update_fields: Optional[List[str]] = None, **kwargs: Any
     ) -> None:
-        """Enforce validation of fields required by Mollie upon save."""
-        self.validate_mollie_required_fields(update_fields)
+        """
+        Enforce validation of fields required by Mollie upon save.
+
+        Only required fields that changed since the last save are validated, so
+        saves that don't touch them (like `change_status()`) skip validation.
+        """
+        changed_fields = self.get_changed_mollie_required_fields()
+        if update_fields is not None:
+            changed_fields = [
+                value for value in changed_fields if value in update_fields
+            ]
+        if changed_fields:
+            self.validate_mollie_required_fields(changed_fields)
+
         super().save(*args, update_fields=update_fields, **kwargs)
+        self._store_mollie_saved_values(changed_fields)
 
     def __str__(self) -> str:
         return f"{self.currency} {self.total} ({self.status})"
+
+
+class LeasedModel(models.Model):
+    """
+    Abstract base model for rows that workers claim through a lease.
+
+    A worker owns a row until `leased_until`, after which another worker can claim
+    it. Failed rows are released, and retried after a delay. The leases are managed
+    by the functions in `leases`.
+    """
+
+    id: int
+    owner: "models.CharField[str, str]" = models.CharField(max_length=255, blank=True)
+    leased_until: "models.DateTimeField[Optional[datetime], Optional[datetime]]" = (
+        models.DateTimeField(null=True, blank=True)
+    )
+    attempts: "models.PositiveIntegerField[int, int]" = models.PositiveIntegerField(
+        default=0
+    )
+    last_error: "models.TextField[str, str]" = models.TextField(blank=True)
+
+    class Meta:
+        abstract = True
+
+
+class ReconciliationPartition(LeasedModel):
+    """
+    A range of local payments to reconcile with Mollie, claimed by a worker.
+
+    Workers claim a partition by taking a lease on it, which they extend with regular
+    heartbeats. When a worker crashes, its lease expires and another worker can claim
+    the partition.
+    """
+
+    id: int
+    job: "models.CharField[str, str]" = models.CharField(max_length=255)
+    start_id: "models.BigIntegerField[int, int]" = models.BigIntegerField()
+    end_id: "models.BigIntegerField[int, int]" = models.BigIntegerField()
+    completed_at: "models.DateTimeField[Optional[datetime], Optional[datetime]]" = (
+        models.DateTimeField(null=True, blank=True)
+    )
+    processed: "models.PositiveIntegerField[int, int]" = models.PositiveIntegerField(
+        default=0
+    )
+
+    class Meta:
+        # Importing the abstract payment model must work without the app installed
+        app_label = "django_payments_mollie"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["job", "start_id"], name="unique_reconciliation_partition"
+            )
+        ]
+        indexes = [models.Index(fields=["job", "completed_at", "leased_until"])]
+
+    def __str__(self) -> str:
+        return f"{self.job} [{self.start_id}, {self.end_id})"
+
+
+class PaymentIntent(models.Model):
+    """
+    The intent to create a payment at Mollie, recorded before Mollie is called.
+
+    The idempotency key of the intent is sent with every request to create the
+    payment, so the request can safely be repeated: Mollie returns the payment that
+    was already created for the key. Intents that are still pending after a failed
+    or timed out request are completed later by `PaymentIntentRecovery`.
+    """
+
+    STATUS_PENDING = "pending"
+    STATUS_COMPLETED = "completed"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_COMPLETED, "Completed"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    id: int
+    payment_id: "models.BigIntegerField[int, int]" = models.BigIntegerField()
+    variant: "models.CharField[str, str]" = models.CharField(max_length=255)
+    idempotency_key: "models.CharField[str, str]" = models.CharField(max_length=64)
+    status: "models.CharField[str, str]" = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING
+    )
+    transaction_id: "models.CharField[str, str]" = models.CharField(
+        max_length=255, blank=True
+    )
+    attempts: "models.PositiveIntegerField[int, int]" = models.PositiveIntegerField(
+        default=0
+    )
+    last_error: "models.TextField[str, str]" = models.TextField(blank=True)
+    created: "models.DateTimeField[datetime, datetime]" = models.DateTimeField(
+        auto_now_add=True
+    )
+    modified: "models.DateTimeField[datetime, datetime]" = models.DateTimeField(
+        auto_now=True
+    )
+
+    class Meta:
+        app_label = "django_payments_mollie"
+        constraints = [
+            # A payment is created at Mollie only once at a time
+            models.UniqueConstraint(
+                fields=["payment_id"],
+                condition=models.Q(status="pending"),
+                name="unique_pending_payment_intent",
+            )
+        ]
+        indexes = [models.Index(fields=["status", "variant", "created"])]
+
+    def __str__(self) -> str:
+        return f"Payment {self.payment_id} ({self.status})"
+
+    @classmethod
+    def get_pending(cls, payment: BasePayment) -> "PaymentIntent":
+        """Return the pending intent for the payment, recording it if there is none."""
+        intent: "PaymentIntent"
+        intent, _ = cls.objects.get_or_create(
+            payment_id=payment.id,
+            status=cls.STATUS_PENDING,
+            defaults={"variant": payment.variant, "idempotency_key": uuid4().hex},
+        )
+        return intent
+
+
+class PaymentRefund(models.Model):
+    """A refund or chargeback of a payment at Mollie."""
+
+    TYPE_REFUND = "refund"
+    TYPE_CHARGEBACK = "chargeback"
+    TYPE_CHOICES = [
+        (TYPE_REFUND, "Refund"),
+        (TYPE_CHARGEBACK, "Chargeback"),
+    ]
+
+    # The status of chargebacks that were reversed, which Mollie doesn't provide
+    STATUS_REVERSED = "reversed"
+    # Statuses that are not part of the refunded or charged back amount at Mollie
+    UNCOUNTED_STATUSES = ["failed", "canceled", STATUS_REVERSED]
+
+    id: int
+    payment_id: "models.BigIntegerField[int, int]" = models.BigIntegerField()
+    mollie_id: "models.CharField[str, str]" = models.CharField(
+        max_length=255, unique=True
+    )
+    type: "models.CharField[str, str]" = models.CharField(
+        max_length=10, choices=TYPE_CHOICES
+    )
+    amount: "models.DecimalField[Decimal, Decimal]" = models.DecimalField(
+        max_digits=9, decimal_places=2
+    )
+    currency: "models.CharField[str, str]" = models.CharField(max_length=10)
+    status: "models.CharField[str, str]" = models.CharField(max_length=20)
+    created: "models.DateTimeField[datetime, datetime]" = models.DateTimeField(
+        auto_now_add=True
+    )
+    modified: "models.DateTimeField[datetime, datetime]" = models.DateTimeField(
+        auto_now=True
+    )
+
+    class Meta:
+        app_label = "django_payments_mollie"
+        indexes = [models.Index(fields=["payment_id", "type"])]
+
+    def __str__(self) -> str:
+        return f"{self.type} {self.mollie_id} ({self.currency} {self.amount})"
+
+    @classmethod
+    def get_totals(cls, payment_id: int) -> Dict[str, Decimal]:
+        """Return the counted amount of the refunds of a payment, per type."""
+        return cls.get_bulk_totals([payment_id]).get(payment_id, {})
+
+    @classmethod
+    def get_bulk_totals(
+        cls, payment_ids: Sequence[int]
+    ) -> Dict[int, Dict[str, Decimal]]:
+        """Return the refund totals of several payments in one query, by payment."""
+        totals = (
+            cls.objects.filter(payment_id__in=payment_ids)
+            .exclude(status__in=cls.UNCOUNTED_STATUSES)
+            .values("payment_id", "type")
+            .annotate(total=Sum("amount"))
+        )
+        bulk_totals: Dict[int, Dict[str, Decimal]] = {}
+        for total in totals:
+            bulk_totals.setdefault(total["payment_id"], {})[total["type"]] = total[
+                "total"
+            ]
+        return bulk_totals
+
+
+class PaymentCheckout(models.Model):
+    """
+    The Mollie checkout of a payment, which is reused until it expires.
+
+    When the user reloads the payment page, they are sent to the same checkout
+    without a request to Mollie.
+    """
+
+    # Leave the user some time to complete a reused checkout before it expires
+    EXPIRY_MARGIN = timedelta(minutes=1)
+
+    id: int
+    payment_id: "models.BigIntegerField[int, int]" = models.BigIntegerField(unique=True)
+    variant: "models.CharField[str, str]" = models.CharField(max_length=255)
+    transaction_id: "models.CharField[str, str]" = models.CharField(max_length=255)
+    checkout_url: "models.URLField[str, str]" = models.URLField(max_length=2048)
+    expires_at: "models.DateTimeField[Optional[datetime], Optional[datetime]]" = (
+        models.DateTimeField(null=True)
+    )
+    created: "models.DateTimeField[datetime, datetime]" = models.DateTimeField(
+        auto_now_add=True
+    )
+    modified: "models.DateTimeField[datetime, datetime]" = models.DateTimeField(
+        auto_now=True
+    )
+
+    class Meta:
+        app_label = "django_payments_mollie"
+        indexes = [models.Index(fields=["variant", "expires_at"])]
+
+    def __str__(self) -> str:
+        return f"Payment {self.payment_id} ({self.transaction_id})"
+
+    def is_valid(self) -> bool:
+        """Check if the checkout can still be used, for at least the margin."""
+        return (
+            self.expires_at is not None
+            and self.expires_at > timezone.now() + self.EXPIRY_MARGIN
+        )
+
+
+class PaymentEvent(LeasedModel):
+    """
+    A status change of a payment, waiting in the outbox to be published.
+
+    Events are recorded in the same transaction as the status change, so an event
+    exists for every committed status change, and only for those. The exception is
+    the ERROR status of a payment that Mollie refused to create, which is saved by
+    the facade and recorded right after it, so its event is lost if the process
+    stops in between. Events are delivered
+    to the event sinks of the provider by `PaymentEventPublisher`, at least once:
+    sinks receive an event again when a delivery failed or was interrupted.
+    """
+
+    id: int
+    payment_id: "models.BigIntegerField[int, int]" = models.BigIntegerField()
+    variant: "models.CharField[str, str]" = models.CharField(max_length=255)
+    transaction_id: "models.CharField[str, str]" = models.CharField(
+        max_length=255, blank=True
+    )
+    previous_status: "models.CharField[str, str]" = models.CharField(max_length=10)
+    status: "models.CharField[str, str]" = models.CharField(max_length=10)
+    message: "models.TextField[str, str]" = models.TextField(blank=True)
+    created: "models.DateTimeField[datetime, datetime]" = models.DateTimeField(
+        auto_now_add=True
+    )
+    delivered_at: "models.DateTimeField[Optional[datetime], Optional[datetime]]" = (
+        models.DateTimeField(null=True, blank=True)
+    )
+
+    class Meta:
+        app_label = "django_payments_mollie"
+        indexes = [models.Index(fields=["variant", "delivered_at", "id"])]
+
+    def __str__(self) -> str:
+        return f"Payment {self.payment_id}: {self.previous_status} -> {self.status}"
+
+    @classmethod
+    def from_payment(cls, payment: BasePayment, previous_status: str) -> "PaymentEvent":
+        """Return an unsaved event for the current status of the payment."""
+        return cls(
+            payment_id=payment.id,
+            variant=payment.variant,
+            transaction_id=payment.transaction_id or "",
+            previous_status=previous_status,
+            status=payment.status,
+            message=payment.message or "",
+        )
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return the event as published to the sinks."""
+        return {
+            "id": self.id,
+            "payment_id": self.payment_id,
+            "variant": self.variant,
+            "transaction_id": self.transaction_id,
+            "previous_status": self.previous_status,
+            "status": self.status,
+            "message": self.message,
+            "created": self.created.isoformat(),
+        }
+
+
+class PaymentArchive(models.Model):
+    """The full `extra_data` of a payment, archived before it was compacted."""
+
+    id: int
+    payment_id: "models.BigIntegerField[int, int]" = models.BigIntegerField()
+    variant: "models.CharField[str, str]" = models.CharField(max_length=255)
+    transaction_id: "models.CharField[str, str]" = models.CharField(
+        max_length=255, blank=True
+    )
+    # The zlib compressed extra_data
+    data: "models.BinaryField[bytes, bytes]" = models.BinaryField()
+    created: "models.DateTimeField[datetime, datetime]" = models.DateTimeField(
+        auto_now_add=True
+    )
+
+    class Meta:
+        app_label = "django_payments_mollie"
+        indexes = [models.Index(fields=["payment_id"])]
+
+    def __str__(self) -> str:
+        return f"Payment {self.payment_id} ({self.transaction_id})"
+
+    @classmethod
+    def from_extra_data(
+        cls, payment_id: int, variant: str, transaction_id: str, extra_data: str
+    ) -> "PaymentArchive":
+        """Return an unsaved archive of the extra_data of a payment."""
+        return cls(
+            payment_id=payment_id,
+            variant=variant,
+            transaction_id=transaction_id or "",
+            data=zlib.compress(extra_data.encode("utf-8")),
+        )
+
+    def get_extra_data(self) -> str:
+        """Return the archived extra_data."""
+        return zlib.decompress(bytes(self.data)).decode("utf-8")
+
+
+class CompactionCheckpoint(models.Model):
+    """The last payment processed by a compaction job, to resume the job from."""
+
+    id: int
+    job: "models.CharField[str, str]" = models.CharField(max_length=255, unique=True)
+    last_payment_id: "models.BigIntegerField[int, int]" = models.BigIntegerField(
+        default=0
+    )
+    compacted: "models.PositiveBigIntegerField[int, int]" = (
+        models.PositiveBigIntegerField(default=0)
+    )
+    modified: "models.DateTimeField[datetime, datetime]" = models.DateTimeField(
+        auto_now=True
+    )
+
+    class Meta:
+        app_label = "django_payments_mollie"
+
+    def __str__(self) -> str:
+        return f"{self.job} (after {self.last_payment_id})"
+
+
+class WebhookTask(LeasedModel):
+    """
+    A webhook notification for a payment, stored until it was processed.
+
+    Tasks are leased by the process that stores them. A task of which the lease
+    expired, because the process stopped or processing failed, is processed by
+    `WebhookQueue.process_pending()`.
+    """
+
+    id: int
+    payment_id: "models.BigIntegerField[int, int]" = models.BigIntegerField()
+    variant: "models.CharField[str, str]" = models.CharField(max_length=255)
+    created: "models.DateTimeField[datetime, datetime]" = models.DateTimeField(
+        auto_now_add=True
+    )
+
+    class Meta:
+        app_label = "django_payments_mollie"
+        indexes = [models.Index(fields=["variant", "leased_until", "id"])]
+
+    def __str__(self) -> str:
+        return f"Payment {self.payment_id} ({self.owner or 'released'})"
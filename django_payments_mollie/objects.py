@@ -0,0 +1,151 @@
+import json
+from typing import Any, Dict, List, Optional, Union
+
+from mollie.api.objects.payment import Payment as MolliePayment
+
+
+class SlimMolliePayment:
+    """
+    A lightweight, read-only projection of a Mollie payment.
+
+    It only holds the fields that are needed to update a local payment, and is built
+    directly from the API response, without creating a full Mollie `Payment` object.
+    When built from the response body, the original body is kept, so it can be saved
+    without serializing the payment again.
+
+    The status methods and properties have the same names as those of the Mollie
+    `Payment` object, so both can be used in `Facade.parse_payment_status()`.
+    """
+
+    __slots__ = (
+        "id",
+        "status",
+        "amount",
+        "amount_captured",
+        "amount_refunded",
+        "amount_chargedback",
+        "paid_at",
+        "expires_at",
+        "failure_reason",
+        "failure_message",
+        "links",
+        "embedded",
+        "body",
+    )
+
+    id: str
+    status: str
+    amount: Optional[Dict[str, str]]
+    amount_captured: Optional[Dict[str, str]]
+    amount_refunded: Optional[Dict[str, str]]
+    amount_chargedback: Optional[Dict[str, str]]
+    paid_at: Optional[str]
+    expires_at: Optional[str]
+    failure_reason: str
+    failure_message: str
+    links: Dict[str, Any]
+    embedded: Dict[str, List[Dict[str, Any]]]
+    body: Optional[str]
+
+    def __init__(self, data: Dict[str, Any], body: Optional[str] = None) -> None:
+        self.id = data.get("id", "")
+        self.status = data.get("status", "")
+        self.amount = data.get("amount")
+        self.amount_captured = data.get("amountCaptured")
+        self.amount_refunded = data.get("amountRefunded")
+        self.amount_chargedback = data.get("amountChargedBack")
+        self.paid_at = data.get("paidAt")
+        self.expires_at = data.get("expiresAt")
+        details = data.get("details") or {}
+        self.failure_reason = details.get("failureReason", "")
+        self.failure_message = details.get("failureMessage", "")
+        self.links = data.get("_links") or {}
+        self.embedded = data.get("_embedded") or {}
+        self.body = body
+
+    @classmethod
+    def from_response(cls, content: Union[bytes, str]) -> "SlimMolliePayment":
+        """Build the payment from the body of a Mollie API response."""
+        if isinstance(content, bytes):
+            content = content.decode("utf-8")
+        return cls(json.loads(content), body=content)
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__} {self.id} ({self.status})>"
+
+    @property
+    def details(self) -> Optional[Dict[str, str]]:
+        """The failure details of the payment, in the Mollie response format."""
+        details = {}
+        if self.failure_reason:
+            details["failureReason"] = self.failure_reason
+        if self.failure_message:
+            details["failureMessage"] = self.failure_message
+        return details or None
+
+    @property
+    def checkout_url(self) -> Optional[str]:
+        return self._get_link("checkout")
+
+    def _get_link(self, name: str) -> Optional[str]:
+        link = self.links.get(name)
+        return link["href"] if link else None
+
+    def to_json(self) -> str:
+        """
+        Return the payment as a JSON string.
+
+        This is the original response body if available, or else a JSON object with
+        the fields of the projection, using the Mollie field names.
+        """
+        if self.body is not None:
+            return self.body
+
+        data: Dict[str, Any] = {"id": self.id, "status": self.status}
+        for key, value in [
+            ("amount", self.amount),
+            ("amountCaptured", self.amount_captured),
+            ("amountRefunded", self.amount_refunded),
+            ("amountChargedBack", self.amount_chargedback),
+            ("paidAt", self.paid_at),
+            ("expiresAt", self.expires_at),
+            ("details", self.details),
+            ("_links", self.links),
+            ("_embedded", self.embedded),
+        ]:
+            if value:
+                data[key] = value
+        return json.dumps(data)
+
+    def is_open(self) -> bool:
+        return self.status == MolliePayment.STATUS_OPEN
+
+    def is_pending(self) -> bool:
+        return self.status == MolliePayment.STATUS_PENDING
+
+    def is_canceled(self) -> bool:
+        return self.status == MolliePayment.STATUS_CANCELED
+
+    def is_expired(self) -> bool:
+        return self.status == MolliePayment.STATUS_EXPIRED
+
+    def is_failed(self) -> bool:
+        return self.status == MolliePayment.STATUS_FAILED
+
+    def is_paid(self) -> bool:
+        return self.paid_at is not None
+
+
+# Both representations of a Mollie payment that the Facade can return
+AnyMolliePayment = Union[MolliePayment, SlimMolliePayment]
+
+
+def get_embedded(
+    payment: AnyMolliePayment, name: str
+) -> Optional[List[Dict[str, Any]]]:
+    """Return the data of an embedded collection, or None if it wasn't embedded."""
+    if isinstance(payment, SlimMolliePayment):
+        embedded = payment.embedded
+    else:
+        embedded = payment.get("_embedded") or {}
+    return embedded.get(name)
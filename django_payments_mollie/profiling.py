@@ -0,0 +1,127 @@
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# The most recent profiles of this process, for the debug view
+recent_profiles: Deque[Dict[str, Any]] = deque(maxlen=100)
+
+_local = threading.local()
+
+
+class Profile:
+    """
+    The timing breakdown of one provider call, like `get_form` or `process_data`.
+
+    The call is split into spans, like the request to Mollie or sending signals. For
+    the profile and each span, the number of database queries and the time spent on
+    them is recorded as well.
+    """
+
+    def __init__(self, name: str, **context: Any) -> None:
+        self.name = name
+        self.context = context
+        self.spans: List[Dict[str, Any]] = []
+        self.queries = 0
+        self.query_duration = 0.0
+        self.start = time.perf_counter()
+        self.duration = 0.0
+
+    def record_query(
+        self,
+        execute: Callable[..., Any],
+        sql: str,
+        params: Any,
+        many: bool,
+        context: Dict[str, Any],
+    ) -> Any:
+        """Execute a query and record its duration, a Django execute wrapper."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.query_duration += time.perf_counter() - start
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        queries = self.queries
+        query_duration = self.query_duration
+        try:
+            yield
+        finally:
+            self.spans.append(
+                {
+                    "name": name,
+                    "offset": _ms(start - self.start),
+                    "duration": _ms(time.perf_counter() - start),
+                    "queries": self.queries - queries,
+                    "query_duration": _ms(self.query_duration - query_duration),
+                }
+            )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            **self.context,
+            "duration": _ms(self.duration),
+            "queries": self.queries,
+            "query_duration": _ms(self.query_duration),
+            "spans": self.spans,
+        }
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 3)
+
+
+def get_current_profile() -> Optional[Profile]:
+    return getattr(_local, "profile", None)
+
+
+@contextmanager
+def profile(name: str, sample_rate: float, **context: Any) -> Iterator[None]:
+    """
+    Profile the code in the block, for a `sample_rate` fraction of the calls.
+
+    The profile is logged at the INFO level, and kept in `recent_profiles`. All
+    queries on all database connections are counted, and the block can be split in
+    spans using `span()`. Nested profiles are part of the outer profile.
+    """
+    if get_current_profile() is not None or random.random() >= sample_rate:
+        yield
+        return
+
+    current = _local.profile = Profile(name, **context)
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(current.record_query))
+            yield
+    finally:
+        _local.profile = None
+        current.duration = time.perf_counter() - current.start
+        data = current.to_dict()
+        recent_profiles.append(data)
+        logger.info("Profiled %s: %s", name, json.dumps(data))
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Record the code in the block as a span of the current profile, if any."""
+    current = get_current_profile()
+    if current is None:
+        yield
+        return
+
+    with current.span(name):
+        yield
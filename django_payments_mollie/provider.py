@@ -1,15 +1,91 @@
-from typing import Any
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from decimal import Decimal
+from typing import (
+    Any,
+    Callable,
+    ContextManager,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
+from django.db import transaction
+from django.db.models import Q
 from django.http import HttpRequest, HttpResponse, HttpResponseNotAllowed
 from django.shortcuts import redirect
-from payments import PaymentStatus, RedirectNeeded, get_payment_model
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.module_loading import import_string
+from django.utils.translation import gettext_lazy as _
+from payments import PaymentError, PaymentStatus, RedirectNeeded, get_payment_model
 from payments.core import BasicProvider
 from payments.models import BasePayment
+from payments.signals import status_changed
 
+from . import metrics, profiling
+from .debounce import WebhookDebouncer
 from .facade import Facade
+from .models import PaymentCheckout, PaymentEvent, PaymentIntent, PaymentRefund
+from .objects import AnyMolliePayment
+from .tokens import TenantTokenManager
+from .transport import Timeout
+from .workers import WebhookQueue
 
 Payment = get_payment_model()
 
+# The order in which a payment advances through its statuses. A payment can only
+# move to a status with a higher rank, which makes status updates monotonic: a late
+# or stale update never overwrites the result of a newer one. Confirmed and rejected
+# payments are final at Mollie, an error can still be resolved by a later update.
+PAYMENT_STATUS_RANKS: Dict[str, int] = {
+    PaymentStatus.WAITING: 0,
+    PaymentStatus.INPUT: 1,
+    PaymentStatus.PREAUTH: 2,
+    PaymentStatus.ERROR: 2,
+    PaymentStatus.CONFIRMED: 3,
+    PaymentStatus.REJECTED: 3,
+    PaymentStatus.REFUNDED: 4,
+}
+
+
+class MollieUpdate(NamedTuple):
+    """The update of a local payment, parsed from its Mollie payment."""
+
+    # The status that the Mollie payment moves the payment to, or "" to keep it
+    status: str
+    message: str
+    # The fields to update, like the Mollie data in extra_data
+    updates: Dict[str, Any]
+    # The fields that are only updated when the status changes
+    transition_updates: Dict[str, Any]
+    # The refunds and chargebacks that replace the local records, per type
+    refunds: Dict[str, List[PaymentRefund]]
+
+
+def atomic_if(condition: bool) -> ContextManager[Any]:
+    """Return a transaction if `condition` is True, or a no-op context manager."""
+    return transaction.atomic() if condition else nullcontext()
+
+
+def get_amount(amount: Optional[Dict[str, str]]) -> Decimal:
+    """Return the value of a Mollie amount object, or 0 if there is none."""
+    return Decimal(amount["value"]) if amount else Decimal(0)
+
+
+# Local statuses of payments for which Mollie hasn't reported the outcome yet
+PENDING_STATUSES = [PaymentStatus.WAITING, PaymentStatus.INPUT]
+
+
+def get_payment_metadata(payment: BasePayment) -> Dict[str, Any]:
+    """Return the id and variant of the local payment, as Mollie payment metadata."""
+    return {"payment_id": payment.pk, "variant": payment.variant}
+
 
 class MollieProvider(
     BasicProvider  # type: ignore[misc] # django-payments types are unavailable
@@ -19,16 +95,169 @@ class MollieProvider(
     """
 
     facade: Facade
+    facades: Dict[str, Facade]
+    token_manager: Optional[TenantTokenManager]
 
-    def __init__(self, api_key: str = "") -> None:
+    def __init__(
+        self,
+        api_key: str = "",
+        access_token: str = "",
+        testmode: bool = False,
+        client_id: str = "",
+        client_secret: str = "",
+        refresh_token_loader: str = "",
+        tenant_resolver: str = "",
+        token_cache: str = "default",
+        slim_payments: bool = False,
+        stream_lists: bool = False,
+        transport: str = "",
+        transport_options: Optional[Dict[str, Any]] = None,
+        payment_intents: bool = False,
+        create_timeout: Timeout = None,
+        pending_page: bool = False,
+        pending_poll_timeout: float = 2,
+        pending_poll_interval: float = 2,
+        pending_stream: bool = False,
+        pending_stream_duration: float = 15,
+        reuse_checkout: bool = False,
+        track_checkouts: bool = False,
+        webhook_debounce: float = 0,
+        webhook_debounce_cache: str = "default",
+        webhook_workers: int = 0,
+        track_refunds: bool = False,
+        embed_refunds: bool = False,
+        profiling_sample_rate: float = 0,
+        api_endpoint: str = "",
+        send_webhook_url: bool = False,
+        payment_metadata: str = "",
+        read_database: str = "",
+        event_sinks: Sequence[Tuple[str, Dict[str, Any]]] = (),
+    ) -> None:
         """
         Init a new provider instance.
 
         The arguments for this method are the values in the configuration dict
         in the PAYMENT_VARIANTS definition.
         """
-        self.facade = Facade()
-        self.facade.setup_with_api_key(api_key)
+        self.testmode = testmode
+        self.slim_payments = slim_payments
+        self.stream_lists = stream_lists
+        self.transport = transport
+        self.transport_options = transport_options or {}
+        self.payment_intents = payment_intents
+        self.create_timeout = create_timeout
+        self.pending_page = pending_page
+        # The time a request of the payment pending page waits for a status change,
+        # which keeps a worker busy, and the time the page waits between requests
+        self.pending_poll_timeout = pending_poll_timeout
+        self.pending_poll_interval = pending_poll_interval
+        self.pending_stream = pending_stream
+        self.pending_stream_duration = pending_stream_duration
+        self.reuse_checkout = reuse_checkout
+        # Stored checkouts are reused, and used by the expiry sweeper
+        self.track_checkouts = reuse_checkout or track_checkouts
+        self.track_refunds = track_refunds
+        # Related objects to retrieve together with the payment in update_from_mollie
+        self.embed: List[str] = (
+            ["refunds", "chargebacks"] if track_refunds and embed_refunds else []
+        )
+        self.profiling_sample_rate = profiling_sample_rate
+        self.api_endpoint = api_endpoint
+        self.send_webhook_url = send_webhook_url
+        # The database alias for read-only queries that may lag behind, like a replica
+        self.read_database = read_database
+        self.payment_metadata: Optional[Callable[[BasePayment], Dict[str, Any]]] = (
+            import_string(payment_metadata) if payment_metadata else None
+        )
+        # Status changes are recorded in the outbox, to publish them to these sinks
+        self.event_sinks = [
+            import_string(sink_class)(**sink_options)
+            for sink_class, sink_options in event_sinks
+        ]
+        self.webhook_debouncer = (
+            WebhookDebouncer(webhook_debounce, webhook_debounce_cache)
+            if webhook_debounce
+            else None
+        )
+        self.webhook_workers = webhook_workers
+        # Stores the webhooks that are processed by workers, and trailing webhooks
+        self.webhook_queue = (
+            WebhookQueue(self.update_from_mollie, shards=webhook_workers or 1)
+            if webhook_workers or webhook_debounce
+            else None
+        )
+
+        self.facade = self.create_facade()
+        if client_id:
+            # OAuth authentication, access tokens are requested per tenant
+            self.token_manager = TenantTokenManager(
+                client_id,
+                client_secret,
+                import_string(refresh_token_loader),
+                cache_alias=token_cache,
+            )
+        elif access_token:
+            self.token_manager = None
+            self.facade.setup_with_access_token(access_token, testmode)
+        else:
+            self.token_manager = None
+            self.facade.setup_with_api_key(api_key)
+
+        # Without a tenant resolver, all payments belong to the tenant ""
+        self.has_tenants = bool(tenant_resolver)
+        self.tenant_resolver: Callable[[BasePayment], str] = (
+            import_string(tenant_resolver) if tenant_resolver else lambda payment: ""
+        )
+        self.facades = {"": self.facade}
+        self.facades_lock = threading.Lock()
+
+    def create_facade(self) -> Facade:
+        """Create a new Facade, with its own Mollie client and connection pool."""
+        facade = Facade(
+            slim_payments=self.slim_payments,
+            transport=(
+                import_string(self.transport)(**self.transport_options)
+                if self.transport
+                else None
+            ),
+            stream_lists=self.stream_lists,
+        )
+        if self.api_endpoint:
+            facade.client.set_api_endpoint(self.api_endpoint)
+        return facade
+
+    def get_facade(self, payment: BasePayment) -> Facade:
+        """
+        Return the Facade to use for the payment.
+
+        With OAuth authentication, every tenant has its own Facade, which is set up
+        with a valid access token of the tenant.
+        """
+        if self.token_manager is None:
+            return self.facade
+
+        return self.get_tenant_facade(self.tenant_resolver(payment))
+
+    def get_tenant_facade(self, tenant: str = "") -> Facade:
+        """
+        Return the Facade of a tenant, for requests that don't belong to a payment.
+
+        Without OAuth authentication, there is only one Facade for all tenants.
+        """
+        if self.token_manager is None:
+            return self.facade
+
+        facade = self.facades.get(tenant)
+        if facade is None:
+            with self.facades_lock:
+                facade = self.facades.get(tenant)
+                if facade is None:
+                    facade = self.facades[tenant] = self.create_facade()
+
+        facade.setup_with_access_token(
+            self.token_manager.get_access_token(tenant), self.testmode
+        )
+        return facade
 
     @staticmethod
     def update_payment(payment_id: int, **kwargs: Any) -> None:
@@ -37,7 +266,89 @@ class MollieProvider(
 
         See https://django-payments.readthedocs.io/en/latest/payment-model.html#mutating-a-payment-instance  # noqa: E501
         """
-        Payment.objects.filter(id=payment_id).update(**kwargs)
+        Payment.objects.filter(id=payment_id).update(modified=timezone.now(), **kwargs)
+
+    @classmethod
+    def advance_payment_status(
+        cls, payment: BasePayment, status: str, message: str = "", **kwargs: Any
+    ) -> bool:
+        """
+        Change the payment status, but only if that moves the payment forward.
+
+        The status and all other fields in `kwargs` are written in one conditional
+        UPDATE query, that only matches if the stored status ranks lower than the new
+        status. Concurrent updates can't overwrite each other without locking the
+        row: only one of them advances the status, and the others are discarded.
+
+        Returns True if the payment was updated, in which case the `status_changed`
+        signal is sent, just like `payment.change_status()` would.
+        """
+        if not cls.update_payment_status(payment, status, message, **kwargs):
+            return False
+
+        cls.send_status_changed(payment)
+        return True
+
+    @staticmethod
+    def update_payment_status(
+        payment: BasePayment, status: str, message: str = "", **kwargs: Any
+    ) -> bool:
+        """
+        Like `advance_payment_status()`, without sending the `status_changed` signal.
+
+        Use this in a transaction, and call `send_status_changed()` after the commit,
+        so signal receivers don't hold the row lock of the update, and never see a
+        change that is rolled back.
+
+        A queryset update skips `auto_now`, so `modified` is set explicitly, like in
+        all updates of the payment by the provider.
+        """
+        kwargs["modified"] = timezone.now()
+        previous_statuses = [
+            previous_status
+            for previous_status, rank in PAYMENT_STATUS_RANKS.items()
+            if rank < PAYMENT_STATUS_RANKS[status]
+        ]
+        updated = (
+            type(payment)
+            ._default_manager.filter(id=payment.id, status__in=previous_statuses)
+            .update(status=status, message=message, **kwargs)
+        )
+        if not updated:
+            return False
+
+        payment.status = status
+        payment.message = message
+        for field_name, value in kwargs.items():
+            setattr(payment, field_name, value)
+        return True
+
+    @staticmethod
+    def send_status_changed(payment: BasePayment) -> None:
+        """Send the `status_changed` signal for a payment."""
+        with profiling.span("signals"):
+            status_changed.send(sender=type(payment), instance=payment)
+
+    @staticmethod
+    def update_payment_if_status(payment: BasePayment, **kwargs: Any) -> bool:
+        """
+        Update the payment, but only if its stored status is still `payment.status`.
+
+        This prevents data of a stale Mollie payment from overwriting the data that was
+        saved by a concurrent status change.
+        """
+        if not kwargs:
+            return False
+
+        kwargs["modified"] = timezone.now()
+        updated = (
+            type(payment)
+            ._default_manager.filter(id=payment.id, status=payment.status)
+            .update(**kwargs)
+        )
+        if updated:
+            payment.modified = kwargs["modified"]
+        return bool(updated)
 
     def get_form(self, payment: BasePayment, data: Any = None) -> None:
         """
@@ -51,17 +362,623 @@ class MollieProvider(
 
         For now, we don't need any details, so we'll just create the Mollie payment
         and send the user to the checkout.
+
+        With `payment_intents` enabled, the intent to create the payment is recorded
+        before Mollie is called. When Mollie doesn't respond within `create_timeout`,
+        the user can retry, or the payment is created later by the intent recovery.
+
+        With `reuse_checkout` enabled, a user that returns to the payment is sent to
+        the checkout that was created before, until it expires.
         """
-        return_url = self.get_return_url(payment)
-        mollie_payment = self.facade.create_payment(payment, return_url)
+        with profiling.profile(
+            "get_form", self.profiling_sample_rate, payment_id=payment.id
+        ):
+            facade = self.get_facade(payment)
+            if self.reuse_checkout and payment.status == PaymentStatus.INPUT:
+                checkout_url = self.get_reusable_checkout_url(payment, facade)
+                if checkout_url:
+                    raise RedirectNeeded(checkout_url)
+                self.reopen_payment(payment)
 
-        # Update the Payment
-        self.update_payment(payment.id, transaction_id=mollie_payment.id)
-        payment.change_status(PaymentStatus.INPUT)
+            with profiling.span("return_url"):
+                return_url = self.get_return_url(payment)
+
+            if self.payment_intents:
+                with profiling.span("db"):
+                    intent = PaymentIntent.get_pending(payment)
+                with profiling.span("mollie"):
+                    try:
+                        mollie_payment = facade.create_payment(
+                            payment,
+                            return_url,
+                            idempotency_key=intent.idempotency_key,
+                            timeout=self.create_timeout,
+                            **self.get_create_options(payment),
+                        )
+                    except PaymentError:
+                        self.record_create_error(payment)
+                        raise
+                with profiling.span("db"):
+                    self.complete_payment_intent(payment, intent, mollie_payment.id)
+            else:
+                with profiling.span("mollie"):
+                    try:
+                        mollie_payment = facade.create_payment(
+                            payment,
+                            return_url,
+                            timeout=self.create_timeout,
+                            **self.get_create_options(payment),
+                        )
+                    except PaymentError:
+                        self.record_create_error(payment)
+                        raise
+
+                # Update the Payment
+                with profiling.span("db"):
+                    self.start_payment(payment, mollie_payment.id)
+
+            with profiling.span("db"):
+                self.save_checkout(payment, mollie_payment)
 
         # Send the user to Mollie for further payment
         raise RedirectNeeded(mollie_payment.checkout_url)
 
+    def get_reusable_checkout_url(
+        self, payment: BasePayment, facade: Facade
+    ) -> Optional[str]:
+        """
+        Return the URL of the checkout of the payment, or None to create a new one.
+
+        A stored checkout that is still valid is used without a request to Mollie.
+        Otherwise, the payment is retrieved from Mollie: the checkout of an open
+        payment is reused, and a payment that expired, failed or was canceled is
+        replaced by a new one. Any other payment is already paid or being paid.
+        """
+        with profiling.span("db"):
+            checkout = PaymentCheckout.objects.filter(
+                payment_id=payment.id, transaction_id=payment.transaction_id
+            ).first()
+        if checkout is not None and checkout.is_valid():
+            return checkout.checkout_url
+
+        with profiling.span("mollie"):
+            mollie_payment = facade.retrieve_payment(payment)
+        if mollie_payment.is_open() and mollie_payment.checkout_url:
+            with profiling.span("db"):
+                self.save_checkout(payment, mollie_payment)
+            return mollie_payment.checkout_url
+        if (
+            mollie_payment.is_expired()
+            or mollie_payment.is_failed()
+            or mollie_payment.is_canceled()
+        ):
+            return None
+
+        raise PaymentError(_("Payment status is not WAITING"))
+
+    def save_checkout(
+        self, payment: BasePayment, mollie_payment: AnyMolliePayment
+    ) -> Optional[PaymentCheckout]:
+        """
+        Store the checkout URL and expiry of a Mollie payment, if checkouts are tracked.
+
+        Checkouts are tracked with `reuse_checkout` or `track_checkouts`, for the
+        expiry sweeper. A stored checkout that didn't change isn't written again, so
+        repeated updates of an open payment cost a single query.
+        """
+        if not self.track_checkouts or not mollie_payment.checkout_url:
+            return None
+
+        expires_at = mollie_payment.expires_at
+        values = {
+            "variant": payment.variant,
+            "transaction_id": mollie_payment.id,
+            "checkout_url": mollie_payment.checkout_url,
+            "expires_at": parse_datetime(expires_at) if expires_at else None,
+        }
+        checkout = PaymentCheckout.objects.filter(payment_id=payment.id).first()
+        if checkout is None:
+            checkout, _ = PaymentCheckout.objects.update_or_create(
+                payment_id=payment.id, defaults=values
+            )
+            return checkout
+
+        if any(getattr(checkout, name) != value for name, value in values.items()):
+            for name, value in values.items():
+                setattr(checkout, name, value)
+            checkout.save(update_fields=[*values, "modified"])
+        return checkout
+
+    def reopen_payment(self, payment: BasePayment) -> None:
+        """
+        Move a payment of which the checkout expired back to WAITING.
+
+        A new Mollie payment can then be created for it. If the payment was changed
+        concurrently, for example by a webhook, it keeps the stored status.
+        """
+        reopened = Payment.objects.filter(
+            id=payment.id,
+            status=PaymentStatus.INPUT,
+            transaction_id=payment.transaction_id,
+        ).update(status=PaymentStatus.WAITING, modified=timezone.now())
+        if reopened:
+            payment.status = PaymentStatus.WAITING
+        else:
+            payment.refresh_from_db(fields=["status"])
+
+    def get_create_options(self, payment: BasePayment) -> Dict[str, Any]:
+        """
+        Return the webhook URL and metadata to create the Mollie payment with.
+
+        The webhook URL is the process URL of the payment, the same URL the user
+        returns to, which handles both.
+        """
+        options: Dict[str, Any] = {}
+        if self.send_webhook_url:
+            options["webhook_url"] = self.get_return_url(payment)
+        if self.payment_metadata is not None:
+            options["metadata"] = self.payment_metadata(payment)
+        return options
+
+    def start_payment(self, payment: BasePayment, transaction_id: str) -> None:
+        """
+        Link a new Mollie payment to the local payment, and move it to INPUT.
+
+        The status change is recorded in the outbox in the same transaction, and the
+        `status_changed` signal is sent after it was committed.
+        """
+        previous_status = payment.status
+        with atomic_if(bool(self.event_sinks)):
+            advanced = self.update_payment_status(
+                payment, PaymentStatus.INPUT, transaction_id=transaction_id
+            )
+            if advanced:
+                self.record_status_changes([(payment, previous_status)])
+            else:
+                # A concurrent update moved the payment on, only link it
+                self.update_payment(payment.id, transaction_id=transaction_id)
+                payment.transaction_id = transaction_id
+
+        if advanced:
+            self.send_status_changed(payment)
+
+    def record_create_error(self, payment: BasePayment) -> None:
+        """
+        Record the ERROR status that the facade set when Mollie refused a payment.
+
+        The facade saves the status with `payment.change_status()`, so this status
+        change is recorded right after it was saved, instead of in its transaction.
+        """
+        if payment.status == PaymentStatus.ERROR:
+            self.record_status_changes([(payment, PaymentStatus.WAITING)])
+
+    def complete_payment_intent(
+        self, payment: BasePayment, intent: PaymentIntent, transaction_id: str
+    ) -> bool:
+        """
+        Link the payment created at Mollie to the local payment.
+
+        The intent and the payment are updated in one transaction. When an intent is
+        completed concurrently, for example by a retry of the user and the recovery,
+        only one of them updates the payment. Returns True if this call completed it.
+        """
+        advanced = False
+        with transaction.atomic():
+            completed = PaymentIntent.objects.filter(
+                id=intent.id, status=PaymentIntent.STATUS_PENDING
+            ).update(
+                status=PaymentIntent.STATUS_COMPLETED, transaction_id=transaction_id
+            )
+            if completed:
+                previous_status = payment.status
+                advanced = self.update_payment_status(
+                    payment, PaymentStatus.INPUT, transaction_id=transaction_id
+                )
+                if advanced:
+                    self.record_status_changes([(payment, previous_status)])
+
+        if advanced:
+            self.send_status_changed(payment)
+        return bool(completed)
+
+    def record_status_changes(
+        self, status_changes: Sequence[Tuple[BasePayment, str]]
+    ) -> None:
+        """
+        Record status changes in the outbox, if the provider has event sinks.
+
+        Takes the changed payments with their previous status. Call this in the
+        transaction of the status changes, so an event is only recorded for changes
+        that were committed.
+        """
+        if self.event_sinks and status_changes:
+            PaymentEvent.objects.bulk_create(
+                [
+                    PaymentEvent.from_payment(payment, previous_status)
+                    for payment, previous_status in status_changes
+                ]
+            )
+
+    def update_from_mollie(self, payment: BasePayment) -> None:
+        """
+        Retrieve the payment at Mollie and update the local payment accordingly.
+
+        Status changes are applied with `advance_payment_status()`, so this is safe to
+        call concurrently for the same payment. Afterwards, `payment.status` is the
+        stored status of the payment.
+
+        When the Mollie payment is the same as the one saved in `extra_data` by the
+        previous update, nothing is written, no signals are sent, and the skipped
+        update is counted in `metrics.skipped_updates`.
+
+        A transaction is only used when refunds or outbox events are written together
+        with the update. The `status_changed` signal is sent after it was committed.
+        """
+        facade = self.get_facade(payment)
+        with profiling.span("mollie"):
+            mollie_payment = facade.retrieve_payment(payment, embed=self.embed)
+        update = self.prepare_update(payment, facade, mollie_payment)
+        if update is None:
+            return
+
+        advanced = False
+        with profiling.span("db"):
+            self.save_open_checkout(payment, mollie_payment)
+
+            # Refunds and outbox events are written in one transaction with the update
+            with atomic_if(bool(update.refunds) or bool(self.event_sinks)):
+                if update.refunds:
+                    self.save_refunds(payment, update.refunds)
+
+                # Update the payment, without overwriting concurrent updates
+                if update.status:
+                    previous_status = payment.status
+                    advanced = self.update_payment_status(
+                        payment,
+                        update.status,
+                        update.message,
+                        **update.updates,
+                        **update.transition_updates,
+                    )
+                    if advanced:
+                        self.record_status_changes([(payment, previous_status)])
+                    else:
+                        # The payment was already moved on, continue with its status
+                        payment.refresh_from_db(fields=["status", "message"])
+                        if payment.status == update.status:
+                            # A repeated notification, only refresh the Mollie data
+                            self.update_payment_if_status(payment, **update.updates)
+
+                else:
+                    self.update_payment_if_status(payment, **update.updates)
+
+        if advanced:
+            # After the commit, so receivers don't hold the lock on the payment
+            self.send_status_changed(payment)
+
+    def prepare_update(
+        self,
+        payment: BasePayment,
+        facade: Facade,
+        mollie_payment: AnyMolliePayment,
+        refund_totals: Optional[Dict[str, Decimal]] = None,
+    ) -> Optional[MollieUpdate]:
+        """
+        Parse the Mollie payment into the update of the local payment.
+
+        Returns None when the Mollie payment is the same as the one saved in
+        `extra_data` by the previous update, which is counted in
+        `metrics.skipped_updates`. With `track_refunds`, the refunds and
+        chargebacks are detected, using the `refund_totals` of the local records if
+        they were already queried.
+        """
+        with profiling.span("serialization"):
+            status, message, updates = facade.parse_payment_status(mollie_payment)
+
+        extra_data = updates.get("extra_data")
+        if extra_data and extra_data == payment.extra_data:
+            # The previous update processed exactly the same Mollie payment
+            metrics.skipped_updates.increment()
+            return None
+
+        refunds: Dict[str, List[PaymentRefund]] = {}
+        if self.track_refunds:
+            refunds, refund_updates = self.get_refund_updates(
+                payment, facade, mollie_payment, refund_totals
+            )
+            updates.update(refund_updates)
+            if (
+                status == PaymentStatus.CONFIRMED
+                and refund_updates.get("captured_amount", 1) <= 0
+            ):
+                status = PaymentStatus.REFUNDED
+
+        transition_updates = {}
+        if status == PaymentStatus.CONFIRMED and "captured_amount" not in updates:
+            transition_updates["captured_amount"] = payment.total
+        return MollieUpdate(status, message, updates, transition_updates, refunds)
+
+    def save_open_checkout(
+        self, payment: BasePayment, mollie_payment: AnyMolliePayment
+    ) -> None:
+        """Keep the checkout of an open payment, for reuse and the expiry sweeper."""
+        if self.track_checkouts and mollie_payment.is_open():
+            self.save_checkout(payment, mollie_payment)
+
+    def get_refund_updates(
+        self,
+        payment: BasePayment,
+        facade: Facade,
+        mollie_payment: AnyMolliePayment,
+        local_totals: Optional[Dict[str, Decimal]] = None,
+    ) -> Tuple[Dict[str, List[PaymentRefund]], Dict[str, Any]]:
+        """
+        Detect new and changed refunds and chargebacks of a payment.
+
+        The refunded and charged back amounts of the Mollie payment are compared with
+        the totals of the local records, and only the refunds or chargebacks of which
+        the total changed are retrieved from Mollie.
+
+        Returns the records that replace the local records of their type, and the
+        payment updates: the captured amount, minus all refunds and chargebacks.
+        """
+        mollie_totals = {
+            PaymentRefund.TYPE_REFUND: get_amount(mollie_payment.amount_refunded),
+            PaymentRefund.TYPE_CHARGEBACK: get_amount(
+                mollie_payment.amount_chargedback
+            ),
+        }
+        iter_functions = {
+            PaymentRefund.TYPE_REFUND: facade.iter_payment_refunds,
+            PaymentRefund.TYPE_CHARGEBACK: facade.iter_payment_chargebacks,
+        }
+
+        if local_totals is None:
+            local_totals = PaymentRefund.get_totals(payment.id)
+        refunds = {}
+        for refund_type, total in mollie_totals.items():
+            if total == local_totals.get(refund_type, Decimal(0)):
+                continue
+            refunds[refund_type] = [
+                PaymentRefund(
+                    payment_id=payment.id,
+                    mollie_id=refund.id,
+                    type=refund_type,
+                    amount=get_amount(refund.amount),
+                    currency=refund.amount["currency"],
+                    status=(
+                        PaymentRefund.STATUS_REVERSED
+                        if getattr(refund, "reversed_at", None)
+                        else getattr(refund, "status", "") or refund_type
+                    ),
+                )
+                for refund in iter_functions[refund_type](mollie_payment)
+            ]
+
+        payment_updates = {}
+        if mollie_payment.is_paid() and any(mollie_totals.values()):
+            captured_amount = (
+                get_amount(mollie_payment.amount_captured)
+                if mollie_payment.amount_captured
+                else payment.total
+            )
+            payment_updates["captured_amount"] = captured_amount - sum(
+                mollie_totals.values()
+            )
+
+        return refunds, payment_updates
+
+    @classmethod
+    def save_refunds(
+        cls, payment: BasePayment, refunds: Dict[str, List[PaymentRefund]]
+    ) -> None:
+        """Replace the local refund records of the payment, per type."""
+        cls.save_bulk_refunds([(payment, refunds)])
+
+    @staticmethod
+    def save_bulk_refunds(
+        payment_refunds: Sequence[Tuple[BasePayment, Dict[str, List[PaymentRefund]]]],
+    ) -> None:
+        """Replace the local refund records of several payments in two queries."""
+        if not payment_refunds:
+            return
+
+        replaced = Q()
+        for payment, refunds in payment_refunds:
+            replaced |= Q(payment_id=payment.id, type__in=list(refunds))
+        PaymentRefund.objects.filter(replaced).delete()
+        PaymentRefund.objects.bulk_create(
+            [
+                refund
+                for _payment, refunds in payment_refunds
+                for type_refunds in refunds.values()
+                for refund in type_refunds
+            ]
+        )
+
+    def bulk_update_from_mollie(
+        self, payments: Sequence[BasePayment], max_workers: int = 8
+    ) -> Dict[str, List[BasePayment]]:
+        """
+        Retrieve a batch of payments at Mollie, and update them in few queries.
+
+        The payments are retrieved concurrently, by at most `max_workers` threads,
+        and parsed with `prepare_update()`, like `update_from_mollie()` does, so
+        refunds, checkouts and unchanged Mollie payments are handled the same way.
+
+        The updated payments are grouped by their status, their next status and the
+        fields that changed. The stored statuses of all payments are locked with one
+        query, and every group is written with one query, for the payments of which
+        the stored status is still the loaded status. Payments that were changed
+        concurrently are updated one by one with `update_payment_status()`, so they
+        only move forward. The refunds of all payments are replaced with two queries,
+        and the status changes are recorded in the same transaction. The
+        `status_changed` signal is sent after it was committed.
+
+        Returns a dict with the payments that were "changed", "unchanged", and the
+        payments that could not be retrieved ("errors").
+        """
+
+        def retrieve(payment: BasePayment) -> Tuple[Facade, AnyMolliePayment]:
+            facade = self.get_facade(payment)
+            return facade, facade.retrieve_payment(payment, embed=self.embed)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                (payment, executor.submit(retrieve, payment)) for payment in payments
+            ]
+
+        results: Dict[str, List[BasePayment]] = {
+            "changed": [],
+            "unchanged": [],
+            "errors": [],
+        }
+        retrieved: List[Tuple[BasePayment, Facade, AnyMolliePayment]] = []
+        for payment, future in futures:
+            try:
+                facade, mollie_payment = future.result()
+            except PaymentError:
+                results["errors"].append(payment)
+                continue
+            retrieved.append((payment, facade, mollie_payment))
+
+        refund_totals = (
+            PaymentRefund.get_bulk_totals([payment.id for payment, _, _ in retrieved])
+            if self.track_refunds
+            else {}
+        )
+        # The payments to update, by status, next status and the changed fields
+        groups: Dict[
+            Tuple[str, str, Tuple[str, ...]],
+            List[Tuple[BasePayment, MollieUpdate, Dict[str, Any]]],
+        ] = {}
+        for payment, facade, mollie_payment in retrieved:
+            update = self.prepare_update(
+                payment, facade, mollie_payment, refund_totals.get(payment.id, {})
+            )
+            if update is None:
+                results["unchanged"].append(payment)
+                continue
+            self.save_open_checkout(payment, mollie_payment)
+
+            if (
+                update.status
+                and PAYMENT_STATUS_RANKS[update.status]
+                > PAYMENT_STATUS_RANKS[payment.status]
+            ):
+                next_status = update.status
+                updates = {**update.updates, **update.transition_updates}
+            elif not update.status or update.status == payment.status:
+                next_status = payment.status
+                updates = update.updates
+            else:
+                # The payment was already moved on, like update_from_mollie() does
+                results["unchanged"].append(payment)
+                continue
+
+            changed = {
+                field_name: value
+                for field_name, value in updates.items()
+                if getattr(payment, field_name) != value
+            }
+            if next_status == payment.status and not changed and not update.refunds:
+                results["unchanged"].append(payment)
+                continue
+            key = (payment.status, next_status, tuple(sorted(changed)))
+            groups.setdefault(key, []).append((payment, update, changed))
+
+        status_changes: List[Tuple[BasePayment, str]] = []
+        with atomic_if(bool(groups)):
+            if groups:
+                self.apply_bulk_updates(groups, status_changes, results)
+
+        for payment, _previous_status in status_changes:
+            self.send_status_changed(payment)
+
+        return results
+
+    def apply_bulk_updates(
+        self,
+        groups: Dict[
+            Tuple[str, str, Tuple[str, ...]],
+            List[Tuple[BasePayment, MollieUpdate, Dict[str, Any]]],
+        ],
+        status_changes: List[Tuple[BasePayment, str]],
+        results: Dict[str, List[BasePayment]],
+    ) -> None:
+        """Write the updates grouped by `bulk_update_from_mollie()`."""
+        grouped = [item for group in groups.values() for item in group]
+        manager = type(grouped[0][0])._default_manager
+        stored_statuses = dict(
+            manager.select_for_update()
+            .filter(id__in=[payment.id for payment, _, _ in grouped])
+            .values_list("id", "status")
+        )
+
+        now = timezone.now()
+        payment_refunds = []
+        for (status, next_status, field_names), group in groups.items():
+            applied = []
+            for payment, update, changed in group:
+                stored_status = stored_statuses.get(payment.id)
+                if stored_status == status:
+                    for field_name, value in changed.items():
+                        setattr(payment, field_name, value)
+                    payment.modified = now
+                    if next_status != status:
+                        payment.status = next_status
+                        payment.message = update.message
+                        status_changes.append((payment, status))
+                    applied.append(payment)
+                elif stored_status is None or not self.update_changed_payment(
+                    payment, update, status_changes
+                ):
+                    results["unchanged"].append(payment)
+                    continue
+
+                results["changed"].append(payment)
+                if update.refunds:
+                    payment_refunds.append((payment, update.refunds))
+
+            if applied:
+                update_fields = [*field_names, "modified"]
+                if next_status != status:
+                    update_fields += ["status", "message"]
+                manager.bulk_update(applied, update_fields)
+
+        self.save_bulk_refunds(payment_refunds)
+        self.record_status_changes(status_changes)
+
+    def update_changed_payment(
+        self,
+        payment: BasePayment,
+        update: MollieUpdate,
+        status_changes: List[Tuple[BasePayment, str]],
+    ) -> bool:
+        """
+        Update a payment of which the stored status changed since it was loaded.
+
+        Like in `update_from_mollie()`, the status only moves forward, and the data
+        is only refreshed when the payment already has the status of the update.
+        Afterwards, the payment has its stored status. Returns True if it was updated.
+        """
+        if update.status:
+            previous_status = payment.status
+            if self.update_payment_status(
+                payment,
+                update.status,
+                update.message,
+                **update.updates,
+                **update.transition_updates,
+            ):
+                status_changes.append((payment, previous_status))
+                return True
+
+        payment.refresh_from_db()
+        if not update.status or payment.status != update.status:
+            return False
+        return self.update_payment_if_status(payment, **update.updates)
+
     def process_data(self, payment: BasePayment, request: HttpRequest) -> HttpResponse:
         """
         Handle payment changes from Mollie.
@@ -85,32 +1002,59 @@ class MollieProvider(
         if request.method not in allowed_methods:
             return HttpResponseNotAllowed(allowed_methods)
 
-        mollie_payment = self.facade.retrieve_payment(payment)
-        (
-            next_status,
-            next_status_message,
-            payment_updates,
-        ) = self.facade.parse_payment_status(mollie_payment)
-
-        # Update the payment
-        # TODO: Don't update if the status hasn't changed?
-        if next_status:  # pragma: no branch
-            payment.change_status(next_status, next_status_message)
-            if (
-                next_status == PaymentStatus.CONFIRMED
-                and "captured_amount" not in payment_updates
-            ):
-                payment_updates["captured_amount"] = payment.total
+        with profiling.profile(
+            "process_data",
+            self.profiling_sample_rate,
+            payment_id=payment.id,
+            method=request.method,
+        ):
+            return self.handle_request(payment, request)
 
-        if payment_updates:
-            self.update_payment(payment.id, **payment_updates)
+    def process_webhook(self, payment: BasePayment) -> None:
+        """Update the payment for a webhook notification, unless it is debounced."""
+        if self.webhook_debouncer and payment.transaction_id:
+            webhook_queue = self.webhook_queue
+            assert webhook_queue is not None
 
+            def schedule(delay: float, func: Callable[[], None]) -> None:
+                # The trailing call is stored, so it isn't lost when the process stops
+                webhook_queue.enqueue(payment, func, delay)
+
+            self.webhook_debouncer.debounce(
+                payment.transaction_id,
+                lambda: self.update_from_mollie(payment),
+                schedule,
+            )
+        else:
+            self.update_from_mollie(payment)
+
+    def handle_request(
+        self, payment: BasePayment, request: HttpRequest
+    ) -> HttpResponse:
+        """Update the payment from Mollie, and respond to a webhook or a user."""
         if request.method == "POST":
+            if self.webhook_workers and self.webhook_queue is not None:
+                # Notifications for one payment are processed in order by one worker
+                self.webhook_queue.enqueue(
+                    payment, lambda: self.process_webhook(payment)
+                )
+            else:
+                self.process_webhook(payment)
+
             # Return a HTTP 200 to the Mollie webhook
             return HttpResponse(b"webhook processed")
         else:
             # The request was a user getting redirected after a payment
-            if next_status in (PaymentStatus.CONFIRMED, PaymentStatus.PREAUTH):
+            self.update_from_mollie(payment)
+            if payment.status in (PaymentStatus.CONFIRMED, PaymentStatus.PREAUTH):
                 return redirect(payment.get_success_url())
+            elif self.pending_page and payment.status in PENDING_STATUSES:
+                # Wait for the webhook, instead of fetching the payment again
+                return redirect(
+                    reverse(
+                        "django_payments_mollie:payment-pending",
+                        kwargs={"token": payment.token},
+                    )
+                )
             else:
                 return redirect(payment.get_failure_url())
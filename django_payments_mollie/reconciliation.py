@@ -0,0 +1,216 @@
+import logging
+import time
+from datetime import timedelta
+from typing import Any, List, Optional
+
+from django.db import models
+from django.db.models import Max, Min
+from django.utils import timezone
+from payments import PaymentError, PaymentStatus, get_payment_model
+
+from . import leases
+from .models import ReconciliationPartition
+from .provider import MollieProvider
+from .workers import get_worker_id
+
+logger = logging.getLogger(__name__)
+
+# Local statuses of payments that can still be changed by Mollie
+RECONCILE_STATUSES = [PaymentStatus.INPUT, PaymentStatus.PREAUTH, PaymentStatus.ERROR]
+
+
+class PartitionedReconciliation:
+    """
+    Reconcile local non-final payments with Mollie, using several workers.
+
+    The payments of a variant are split into partitions by id range. Workers claim
+    partitions through leases in the database, and extend their lease with heartbeats
+    while they process the payments in it. The partitions of crashed workers are
+    reclaimed when their lease expires, so every worker can simply call `run()` until
+    all partitions of the job are completed. A completed job stays completed: a new
+    run is only started by `restart()`, or by using a new job name for every run.
+
+    Partitions are claimed with conditional UPDATE queries instead of row locks, so
+    workers on different nodes never block each other. When reconciling a partition
+    fails unexpectedly, it is released and retried after a delay that doubles with
+    every attempt.
+
+    With a `read_database`, like a read replica, the candidate payments are selected
+    in that database. They are loaded from the default database to update them.
+    """
+
+    def __init__(
+        self,
+        provider: MollieProvider,
+        variant: str,
+        job: str = "",
+        worker_id: str = "",
+        partition_size: int = 1000,
+        lease_duration: timedelta = timedelta(minutes=5),
+        read_database: str = "",
+        retry_delay: timedelta = timedelta(minutes=1),
+        max_retry_delay: timedelta = timedelta(hours=1),
+    ) -> None:
+        self.provider = provider
+        self.variant = variant
+        self.job = job or f"reconcile-{variant}"
+        self.worker_id = worker_id or get_worker_id()
+        self.partition_size = partition_size
+        self.lease_duration = lease_duration
+        # Extend the lease well before it expires
+        self.heartbeat_interval = lease_duration.total_seconds() / 3
+        self.read_database = read_database
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+
+    def get_candidates(self, using: str = "") -> "models.QuerySet[Any]":
+        """Return the local payments that should be reconciled with Mollie."""
+        candidates: "models.QuerySet[Any]" = (
+            get_payment_model()
+            .objects.using(using or None)
+            .filter(
+                variant=self.variant,
+                status__in=RECONCILE_STATUSES,
+            )
+            .exclude(transaction_id="")
+        )
+        return candidates
+
+    def create_partitions(self) -> int:
+        """
+        Split the candidate payments into partitions, if the job has none yet.
+
+        Partition boundaries are aligned to the partition size, so workers that create
+        the partitions at the same time create identical ones, which are ignored.
+        Returns the number of new partitions.
+        """
+        if ReconciliationPartition.objects.filter(job=self.job).exists():
+            return 0
+
+        id_range = self.get_candidates(self.read_database).aggregate(
+            min_id=Min("id"), max_id=Max("id")
+        )
+        if id_range["min_id"] is None:
+            return 0
+
+        first_id = id_range["min_id"] - id_range["min_id"] % self.partition_size
+        new_partitions = [
+            ReconciliationPartition(
+                job=self.job,
+                start_id=start_id,
+                end_id=start_id + self.partition_size,
+            )
+            for start_id in range(first_id, id_range["max_id"] + 1, self.partition_size)
+        ]
+        ReconciliationPartition.objects.bulk_create(
+            new_partitions, ignore_conflicts=True
+        )
+        return len(new_partitions)
+
+    def restart(self) -> int:
+        """
+        Delete the partitions of the job, so the next `run()` starts a new run.
+
+        Only restart a job while no workers are running it, because their partitions
+        are deleted as well. Returns the number of deleted partitions.
+        """
+        deleted, _ = ReconciliationPartition.objects.filter(job=self.job).delete()
+        return deleted
+
+    def claim_partition(self) -> Optional[ReconciliationPartition]:
+        """Claim the lease of an available partition, or return None if none is."""
+        partitions: List[ReconciliationPartition] = leases.claim(
+            ReconciliationPartition.objects.filter(
+                job=self.job, completed_at__isnull=True
+            ).order_by("start_id"),
+            self.worker_id,
+            self.lease_duration,
+        )
+        return partitions[0] if partitions else None
+
+    def heartbeat(self, partition: ReconciliationPartition) -> bool:
+        """Extend the lease on a partition, returns False if the lease was lost."""
+        leased_until = leases.renew(
+            ReconciliationPartition.objects.filter(
+                id=partition.id, completed_at__isnull=True
+            ),
+            self.worker_id,
+            self.lease_duration,
+        )
+        if leased_until is None:
+            return False
+        partition.leased_until = leased_until
+        return True
+
+    def complete(self, partition: ReconciliationPartition, processed: int) -> None:
+        """Mark a partition as completed, and release the lease."""
+        ReconciliationPartition.objects.filter(
+            id=partition.id, owner=self.worker_id
+        ).update(completed_at=timezone.now(), leased_until=None, processed=processed)
+
+    def reconcile_partition(self, partition: ReconciliationPartition) -> int:
+        """
+        Update all candidate payments in a partition from Mollie.
+
+        Stops early when the lease on the partition was lost. Returns the number of
+        processed payments.
+        """
+        payments = self.get_candidates().filter(
+            id__gte=partition.start_id, id__lt=partition.end_id
+        )
+        if self.read_database:
+            payment_ids = list(
+                self.get_candidates(self.read_database)
+                .filter(id__gte=partition.start_id, id__lt=partition.end_id)
+                .values_list("id", flat=True)
+            )
+            payments = payments.filter(id__in=payment_ids)
+        processed = 0
+        last_heartbeat = time.monotonic()
+        for payment in payments.order_by("id").iterator():
+            try:
+                self.provider.update_from_mollie(payment)
+            except PaymentError as exc:
+                logger.warning(
+                    "Failed to reconcile payment %s: %s",
+                    payment.id,
+                    exc.gateway_message,
+                )
+            processed += 1
+
+            if time.monotonic() - last_heartbeat >= self.heartbeat_interval:
+                if not self.heartbeat(partition):
+                    logger.warning("Lost the lease on partition %s", partition)
+                    return processed
+                last_heartbeat = time.monotonic()
+
+        self.complete(partition, processed)
+        return processed
+
+    def run(self) -> int:
+        """
+        Reconcile partitions until no partitions are available.
+
+        Returns the number of processed payments.
+        """
+        self.create_partitions()
+
+        processed = 0
+        while True:
+            partition = self.claim_partition()
+            if partition is None:
+                return processed
+
+            logger.info("Reconciling partition %s", partition)
+            try:
+                processed += self.reconcile_partition(partition)
+            except Exception as exc:
+                # Leave the partition to other workers for a while
+                leases.fail(
+                    [partition],
+                    self.worker_id,
+                    exc,
+                    self.retry_delay,
+                    self.max_retry_delay,
+                )
+                raise
@@ -0,0 +1,218 @@
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, ContextManager, Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.dispatch import Signal
+from django.http import HttpRequest
+from django.utils.module_loading import import_string
+from payments import PaymentError, PaymentStatus, get_payment_model
+from payments.signals import status_changed
+
+from .provider import PENDING_STATUSES, MollieProvider
+from .transport import RecordReplayTransport
+
+# Provider options that are turned off while replaying, because they need Mollie
+# data that isn't saved in extra_data, or would have effects outside the replay.
+# Without `client_id`, OAuth2 variants use a single Facade for all tenants, that
+# never requests access tokens, and gets its responses from the transport.
+REPLAY_PROVIDER_OPTIONS: Dict[str, Any] = {
+    "api_key": "test_replay",
+    "access_token": "",
+    "client_id": "",
+    "transport": "",
+    "transport_options": None,
+    "track_refunds": False,
+    "embed_refunds": False,
+    "webhook_debounce": 0,
+    "webhook_workers": 0,
+    "event_sinks": (),
+    "profiling_sample_rate": 0,
+}
+
+# A status decision: the status and the status message
+Decision = Tuple[str, str]
+
+
+@contextmanager
+def muted(signal: Signal) -> Iterator[None]:
+    """Disconnect all receivers of the signal, and connect them again afterwards."""
+    with signal.lock:
+        receivers = signal.receivers
+        signal.receivers = []
+        signal.sender_receivers_cache.clear()
+    try:
+        yield
+    finally:
+        with signal.lock:
+            signal.receivers = receivers
+            signal.sender_receivers_cache.clear()
+
+
+def is_same_decision(recorded: Decision, replayed: Decision) -> bool:
+    """Check if a replayed status decision matches the recorded one."""
+    recorded_status, recorded_message = recorded
+    replayed_status, replayed_message = replayed
+    if not replayed_status:
+        # The Mollie payment is still open or pending, the status isn't changed
+        return recorded_status in PENDING_STATUSES
+    if recorded_status == PaymentStatus.REFUNDED:
+        # Refunds are applied after the status is parsed, and aren't replayed
+        return bool(replayed_status == PaymentStatus.CONFIRMED)
+    return (recorded_status, recorded_message) == (replayed_status, replayed_message)
+
+
+class WebhookReplay:
+    """
+    Replay the Mollie payments saved in `extra_data` to check the status decisions.
+
+    Every saved Mollie payment is served by a `RecordReplayTransport`, instead of
+    Mollie, to a provider that is configured like the provider of the variant. The
+    payment is retrieved and parsed with `Facade.parse_payment_status()`, and the
+    status decision is compared with the stored status of the payment. With
+    `process_data`, the webhook is also replayed through `process_data()` on the
+    payment, reset to `input`, in a transaction that is rolled back afterwards.
+
+    Refunds and chargebacks aren't replayed, because they aren't saved in
+    extra_data. The receivers of the `status_changed` signal are disconnected while
+    webhooks are replayed, because their effects elsewhere aren't rolled back. With
+    `allow_signals`, they do run, so only use it on a copy of the database.
+    """
+
+    def __init__(
+        self,
+        variant: str,
+        batch_size: int = 500,
+        process_data: bool = False,
+        limit: Optional[int] = None,
+        allow_signals: bool = False,
+    ) -> None:
+        self.variant = variant
+        self.batch_size = batch_size
+        self.process_data = process_data
+        self.limit = limit
+        self.allow_signals = allow_signals
+        self.transport = RecordReplayTransport()
+        self.provider = self.create_provider()
+
+    def create_provider(self) -> MollieProvider:
+        """Create a provider like the one of the variant, that uses the transport."""
+        provider_class, options = settings.PAYMENT_VARIANTS[self.variant]
+        provider: MollieProvider = import_string(provider_class)(
+            **{**options, **REPLAY_PROVIDER_OPTIONS}
+        )
+        provider.facade.set_transport(self.transport)
+        return provider
+
+    def get_batch(self, after_id: int) -> List[Any]:
+        """Return the next batch of payments with a saved Mollie payment."""
+        return list(
+            get_payment_model()
+            .objects.filter(id__gt=after_id, variant=self.variant)
+            .exclude(extra_data="")
+            .exclude(transaction_id="")
+            .order_by("id")[: self.batch_size]
+        )
+
+    def add_responses(self, payments: List[Any]) -> None:
+        """Serve the saved Mollie payments of the batch from the transport."""
+        client = self.provider.facade.client
+        self.transport.responses.clear()
+        for payment in payments:
+            self.transport.add_response(
+                "GET",
+                f"{client.api_endpoint}/{client.api_version}/payments/"
+                f"{payment.transaction_id}",
+                payment.extra_data,
+            )
+
+    def replay_parse(self, payment: Any) -> Decision:
+        """Retrieve and parse the saved Mollie payment, returns the decision."""
+        facade = self.provider.facade
+        status, message, _ = facade.parse_payment_status(
+            facade.retrieve_payment(payment)
+        )
+        return status, message
+
+    def replay_process_data(self, payment: Any) -> Decision:
+        """Replay the webhook on the payment reset to input, returns its status."""
+        # Nothing is skipped as a repeated notification, with the extra_data cleared
+        type(payment)._default_manager.filter(id=payment.id).update(
+            status=PaymentStatus.INPUT, message="", extra_data=""
+        )
+        payment.status = PaymentStatus.INPUT
+        payment.message = ""
+        payment.extra_data = ""
+
+        request = HttpRequest()
+        request.method = "POST"
+        self.provider.process_data(payment, request)
+        return payment.status, payment.message or ""
+
+    def replay(self, payments: List[Any], stage: str, report: Dict[str, Any]) -> None:
+        """Replay a stage for a batch of payments, and add the results to the report."""
+        # Payments with the same transaction id get their responses in order
+        self.transport.replayed.clear()
+        start = time.perf_counter()
+        for payment in payments:
+            recorded = (payment.status, payment.message or "")
+            try:
+                if stage == "parse":
+                    replayed = self.replay_parse(payment)
+                else:
+                    replayed = self.replay_process_data(payment)
+            except (PaymentError, ValueError) as exc:
+                report["errors"].append(
+                    {"payment_id": payment.id, "stage": stage, "error": str(exc)}
+                )
+                continue
+            if not is_same_decision(recorded, replayed):
+                report["differences"].append(
+                    {
+                        "payment_id": payment.id,
+                        "transaction_id": payment.transaction_id,
+                        "stage": stage,
+                        "recorded": recorded,
+                        "replayed": replayed,
+                    }
+                )
+        report["durations"][stage] += time.perf_counter() - start
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Replay all saved Mollie payments of the variant, in batches.
+
+        Returns a report with the number of replayed payments, the duration of each
+        stage in seconds, the status decisions that differ from the recorded ones,
+        and the payments that couldn't be replayed.
+        """
+        stages = ["parse", "process_data"] if self.process_data else ["parse"]
+        report: Dict[str, Any] = {
+            "payments": 0,
+            "durations": {stage: 0.0 for stage in stages},
+            "differences": [],
+            "errors": [],
+        }
+        payments = self.get_batch(0)
+        while payments:
+            if self.limit is not None:
+                payments = payments[: self.limit - report["payments"]]
+            self.add_responses(payments)
+
+            self.replay(payments, "parse", report)
+            if self.process_data:
+                # Leave the payments as they were
+                signals: ContextManager[Any] = (
+                    nullcontext() if self.allow_signals else muted(status_changed)
+                )
+                with transaction.atomic(), signals:
+                    self.replay(payments, "process_data", report)
+                    transaction.set_rollback(True)
+
+            report["payments"] += len(payments)
+            if self.limit is not None and report["payments"] >= self.limit:
+                break
+            payments = self.get_batch(payments[-1].id)
+
+        return report
@@ -0,0 +1,258 @@
+import codecs
+import json
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+# Fetches a page of a list, given the URL or path and the query parameters, and
+# yields the response body in chunks
+PageFetcher = Callable[[str, Optional[Dict[str, Any]]], Iterable[bytes]]
+
+# Returned by the parser when the buffer ends before the value does
+INCOMPLETE = object()
+# Put in the queue by the producer when all pages were parsed
+DONE = object()
+
+
+class ListStreamError(Exception):
+    """A Mollie list response could not be parsed."""
+
+
+class ListStreamParser:
+    """
+    Parse a page of a Mollie list response incrementally.
+
+    The response body is fed in chunks as they arrive, and the objects in
+    `_embedded.<object_name>` are returned one at a time, as soon as they are
+    complete. Only the unparsed part of the body is kept in memory. Other values are
+    decoded and discarded, except for the URL of the next page in `_links`, which is
+    available as `next_url` when the page is parsed.
+
+    The parser relies on the response being valid JSON, and only checks its
+    structure as far as needed to find the objects.
+    """
+
+    def __init__(self, object_name: str) -> None:
+        self.object_name = object_name
+        self.next_url: Optional[str] = None
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        # The state, and the state to return to after decoding a value
+        self.state = "start"
+        self.context = ""
+        self.key = ""
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.json_decoder = json.JSONDecoder()
+
+    def feed(self, data: bytes) -> Iterator[Dict[str, Any]]:
+        """Add a chunk of the body, and yield the objects that are complete."""
+        self.trim()
+        self.buffer += self.text_decoder.decode(data)
+        yield from self.parse()
+
+    def close(self) -> Iterator[Dict[str, Any]]:
+        """Yield the remaining objects at the end of the body."""
+        self.trim()
+        self.buffer += self.text_decoder.decode(b"", final=True)
+        self.eof = True
+        yield from self.parse()
+        if self.state != "done":
+            raise ListStreamError("The Mollie list response ended unexpectedly")
+
+    def trim(self) -> None:
+        """Drop the parsed part of the buffer."""
+        pos = self.pos
+        self.buffer = self.buffer[pos:]
+        self.pos = 0
+
+    def skip(self, chars: str = " \t\r\n") -> Optional[str]:
+        """Skip the chars, and return the next char, or None if more data is needed."""
+        while self.pos < len(self.buffer):
+            char = self.buffer[self.pos]
+            if char not in chars:
+                return char
+            self.pos += 1
+        return None
+
+    def expect(self, char: str) -> bool:
+        """Skip the expected char, returns False if more data is needed."""
+        next_char = self.skip()
+        if next_char is None:
+            return False
+        if next_char != char:
+            raise ListStreamError(
+                f"Expected '{char}' in the Mollie list response, got '{next_char}'"
+            )
+        self.pos += 1
+        return True
+
+    def decode(self) -> Any:
+        """Decode the value at the current position, or return INCOMPLETE."""
+        try:
+            value, end = self.json_decoder.raw_decode(self.buffer, self.pos)
+        except json.JSONDecodeError as exc:
+            if self.eof:
+                raise ListStreamError(f"Invalid Mollie list response: {exc}")
+            return INCOMPLETE
+        if (
+            end == len(self.buffer)
+            and not self.eof
+            and isinstance(value, (int, float))
+            and not isinstance(value, bool)
+        ):
+            # The number may continue in the next chunk
+            return INCOMPLETE
+        self.pos = end
+        return value
+
+    def decode_key(self) -> Any:
+        """Decode a key of an object and the colon after it, or return INCOMPLETE."""
+        start = self.pos
+        key = self.decode()
+        if key is not INCOMPLETE and self.expect(":"):
+            return key
+        self.pos = start
+        return INCOMPLETE
+
+    def parse(self) -> Iterator[Dict[str, Any]]:
+        while self.state != "done":
+            if self.state in ("start", "embedded"):
+                if not self.expect("{"):
+                    return
+                self.state = "key" if self.state == "start" else "embedded_key"
+
+            elif self.state in ("key", "embedded_key"):
+                char = self.skip(" \t\r\n,")
+                if char is None:
+                    return
+                if char == "}":
+                    self.pos += 1
+                    self.state = "done" if self.state == "key" else "key"
+                    continue
+
+                key = self.decode_key()
+                if key is INCOMPLETE:
+                    return
+                if self.state == "key" and key == "_embedded":
+                    self.state = "embedded"
+                elif self.state == "embedded_key" and key == self.object_name:
+                    self.state = "items_start"
+                else:
+                    self.context, self.key, self.state = self.state, key, "value"
+
+            elif self.state == "value":
+                if self.skip() is None:
+                    return
+                value = self.decode()
+                if value is INCOMPLETE:
+                    return
+                if self.context == "key" and self.key == "_links":
+                    self.next_url = ((value or {}).get("next") or {}).get("href")
+                self.state = self.context
+
+            elif self.state == "items_start":
+                if not self.expect("["):
+                    return
+                self.state = "items"
+
+            elif self.state == "items":
+                char = self.skip(" \t\r\n,")
+                if char is None:
+                    return
+                if char == "]":
+                    self.pos += 1
+                    self.state = "embedded_key"
+                    continue
+
+                item = self.decode()
+                if item is INCOMPLETE:
+                    return
+                yield item
+
+
+def parse_list_page(
+    chunks: Iterable[bytes], object_name: str
+) -> Tuple[Iterator[Dict[str, Any]], ListStreamParser]:
+    """Return an iterator over the objects in a page, and its parser."""
+    parser = ListStreamParser(object_name)
+
+    def iter_items() -> Iterator[Dict[str, Any]]:
+        for chunk in chunks:
+            yield from parser.feed(chunk)
+        yield from parser.close()
+
+    return iter_items(), parser
+
+
+class _Error:
+    """An exception raised by the producer, to raise again in the consumer."""
+
+    def __init__(self, exc: BaseException) -> None:
+        self.exc = exc
+
+
+def iter_list_stream(
+    fetch: PageFetcher,
+    path: str,
+    params: Dict[str, Any],
+    object_name: str,
+    prefetch: int = 1,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Iterate over the objects in all pages of a Mollie list, as they are parsed.
+
+    The pages are fetched and parsed in a background thread, which stays at most
+    `prefetch` objects ahead of the iteration. Processing an object overlaps with
+    receiving and parsing the next ones, and the next page is requested as soon as
+    the link to it is parsed, while the last objects of the current page are still
+    processed. Only `prefetch` parsed objects and the unparsed part of a response
+    are kept in memory, whatever the size of the pages.
+    """
+    items: "queue.Queue[Any]" = queue.Queue(maxsize=prefetch)
+    stopped = threading.Event()
+
+    def put(item: Any) -> bool:
+        """Queue the item, returns False when the iteration was stopped."""
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        url: Optional[str] = path
+        page_params: Optional[Dict[str, Any]] = params
+        try:
+            while url:
+                chunks = fetch(url, page_params)
+                page_items, parser = parse_list_page(chunks, object_name)
+                try:
+                    for item in page_items:
+                        if not put(item):
+                            return
+                finally:
+                    close = getattr(chunks, "close", None)
+                    if close is not None:
+                        close()
+                # The link to the next page has all parameters
+                url, page_params = parser.next_url, None
+            put(DONE)
+        except BaseException as exc:
+            put(_Error(exc))
+
+    producer = threading.Thread(target=produce, name="mollie-list", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = items.get()
+            if item is DONE:
+                break
+            if isinstance(item, _Error):
+                raise item.exc
+            yield item
+    finally:
+        # Stop the producer when the iteration ends early
+        stopped.set()
@@ -0,0 +1,114 @@
+import logging
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+import requests
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from mollie.api.client import Client as MollieClient
+from payments import PaymentError
+
+logger = logging.getLogger(__name__)
+
+
+class TenantTokenManager:
+    """
+    Provide OAuth access tokens for Mollie organizations (tenants).
+
+    Access tokens are stored in the Django cache, so all workers share them. When a
+    token is about to expire, it is refreshed in a background thread while the current
+    token is still used, so refreshing never adds latency to a request. Only when no
+    token is available at all (the first request for a tenant), the request waits for
+    a new token.
+
+    The refresh token of a tenant is retrieved with the `get_refresh_token` callable.
+    """
+
+    CACHE_KEY_PREFIX = "django_payments_mollie:token"
+    # The maximum time a worker may take to refresh a token, before another worker
+    # is allowed to refresh it
+    REFRESH_LOCK_TIMEOUT = 60
+
+    def __init__(
+        self,
+        client_id: str,
+        client_secret: str,
+        get_refresh_token: Callable[[str], str],
+        cache_alias: str = "default",
+        refresh_margin: int = 300,
+        timeout: Union[int, Tuple[int, int]] = (2, 10),
+    ) -> None:
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.get_refresh_token = get_refresh_token
+        self.cache = caches[cache_alias]
+        self.refresh_margin = refresh_margin
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="mollie-token-refresh"
+        )
+
+    def get_cache_key(self, tenant: str) -> str:
+        return f"{self.CACHE_KEY_PREFIX}:{self.client_id}:{tenant}"
+
+    def get_access_token(self, tenant: str) -> str:
+        """Return a valid access token for the tenant."""
+        token: Optional[Dict[str, Any]] = self.cache.get(self.get_cache_key(tenant))
+        if token is None:
+            # There is no token to use while refreshing, so we have to wait for it
+            token = self.refresh(tenant)
+        elif token["expires_at"] - time.time() < self.refresh_margin:
+            self.schedule_refresh(tenant)
+
+        return str(token["access_token"])
+
+    def schedule_refresh(self, tenant: str) -> Optional["Future[Dict[str, Any]]"]:
+        """
+        Refresh the access token of the tenant in a background thread.
+
+        Only one worker refreshes the token of a tenant at a time, using a lock in the
+        cache. Returns None if another worker is already refreshing.
+        """
+        lock_key = f"{self.get_cache_key(tenant)}:refresh"
+        if not self.cache.add(lock_key, True, timeout=self.REFRESH_LOCK_TIMEOUT):
+            return None
+
+        def refresh_and_unlock() -> Dict[str, Any]:
+            try:
+                return self.refresh(tenant)
+            except PaymentError:
+                logger.exception("Failed to refresh Mollie access token of %s", tenant)
+                raise
+            finally:
+                self.cache.delete(lock_key)
+
+        return self.executor.submit(refresh_and_unlock)
+
+    def refresh(self, tenant: str) -> Dict[str, Any]:
+        """Request a new access token at Mollie, and store it in the cache."""
+        try:
+            resp = requests.post(
+                MollieClient.OAUTH_TOKEN_URL,
+                data={
+                    "grant_type": "refresh_token",
+                    "refresh_token": self.get_refresh_token(tenant),
+                },
+                auth=(self.client_id, self.client_secret),
+                timeout=self.timeout,
+            )
+            resp.raise_for_status()
+            result = resp.json()
+        except (requests.exceptions.RequestException, ValueError) as exc:
+            raise PaymentError(
+                _("Failed to refresh Mollie access token"),
+                gateway_message=exc,
+            )
+
+        expires_in = int(result["expires_in"])
+        token = {
+            "access_token": result["access_token"],
+            "expires_at": time.time() + expires_in,
+        }
+        self.cache.set(self.get_cache_key(tenant), token, timeout=expires_in)
+        return token
@@ -0,0 +1,283 @@
+import json
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, DefaultDict, Dict, List, Optional, Tuple, Union
+
+import requests
+from django.core.exceptions import ImproperlyConfigured
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util import Retry
+
+Timeout = Union[None, int, float, Tuple[float, float]]
+
+
+class BaseTransport(ABC):
+    """
+    Base class for transports that perform HTTP requests to the Mollie API.
+
+    The Mollie client performs all API requests by calling `request()` on a
+    `requests.Session`. A transport replaces that session, so it needs a compatible
+    `request()` method, that returns a response with the same interface as a
+    `requests` response (`status_code`, `headers`, `content`, `text`, `encoding` and
+    `json()`). All Facade logic works the same on every transport.
+    """
+
+    @abstractmethod
+    def request(
+        self,
+        method: str,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        params: Optional[Dict[str, Any]] = None,
+        data: Optional[str] = None,
+        timeout: Timeout = None,
+    ) -> Any:
+        """Perform a request, and return a response like a `requests` response."""
+
+    def close(self) -> None:
+        pass
+
+
+class RequestsTransport(requests.Session):
+    """
+    A `requests` session with a tuned connection pool.
+
+    The Mollie client creates a session with a default pool of 10 connections, which
+    limits the number of concurrent requests from a threaded server.
+    """
+
+    def __init__(
+        self, pool_connections: int = 10, pool_maxsize: int = 10, retry: int = 3
+    ) -> None:
+        super().__init__()
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=Retry(connect=retry, read=0, backoff_factor=1),
+        )
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+
+class HTTPXTransport(BaseTransport):
+    """
+    A transport using `httpx`, which supports multiplexing requests over HTTP/2.
+
+    Requires the `httpx` package, install it using the `http2` extra:
+    `pip install django-payments-mollie[http2]`.
+    """
+
+    def __init__(
+        self,
+        http2: bool = True,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+    ) -> None:
+        try:
+            import httpx
+        except ImportError:  # pragma: no cover
+            raise ImproperlyConfigured(
+                "HTTPXTransport requires the httpx package, install it using "
+                "`pip install django-payments-mollie[http2]`"
+            )
+
+        self.httpx = httpx
+        self.client = httpx.Client(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+            ),
+        )
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        params: Optional[Dict[str, Any]] = None,
+        data: Optional[str] = None,
+        timeout: Timeout = None,
+    ) -> Any:
+        httpx_timeout: Any = timeout
+        if isinstance(timeout, tuple):
+            connect_timeout, read_timeout = timeout
+            httpx_timeout = self.httpx.Timeout(read_timeout, connect=connect_timeout)
+
+        try:
+            return self.client.request(
+                method,
+                url,
+                headers=headers,
+                params=params,
+                content=data or None,
+                timeout=httpx_timeout,
+            )
+        except self.httpx.HTTPError as exc:
+            # The Mollie client only handles errors raised by requests
+            raise requests.exceptions.ConnectionError(str(exc)) from exc
+
+    def close(self) -> None:
+        self.client.close()
+
+
+class RecordedResponse:
+    """A response that was recorded by the `RecordReplayTransport`."""
+
+    def __init__(
+        self,
+        status_code: int = 200,
+        body: str = "",
+        headers: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self.status_code = status_code
+        self.text = body
+        self.headers = CaseInsensitiveDict(
+            headers or {"Content-Type": "application/hal+json"}
+        )
+        self.encoding = "utf-8"
+
+    @property
+    def content(self) -> bytes:
+        return self.text.encode(self.encoding)
+
+    def json(self) -> Any:
+        return json.loads(self.text)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "status_code": self.status_code,
+            "headers": dict(self.headers),
+            "body": self.text,
+        }
+
+
+class RecordReplayTransport(BaseTransport):
+    """
+    A transport that records responses from Mollie, or replays recorded responses.
+
+    In `record` mode, requests are performed by the `inner` transport, and the
+    responses are saved in the cassette file. In `replay` mode, no requests are made
+    at all: responses are looked up by request method and URL in the cassette.
+    Repeated requests for the same method and URL get the recorded responses in order,
+    and the last one is repeated when no more responses are available.
+
+    Responses can also be added in code using `add_response()`, for example to build
+    deterministic tests and benchmarks.
+    """
+
+    def __init__(
+        self,
+        cassette: Union[str, Path, None] = None,
+        mode: str = "replay",
+        inner: Optional["Transport"] = None,
+    ) -> None:
+        if mode not in ("record", "replay"):
+            raise ImproperlyConfigured(f"Unknown RecordReplayTransport mode '{mode}'")
+
+        self.cassette = Path(cassette) if cassette else None
+        self.mode = mode
+        self.inner = inner
+        if self.mode == "record" and self.inner is None:
+            self.inner = RequestsTransport()
+
+        self.responses: DefaultDict[Tuple[str, str], List[RecordedResponse]] = (
+            defaultdict(list)
+        )
+        self.replayed: DefaultDict[Tuple[str, str], int] = defaultdict(int)
+        self.lock = threading.Lock()
+
+        if self.mode == "replay" and self.cassette and self.cassette.exists():
+            for interaction in json.loads(self.cassette.read_text()):
+                self.add_response(
+                    interaction["method"],
+                    interaction["url"],
+                    **interaction["response"],
+                )
+
+    @staticmethod
+    def get_request_url(url: str, params: Optional[Dict[str, Any]] = None) -> str:
+        return requests.Request("GET", url, params=params).prepare().url or url
+
+    def add_response(
+        self,
+        method: str,
+        url: str,
+        body: Union[str, Dict[str, Any]] = "",
+        status_code: int = 200,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> None:
+        """Add a response for a request, after all responses already added for it."""
+        if not isinstance(body, str):
+            body = json.dumps(body)
+        response = RecordedResponse(status_code, body, headers)
+        with self.lock:
+            self.responses[(method.upper(), self.get_request_url(url))].append(response)
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        params: Optional[Dict[str, Any]] = None,
+        data: Optional[str] = None,
+        timeout: Timeout = None,
+    ) -> Any:
+        key = (method.upper(), self.get_request_url(url, params))
+        if self.mode == "record":
+            return self.record(key, headers, data, timeout)
+
+        with self.lock:
+            responses = self.responses.get(key)
+            if not responses:
+                raise requests.exceptions.ConnectionError(
+                    f"No recorded response for {key[0]} {key[1]}"
+                )
+            index = min(self.replayed[key], len(responses) - 1)
+            self.replayed[key] += 1
+        return responses[index]
+
+    def record(
+        self,
+        key: Tuple[str, str],
+        headers: Optional[Dict[str, str]],
+        data: Optional[str],
+        timeout: Timeout,
+    ) -> Any:
+        """Perform the request using the inner transport, and save the response."""
+        assert self.inner is not None
+        response = self.inner.request(
+            key[0], key[1], headers=headers, data=data, timeout=timeout
+        )
+        recorded = RecordedResponse(
+            response.status_code,
+            response.text,
+            {"Content-Type": response.headers.get("Content-Type", "")},
+        )
+        with self.lock:
+            self.responses[key].append(recorded)
+            self.save()
+        return recorded
+
+    def save(self) -> None:
+        """Write all responses to the cassette file."""
+        if not self.cassette:
+            return
+
+        interactions = [
+            {"method": method, "url": url, "response": response.to_dict()}
+            for (method, url), responses in self.responses.items()
+            for response in responses
+        ]
+        self.cassette.write_text(json.dumps(interactions, indent=2))
+
+    def close(self) -> None:
+        if self.inner is not None:
+            self.inner.close()
+
+
+# All types of transports that can be installed in the Facade
+Transport = Union[BaseTransport, requests.Session]
@@ -0,0 +1,29 @@
+from django.urls import path
+
+from . import views
+
+app_name = "django_payments_mollie"
+
+urlpatterns = [
+    path(
+        "pending/<str:token>/",
+        views.PaymentPendingView.as_view(),
+        name="payment-pending",
+    ),
+    path(
+        "pending/<str:token>/status/",
+        views.PaymentStatusView.as_view(),
+        name="payment-status",
+    ),
+    path(
+        "pending/<str:token>/events/",
+        views.PaymentStatusStreamView.as_view(),
+        name="payment-status-stream",
+    ),
+    path("profiles/", views.ProfilesView.as_view(), name="profiles"),
+    path(
+        "webhook-workers/",
+        views.WebhookWorkersView.as_view(),
+        name="webhook-workers",
+    ),
+]
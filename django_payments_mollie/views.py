@@ -0,0 +1,222 @@
+import json
+import math
+import time
+from typing import Any, Dict, Iterator, Optional
+
+from django.conf import settings
+from django.contrib.auth.mixins import UserPassesTestMixin
+from django.http import HttpRequest, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.http.response import HttpResponseBase
+from django.shortcuts import get_object_or_404, redirect
+from django.views.generic import TemplateView, View
+from payments import PaymentStatus, get_payment_model
+from payments.core import provider_factory
+from payments.models import BasePayment
+
+from .profiling import recent_profiles
+from .provider import PENDING_STATUSES
+
+
+class PaymentStatusMixin:
+    """
+    Wait for status changes of a payment in the local database.
+
+    The status is updated by the Mollie webhook, these views never call Mollie. The
+    payment is looked up by its token, which is part of the URLs of django-payments
+    already, and can't be guessed.
+
+    The payment is loaded from the default database, because the user arrives right
+    after it was updated. The status is then polled in the `read_database` of the
+    provider, if it has one.
+    """
+
+    # The time between two status checks in the database
+    poll_interval = 1.0
+
+    def get_payment(self, token: str) -> BasePayment:
+        return get_object_or_404(get_payment_model(), token=token)
+
+    def get_provider_option(self, payment: BasePayment, name: str, default: Any) -> Any:
+        """Return an option of the provider of the payment, or the default."""
+        try:
+            provider = provider_factory(payment.variant)
+        except ValueError:
+            # An unknown variant
+            return default
+        return getattr(provider, name, default)
+
+    def get_read_database(self, payment: BasePayment) -> Optional[str]:
+        return self.get_provider_option(payment, "read_database", "") or None
+
+    def get_status(self, payment: BasePayment) -> str:
+        status: str = (
+            type(payment)
+            ._default_manager.using(self.get_read_database(payment))
+            .filter(id=payment.id)
+            .values_list("status", flat=True)
+            .get()
+        )
+        return status
+
+    def get_redirect_url(self, payment: BasePayment) -> Optional[str]:
+        """Return the URL to send the user to, or None while the payment is pending."""
+        if payment.status in PENDING_STATUSES:
+            return None
+        if payment.status in (PaymentStatus.CONFIRMED, PaymentStatus.PREAUTH):
+            return str(payment.get_success_url())
+        return str(payment.get_failure_url())
+
+    def get_status_data(self, payment: BasePayment) -> Dict[str, Any]:
+        return {
+            "status": payment.status,
+            "redirect_url": self.get_redirect_url(payment),
+        }
+
+    def wait_for_status_change(
+        self, payment: BasePayment, status: str, timeout: float
+    ) -> bool:
+        """
+        Wait until the stored status of the payment is no longer `status`.
+
+        Returns True if the status changed within the timeout, in which case
+        `payment.status` is the new status.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            current_status = self.get_status(payment)
+            if current_status != status:
+                payment.status = current_status
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(self.poll_interval, remaining))
+
+
+class PaymentPendingView(PaymentStatusMixin, TemplateView):
+    """
+    Page for users that returned from Mollie before the payment was completed.
+
+    The page polls the status every `pending_poll_interval` seconds of the provider,
+    or reloads itself without JavaScript, and redirects the user to the success or
+    failure URL. With `pending_stream`, it waits for the outcome using Server-Sent
+    Events instead. Reloading the page doesn't call Mollie.
+    """
+
+    template_name = "django_payments_mollie/pending.html"
+
+    # The interval for payments of which the provider has no `pending_poll_interval`
+    refresh_interval = 2.0
+
+    def get(self, request: HttpRequest, *args: Any, **kwargs: Any) -> HttpResponse:
+        payment = self.get_payment(kwargs["token"])
+        redirect_url = self.get_redirect_url(payment)
+        if redirect_url:
+            return redirect(redirect_url)
+
+        refresh_interval = self.get_provider_option(
+            payment, "pending_poll_interval", self.refresh_interval
+        )
+        context = self.get_context_data(
+            payment=payment,
+            # In milliseconds for the script, and whole seconds for a meta refresh
+            poll_interval=int(refresh_interval * 1000),
+            refresh_interval=max(math.ceil(refresh_interval), 1),
+            stream=self.get_provider_option(payment, "pending_stream", False),
+            **kwargs,
+        )
+        return self.render_to_response(context)
+
+
+class PaymentStatusView(PaymentStatusMixin, View):
+    """
+    Long-poll for a status change of a payment.
+
+    The request waits until the status differs from the `status` query parameter,
+    or until the `pending_poll_timeout` of the provider. The response always
+    contains the current status.
+    """
+
+    # The timeout for payments of which the provider has no `pending_poll_timeout`
+    timeout = 2.0
+
+    def get(self, request: HttpRequest, *args: Any, **kwargs: Any) -> HttpResponse:
+        payment = self.get_payment(kwargs["token"])
+        status = request.GET.get("status", payment.status)
+        if payment.status == status:
+            timeout = self.get_provider_option(
+                payment, "pending_poll_timeout", self.timeout
+            )
+            self.wait_for_status_change(payment, status, timeout)
+        return JsonResponse(self.get_status_data(payment))
+
+
+class PaymentStatusStreamView(PaymentStatusMixin, View):
+    """
+    Stream the status changes of a payment as Server-Sent Events.
+
+    The stream ends when the payment is no longer pending, or after the
+    `pending_stream_duration` of the provider, after which the browser reconnects by
+    itself. Keep the duration below the timeouts of the server and proxies. The
+    stream keeps a worker thread busy for its whole duration, so the pending page
+    only uses it with `pending_stream`.
+    """
+
+    # The duration for payments of which the provider has no `pending_stream_duration`
+    duration = 15.0
+
+    def get(self, request: HttpRequest, *args: Any, **kwargs: Any) -> HttpResponseBase:
+        payment = self.get_payment(kwargs["token"])
+        response = StreamingHttpResponse(
+            self.stream(payment), content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        # Disable response buffering in nginx
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    def stream(self, payment: BasePayment) -> Iterator[str]:
+        duration = self.get_provider_option(
+            payment, "pending_stream_duration", self.duration
+        )
+        deadline = time.monotonic() + duration
+        yield self.get_event(payment)
+        while payment.status in PENDING_STATUSES:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if self.wait_for_status_change(payment, payment.status, remaining):
+                yield self.get_event(payment)
+
+    def get_event(self, payment: BasePayment) -> str:
+        return f"data: {json.dumps(self.get_status_data(payment))}\n\n"
+
+
+class ProfilesView(UserPassesTestMixin, View):
+    """Show the recent profiles of this process as JSON, for staff users only."""
+
+    def test_func(self) -> bool:
+        return bool(getattr(self.request.user, "is_staff", False))
+
+    def get(self, request: HttpRequest, *args: Any, **kwargs: Any) -> HttpResponse:
+        return JsonResponse({"profiles": list(recent_profiles)})
+
+
+class WebhookWorkersView(UserPassesTestMixin, View):
+    """
+    Show the stats of the webhook worker pools of this process as JSON.
+
+    For every variant with `webhook_workers`, the queue depth, lag and number of
+    processed webhooks of each shard is shown. For staff users only.
+    """
+
+    def test_func(self) -> bool:
+        return bool(getattr(self.request.user, "is_staff", False))
+
+    def get(self, request: HttpRequest, *args: Any, **kwargs: Any) -> HttpResponse:
+        pools = {}
+        for variant in settings.PAYMENT_VARIANTS:
+            webhook_queue = getattr(provider_factory(variant), "webhook_queue", None)
+            if webhook_queue is not None:
+                pools[variant] = webhook_queue.pool.get_stats()
+        return JsonResponse({"pools": pools})
@@ -0,0 +1,273 @@
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+import zlib
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from payments import PaymentError, get_payment_model
+from payments.models import BasePayment
+
+from . import leases
+from .debounce import schedule_in_thread
+from .models import WebhookTask
+
+logger = logging.getLogger(__name__)
+
+Task = Tuple[float, Callable[[], None]]
+
+
+def get_worker_id() -> str:
+    """Return an identifier for this worker process, unique over all nodes."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class ShardedWorkerPool:
+    """
+    Process tasks in parallel, while the tasks for one key are processed in order.
+
+    Every key, like the transaction id of a payment, is assigned to one of the
+    `shards` by a stable hash. Each shard has its own queue and worker thread, so
+    the tasks for a key are processed one at a time, in the order they were
+    submitted, while tasks for different keys are processed in parallel.
+
+    The queue depth and lag of each shard are available from `get_stats()`. The
+    queues are kept in memory: tasks that were not processed yet are lost when the
+    process stops, use a `WebhookQueue` to store them durably.
+    """
+
+    def __init__(self, shards: int = 4, name: str = "mollie-worker") -> None:
+        self.name = name
+        self.queues: List["queue.Queue[Optional[Task]]"] = [
+            queue.Queue() for _ in range(shards)
+        ]
+        self.processed = [0] * shards
+        self.threads: List[threading.Thread] = []
+        self.lock = threading.Lock()
+
+    def get_shard(self, key: str) -> int:
+        """Return the shard of a key, which is the same in every process."""
+        return zlib.crc32(key.encode()) % len(self.queues)
+
+    def start(self) -> None:
+        """Start the worker threads, if they aren't running yet."""
+        with self.lock:
+            if self.threads:
+                return
+            for shard in range(len(self.queues)):
+                thread = threading.Thread(
+                    target=self.run, args=(shard,), name=f"{self.name}-{shard}"
+                )
+                # Don't keep the process alive for unprocessed tasks
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+
+    def submit(self, key: str, func: Callable[[], None]) -> int:
+        """Queue `func` in the shard of the key, returns the shard."""
+        self.start()
+        shard = self.get_shard(key)
+        self.queues[shard].put((time.monotonic(), func))
+        return shard
+
+    def run(self, shard: int) -> None:
+        """Process the tasks of a shard, until `shutdown()` is called."""
+        tasks = self.queues[shard]
+        while True:
+            task = tasks.get()
+            if task is None:
+                tasks.task_done()
+                return
+
+            _, func = task
+            # Like a request, use a database connection that is still usable
+            close_old_connections()
+            try:
+                func()
+            except Exception:
+                logger.exception("Task in shard %s of %s failed", shard, self.name)
+            finally:
+                close_old_connections()
+                self.processed[shard] += 1
+                tasks.task_done()
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        """
+        Return the queue depth, lag and number of processed tasks of every shard.
+
+        The lag is the time in seconds that the oldest queued task of the shard has
+        been waiting.
+        """
+        now = time.monotonic()
+        stats = []
+        for shard, tasks in enumerate(self.queues):
+            with tasks.mutex:
+                waiting = [task for task in tasks.queue if task is not None]
+            stats.append(
+                {
+                    "shard": shard,
+                    "queue_depth": len(waiting),
+                    "lag": now - waiting[0][0] if waiting else 0.0,
+                    "processed": self.processed[shard],
+                }
+            )
+        return stats
+
+    def join(self) -> None:
+        """Wait until all submitted tasks are processed."""
+        for tasks in self.queues:
+            tasks.join()
+
+    def shutdown(self) -> None:
+        """Process the queued tasks, and stop the worker threads."""
+        with self.lock:
+            if not self.threads:
+                return
+            for tasks in self.queues:
+                tasks.put(None)
+            for thread in self.threads:
+                thread.join()
+            self.threads = []
+
+
+class WebhookQueue:
+    """
+    A durable queue of webhook notifications, processed by a `ShardedWorkerPool`.
+
+    Every notification is stored as a `WebhookTask` before Mollie gets a response,
+    leased by this process, and queued in the shard of its payment. The task is
+    deleted when a worker processed it. When the process stops before that, or
+    processing fails, the task stays stored. Its lease expires, or it is retried
+    after a delay that doubles with every attempt, and it is then processed by
+    `process_pending()`, like the `process_mollie_webhooks` command does.
+
+    Tasks can be delayed, like the trailing call of a debounced notification. The
+    delay is waited for in a timer thread, so it doesn't hold up the shard.
+
+    A task is only queued when the transaction that stored it was committed, like
+    with `ATOMIC_REQUESTS`, because the worker uses its own database connection.
+    """
+
+    def __init__(
+        self,
+        process: Callable[[BasePayment], None],
+        shards: int = 4,
+        lease_duration: timedelta = timedelta(minutes=5),
+        retry_delay: timedelta = timedelta(minutes=1),
+        max_retry_delay: timedelta = timedelta(hours=1),
+    ) -> None:
+        # Processes the notification of a payment that was left behind
+        self.process = process
+        self.pool = ShardedWorkerPool(shards, name="mollie-webhooks")
+        self.owner = f"{get_worker_id()}:{uuid4().hex}"
+        # Longer than the lag of the queues, or tasks are processed twice
+        self.lease_duration = lease_duration
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+
+    def enqueue(
+        self, payment: BasePayment, func: Callable[[], None], delay: float = 0
+    ) -> WebhookTask:
+        """Store a task for the payment, and run `func` for it after `delay` seconds."""
+        task: WebhookTask = WebhookTask.objects.create(
+            payment_id=payment.id,
+            variant=payment.variant,
+            owner=self.owner,
+            leased_until=timezone.now()
+            + timedelta(seconds=delay)
+            + self.lease_duration,
+        )
+        key = payment.transaction_id or payment.token
+
+        def queue_task() -> None:
+            if delay:
+                schedule_in_thread(delay, lambda: self.submit(key, task, func))
+            else:
+                self.submit(key, task, func)
+
+        # The worker can't see the task before it was committed
+        transaction.on_commit(queue_task)
+        return task
+
+    def submit(self, key: str, task: WebhookTask, func: Callable[[], None]) -> None:
+        """Queue the task in the shard of the key."""
+
+        def run() -> None:
+            self.run_task(task, func)
+
+        self.pool.submit(key, run)
+
+    def run_task(self, task: WebhookTask, func: Callable[[], None]) -> bool:
+        """Run a task of this process, returns False if it was taken over."""
+        # The task is processed by `process_pending()` when its lease expired
+        if not leases.renew(
+            WebhookTask.objects.filter(id=task.id), self.owner, self.lease_duration
+        ):
+            logger.info("Webhook task %s was taken over by another worker", task.id)
+            return False
+
+        try:
+            func()
+        except Exception as exc:
+            self.fail([task], exc)
+            raise
+        WebhookTask.objects.filter(id=task.id, owner=self.owner).delete()
+        return True
+
+    def fail(self, tasks: List[WebhookTask], exc: Exception) -> None:
+        """Release the tasks, to retry them after a delay."""
+        leases.fail(tasks, self.owner, exc, self.retry_delay, self.max_retry_delay)
+
+    def claim(self, variant: str, batch_size: int) -> List[WebhookTask]:
+        """Claim the lease of the next batch of tasks that are left behind."""
+        return leases.claim(
+            WebhookTask.objects.filter(variant=variant).order_by("id"),
+            self.owner,
+            self.lease_duration,
+            limit=batch_size,
+        )
+
+    def process_pending(self, variant: str, batch_size: int = 100) -> Dict[str, int]:
+        """
+        Process the stored tasks of a variant that were left behind, in batches.
+
+        The tasks of a payment are processed in the order they were stored, and all
+        tasks of a payment in a batch are processed together, by one update. Returns
+        the number of processed and failed tasks.
+        """
+        totals = {"processed": 0, "failed": 0}
+        tasks = self.claim(variant, batch_size)
+        while tasks:
+            tasks_by_payment: Dict[int, List[WebhookTask]] = {}
+            for task in tasks:
+                tasks_by_payment.setdefault(task.payment_id, []).append(task)
+            payments = get_payment_model().objects.in_bulk(list(tasks_by_payment))
+
+            for payment_id, payment_tasks in tasks_by_payment.items():
+                payment = payments.get(payment_id)
+                try:
+                    if payment is not None:
+                        self.process(payment)
+                except PaymentError as exc:
+                    self.fail(payment_tasks, exc)
+                    totals["failed"] += len(payment_tasks)
+                    logger.warning(
+                        "Failed to process webhook of payment %s: %s",
+                        payment_id,
+                        exc.gateway_message,
+                    )
+                    continue
+                WebhookTask.objects.filter(
+                    id__in=[task.id for task in payment_tasks], owner=self.owner
+                ).delete()
+                totals["processed"] += len(payment_tasks)
+
+            tasks = self.claim(variant, batch_size)
+
+        return totals
@@ -1,10 +1,12 @@
 from django.contrib import admin
 
+from django_payments_mollie.admin import MolliePaymentAdminMixin
+
 from .models import Payment
 
 
 @admin.register(Payment)
-class PaymentAdmin(admin.ModelAdmin):
+class PaymentAdmin(MolliePaymentAdminMixin, admin.ModelAdmin):
     date_hierarchy = "created"
 
     list_display = (
@@ -0,0 +1,20 @@
+from django.db import connections
+
+
+def query_count_middleware(get_response):
+    """Add the number of database queries of a request as `X-DB-Queries` header."""
+
+    def middleware(request):
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connections["default"].execute_wrapper(count_query):
+            response = get_response(request)
+        response["X-DB-Queries"] = str(queries)
+        return response
+
+    return middleware
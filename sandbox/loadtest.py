@@ -0,0 +1,264 @@
+"""
+Load test the sandbox with concurrent checkouts, against a local Mollie stand-in.
+
+Every checkout runs through all steps of a payment: creating the payment, the
+redirect to Mollie by `get_form`, paying at the Mollie stand-in, the webhook
+notification and the return of the customer. The sandbox is started with each of
+the given servers (`wsgi` runs gunicorn, `asgi` runs uvicorn, which need to be
+installed), or tested as it already runs at `--base-url`.
+
+Example:
+
+    python loadtest.py --server wsgi --server asgi --checkouts 500 --concurrency 25
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+from mollie_standin import MollieStandIn
+
+SANDBOX_DIR = Path(__file__).resolve().parent
+STEPS = ["create", "get_form", "webhook", "return"]
+
+SERVER_COMMANDS = {
+    "wsgi": [
+        "gunicorn",
+        "wsgi:application",
+        "--bind",
+        "{host}:{port}",
+        "--workers",
+        "{workers}",
+        "--threads",
+        "{threads}",
+    ],
+    "asgi": [
+        "uvicorn",
+        "asgi:application",
+        "--host",
+        "{host}",
+        "--port",
+        "{port}",
+        "--workers",
+        "{workers}",
+        "--no-access-log",
+    ],
+}
+
+
+class Checkout:
+    """Run one checkout, and record the latency and queries of each step."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.session = requests.Session()
+        self.results = []
+
+    def request(self, step, method, url, expected_status=302, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.session.request(
+                method, url, allow_redirects=False, timeout=30, **kwargs
+            )
+        except requests.RequestException as exc:
+            self.results.append((step, time.perf_counter() - start, None, str(exc)))
+            raise
+        error = None
+        if response.status_code != expected_status:
+            error = f"HTTP {response.status_code}"
+        queries = response.headers.get("X-DB-Queries")
+        self.results.append(
+            (
+                step,
+                time.perf_counter() - start,
+                int(queries) if queries else None,
+                error,
+            )
+        )
+        if error:
+            raise RuntimeError(f"{step}: {error}")
+        return response
+
+    def run(self):
+        try:
+            response = self.request(
+                "create",
+                "GET",
+                f"{self.base_url}/create-payment/",
+                params={"amount": "10.00"},
+            )
+            details_url = requests.compat.urljoin(
+                self.base_url, response.headers["Location"]
+            )
+            response = self.request("get_form", "GET", details_url)
+            checkout_url = response.headers["Location"]
+            payment_id = checkout_url.rsplit("/", 1)[1]
+
+            # Pay at the Mollie stand-in, which redirects back to the process URL
+            response = self.session.get(checkout_url, allow_redirects=False)
+            process_url = response.headers["Location"]
+
+            self.request(
+                "webhook",
+                "POST",
+                process_url,
+                expected_status=200,
+                data={"id": payment_id},
+            )
+            self.request("return", "GET", process_url)
+        except (RuntimeError, KeyError, requests.RequestException):
+            pass
+        return self.results
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def run_load_test(base_url, checkouts, concurrency):
+    """Run the checkouts, and return the results of all steps and the duration."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(
+            executor.map(lambda _: Checkout(base_url).run(), range(checkouts))
+        )
+    return results, time.perf_counter() - start
+
+
+def report(label, results, duration):
+    # A failed step is recorded too, so only count checkouts without errors
+    completed = sum(
+        1
+        for checkout in results
+        if len(checkout) == len(STEPS) and all(result[3] is None for result in checkout)
+    )
+    print(f"\n== {label} ==")
+    print(
+        f"{len(results)} checkouts in {duration:.1f}s: "
+        f"{completed / duration:.1f} completed checkouts/s, "
+        f"{len(results) - completed} failed"
+    )
+
+    steps = defaultdict(list)
+    for checkout in results:
+        for result in checkout:
+            steps[result[0]].append(result)
+
+    print(
+        f"{'step':<10}{'requests':>9}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}"
+        f"{'p99 ms':>9}{'queries':>9}"
+    )
+    for step in STEPS:
+        step_results = steps.get(step, [])
+        if not step_results:
+            continue
+        latencies = [result[1] * 1000 for result in step_results]
+        errors = sum(1 for result in step_results if result[3])
+        queries = [result[2] for result in step_results if result[2] is not None]
+        print(
+            f"{step:<10}{len(step_results):>9}"
+            f"{errors / len(step_results):>8.1%}"
+            f"{percentile(latencies, 50):>9.1f}"
+            f"{percentile(latencies, 95):>9.1f}"
+            f"{percentile(latencies, 99):>9.1f}"
+            f"{statistics.mean(queries) if queries else 0:>9.1f}"
+        )
+
+
+def start_server(server, host, port, workers, threads, env):
+    command = [
+        part.format(host=host, port=port, workers=workers, threads=threads)
+        for part in SERVER_COMMANDS[server]
+    ]
+    process = subprocess.Popen(command, cwd=SANDBOX_DIR, env=env)
+
+    base_url = f"http://{host}:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"{base_url}/create-payment/", timeout=1)
+            return process, base_url
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"The {server} server didn't start")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--server",
+        action="append",
+        choices=sorted(SERVER_COMMANDS),
+        help="Start the sandbox with this server, can be repeated.",
+    )
+    parser.add_argument(
+        "--base-url",
+        help="Test a sandbox that already runs at this URL, configured to use the "
+        "Mollie stand-in at --standin-port.",
+    )
+    parser.add_argument("--checkouts", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.05,
+        help="The latency of the Mollie stand-in, in seconds.",
+    )
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--standin-port", type=int, default=8765)
+    args = parser.parse_args()
+    if not args.server and not args.base_url:
+        parser.error("Use --server or --base-url")
+
+    standin = MollieStandIn(port=args.standin_port, latency=args.latency).start()
+    print(f"Mollie stand-in at {standin.url} with {args.latency * 1000:.0f}ms latency")
+
+    if args.base_url:
+        results, duration = run_load_test(
+            args.base_url, args.checkouts, args.concurrency
+        )
+        report(args.base_url, results, duration)
+
+    env = {
+        **os.environ,
+        "MOLLIE_API_ENDPOINT": standin.url,
+        "PAYMENT_HOST": f"{args.host}:{args.port}",
+    }
+    if args.server:
+        subprocess.run(
+            [sys.executable, "manage.py", "migrate", "--verbosity", "0"],
+            cwd=SANDBOX_DIR,
+            env=env,
+            check=True,
+        )
+    for server in args.server or []:
+        process, base_url = start_server(
+            server, args.host, args.port, args.workers, args.threads, env
+        )
+        try:
+            report(server, *run_load_test(base_url, args.checkouts, args.concurrency))
+        finally:
+            process.terminate()
+            process.wait()
+
+    standin.stop()
+
+
+if __name__ == "__main__":
+    main()
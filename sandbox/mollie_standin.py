@@ -0,0 +1,124 @@
+"""
+A local stand-in for the Mollie payments API, for load tests.
+
+It implements just enough of the API to run checkouts through the sandbox: creating
+and retrieving payments, and a checkout page that pays the payment and redirects
+back to the `redirectUrl`. Every API response is delayed by the configured latency.
+"""
+
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+
+class MollieStandIn:
+    def __init__(self, host="127.0.0.1", port=8765, latency=0.0):
+        self.latency = latency
+        self.payments = {}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self.get_handler_class())
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+
+    def start(self):
+        """Serve requests in a background thread."""
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def create_payment(self, data):
+        payment_id = f"tr_{uuid.uuid4().hex[:10]}"
+        payment = {
+            "resource": "payment",
+            "id": payment_id,
+            "mode": "test",
+            "status": "open",
+            "amount": data["amount"],
+            "description": data.get("description", ""),
+            "redirectUrl": data.get("redirectUrl"),
+            "webhookUrl": data.get("webhookUrl"),
+            "metadata": data.get("metadata"),
+            "_links": {
+                "self": {"href": f"{self.url}/v2/payments/{payment_id}"},
+                "checkout": {"href": f"{self.url}/checkout/{payment_id}"},
+            },
+        }
+        with self.lock:
+            self.payments[payment_id] = payment
+        return payment
+
+    def pay(self, payment_id):
+        """Complete the checkout of a payment, like a customer would."""
+        with self.lock:
+            payment = self.payments[payment_id]
+            payment["status"] = "paid"
+            payment["paidAt"] = time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime())
+        return payment
+
+    def get_handler_class(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, status, data):
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/hal+json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_not_found(self):
+                self.send_json(
+                    404, {"status": 404, "title": "Not Found", "detail": self.path}
+                )
+
+            def do_POST(self):
+                time.sleep(standin.latency)
+                if urlparse(self.path).path != "/v2/payments":
+                    return self.send_not_found()
+                length = int(self.headers.get("Content-Length", 0))
+                data = json.loads(self.rfile.read(length) or b"{}")
+                self.send_json(201, standin.create_payment(data))
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                if path.startswith("/checkout/"):
+                    payment = standin.payments.get(path.rsplit("/", 1)[1])
+                    if payment is None:
+                        return self.send_not_found()
+                    standin.pay(payment["id"])
+                    self.send_response(302)
+                    self.send_header("Location", payment["redirectUrl"])
+                    self.end_headers()
+                    return
+
+                time.sleep(standin.latency)
+                payment = standin.payments.get(path.rsplit("/", 1)[1])
+                if not path.startswith("/v2/payments/") or payment is None:
+                    return self.send_not_found()
+                self.send_json(200, payment)
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    standin = MollieStandIn(port=args.port, latency=args.latency)
+    print(f"Mollie stand-in listening at {standin.url}")
+    standin.server.serve_forever()
@@ -3,6 +3,8 @@
 import os
 from pathlib import Path
 
+import django
+
 BASE_DIR = Path(__file__).resolve().parent
 
 # SECURITY WARNING: keep the secret key used in production secret!
@@ -30,6 +32,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "example_app.middleware.query_count_middleware",
 ]
 
 ROOT_URLCONF = "urls"
@@ -56,8 +59,12 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # Wait for locks under concurrent requests, like in the load test
+        "OPTIONS": {"timeout": 20},
     }
 }
+if django.VERSION >= (5, 1):
+    DATABASES["default"]["OPTIONS"]["transaction_mode"] = "IMMEDIATE"
 
 LANGUAGE_CODE = "en-us"
 
@@ -88,6 +95,8 @@ PAYMENT_VARIANTS = {
         "django_payments_mollie.provider.MollieProvider",
         {
             "api_key": os.getenv("MOLLIE_API_KEY", default="test_test"),
+            "pending_page": True,
+            "api_endpoint": os.getenv("MOLLIE_API_ENDPOINT", default=""),
         },
     )
 }
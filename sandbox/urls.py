@@ -6,6 +6,7 @@ from example_app import views
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("payments/", include("payments.urls")),
+    path("mollie/", include("django_payments_mollie.urls")),
     path(
         "payment-failure/<int:payment_id>",
         views.payment_failure,
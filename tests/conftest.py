@@ -32,3 +32,28 @@ def mollie_payment():
         },
     }
     return Payment(data, None)
+
+
+@pytest.fixture
+def facade(mocker):
+    """Mock the Facade of the provider, the retrieved payment isn't open."""
+    facade_class = mocker.patch("django_payments_mollie.provider.Facade")
+    facade = facade_class.return_value
+    facade.retrieve_payment.return_value.is_open.return_value = False
+    return facade
+
+
+@pytest.fixture
+def provider(mocker):
+    """Mock the provider, for components that only call it."""
+    from django_payments_mollie.provider import MollieProvider
+
+    return mocker.Mock(spec=MollieProvider)
+
+
+@pytest.fixture
+def mollie_provider(facade):
+    """A provider with the mocked Facade of the `facade` fixture."""
+    from django_payments_mollie.provider import MollieProvider
+
+    return MollieProvider(api_key="test_test")
@@ -8,14 +8,30 @@ INSTALLED_APPS = [
     "django.contrib.messages",
     "django.contrib.staticfiles",
     "payments",
+    "django_payments_mollie",
     "tests.test_app",
 ]
 
 SECRET_KEY = "django-insecure-secret-key"
 
+MIDDLEWARE = [
+    "django.contrib.sessions.middleware.SessionMiddleware",
+    "django.contrib.auth.middleware.AuthenticationMiddleware",
+]
+
 ROOT_URLCONF = "tests.django_urls"
 
+TEMPLATES = [
+    {
+        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "APP_DIRS": True,
+    }
+]
+
 DATABASES = {"default": dj_database_url.config(default="sqlite:///:memory:")}
+# A read replica for read-only queries. It is a separate database in the tests, so
+# they can check which database is read.
+DATABASES["replica"] = {**DATABASES["default"]}
 
 USE_TZ = True
 
@@ -2,4 +2,5 @@ from django.urls import include, path
 
 urlpatterns = [
     path("payments/", include("payments.urls")),
+    path("mollie/", include("django_payments_mollie.urls")),
 ]
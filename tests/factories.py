@@ -1,7 +1,17 @@
+from datetime import timedelta
+from uuid import uuid4
+
 import factory
+from django.utils import timezone
 from factory.django import DjangoModelFactory
 from payments import PaymentStatus, get_payment_model
 
+from django_payments_mollie.models import (
+    PaymentCheckout,
+    PaymentEvent,
+    PaymentIntent,
+    WebhookTask,
+)
 from tests.test_app.models import BaseMolliePayment
 
 
@@ -18,3 +28,71 @@ class PaymentFactory(DjangoModelFactory):
             status=PaymentStatus.INPUT,
             transaction_id="tr_12345",
         )
+
+
+class PaymentRelatedFactory(DjangoModelFactory):
+    """
+    Base factory for models that refer to a Mollie payment by its id.
+
+    The payment is available as the `payment` attribute of the created instance.
+    """
+
+    class Meta:
+        abstract = True
+
+    payment = factory.SubFactory(PaymentFactory, variant="mollie")
+    payment_id = factory.SelfAttribute("payment.id")
+    variant = factory.SelfAttribute("payment.variant")
+
+    @classmethod
+    def _create(cls, model_class, *args, payment=None, **kwargs):
+        instance = super()._create(model_class, *args, **kwargs)
+        instance.payment = payment
+        return instance
+
+
+class PaymentCheckoutFactory(PaymentRelatedFactory):
+    class Meta:
+        model = PaymentCheckout
+
+    payment = factory.SubFactory(
+        PaymentFactory,
+        variant="mollie",
+        status=PaymentStatus.INPUT,
+        transaction_id=factory.LazyFunction(lambda: f"tr_{uuid4().hex[:10]}"),
+    )
+    transaction_id = factory.SelfAttribute("payment.transaction_id")
+    checkout_url = "https://mollie.test/checkout/"
+    expires_at = factory.LazyFunction(lambda: timezone.now() + timedelta(minutes=15))
+
+    class Params:
+        expired = factory.Trait(
+            expires_at=factory.LazyFunction(lambda: timezone.now() - timedelta(hours=2))
+        )
+
+
+class PaymentIntentFactory(PaymentRelatedFactory):
+    class Meta:
+        model = PaymentIntent
+
+    idempotency_key = factory.LazyFunction(lambda: uuid4().hex)
+
+
+class PaymentEventFactory(PaymentRelatedFactory):
+    class Meta:
+        model = PaymentEvent
+
+    payment = factory.SubFactory(
+        PaymentFactory,
+        variant="mollie",
+        status=PaymentStatus.CONFIRMED,
+        transaction_id="tr_12345",
+    )
+    transaction_id = factory.SelfAttribute("payment.transaction_id")
+    previous_status = PaymentStatus.INPUT
+    status = factory.SelfAttribute("payment.status")
+
+
+class WebhookTaskFactory(PaymentRelatedFactory):
+    class Meta:
+        model = WebhookTask
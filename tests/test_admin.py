@@ -0,0 +1,69 @@
+import pytest
+from django.contrib import admin, messages
+from payments import PaymentStatus, get_payment_model
+
+from django_payments_mollie.admin import MolliePaymentAdminMixin, refresh_from_mollie
+
+from .factories import PaymentFactory
+
+pytestmark = pytest.mark.django_db
+
+
+class PaymentAdmin(MolliePaymentAdminMixin, admin.ModelAdmin):
+    refresh_max_workers = 2
+
+
+@pytest.fixture
+def modeladmin(mocker):
+    modeladmin = PaymentAdmin(get_payment_model(), admin.site)
+    mocker.patch.object(modeladmin, "message_user")
+    return modeladmin
+
+
+@pytest.fixture
+def provider(mocker):
+    # Newer django-payments versions cache provider instances
+    mocker.patch("payments.core.PROVIDER_CACHE", {}, create=True)
+    mocker.patch("django_payments_mollie.provider.Facade")
+    bulk_update = mocker.patch(
+        "django_payments_mollie.provider.MollieProvider.bulk_update_from_mollie"
+    )
+    return bulk_update
+
+
+def test_admin_mixin_adds_action(modeladmin):
+    assert refresh_from_mollie in modeladmin.actions
+
+
+def test_refresh_from_mollie_action(modeladmin, provider, rf):
+    changed, unchanged, failed = [
+        PaymentFactory(variant="mollie", submitted=True) for _ in range(3)
+    ]
+    # Never sent to Mollie
+    PaymentFactory(variant="mollie", status=PaymentStatus.WAITING)
+    provider.return_value = {
+        "changed": [changed],
+        "unchanged": [unchanged],
+        "errors": [failed],
+    }
+
+    request = rf.post("/")
+    refresh_from_mollie(modeladmin, request, get_payment_model().objects.all())
+
+    (payments,) = provider.call_args.args
+    assert sorted(payment.id for payment in payments) == [
+        changed.id,
+        unchanged.id,
+        failed.id,
+    ]
+    assert provider.call_args.kwargs == {"max_workers": 2}
+    modeladmin.message_user.assert_any_call(
+        request,
+        "Refreshed payments from Mollie: 1 changed, 1 unchanged, 1 failed.",
+        level=messages.SUCCESS,
+    )
+    modeladmin.message_user.assert_any_call(
+        request,
+        f"Failed to retrieve payments {failed.id} at Mollie.",
+        level=messages.WARNING,
+    )
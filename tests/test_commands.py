@@ -0,0 +1,364 @@
+import csv
+import io
+import json
+from datetime import timedelta
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.utils import timezone
+from mollie.api.objects.chargeback import Chargeback
+from mollie.api.objects.payment import Payment as MolliePayment
+from mollie.api.objects.refund import Refund
+from mollie.api.objects.settlement import Settlement
+from payments import PaymentError, PaymentStatus
+
+from django_payments_mollie.models import (
+    PaymentEvent,
+    PaymentIntent,
+    ReconciliationPartition,
+    WebhookTask,
+)
+
+from .factories import (
+    PaymentCheckoutFactory,
+    PaymentFactory,
+    PaymentIntentFactory,
+    WebhookTaskFactory,
+)
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def facade(mocker):
+    """The mocked Facade instance of the provider that management commands use."""
+    # Newer django-payments versions cache provider instances
+    mocker.patch("payments.core.PROVIDER_CACHE", {}, create=True)
+    facade_class = mocker.patch("django_payments_mollie.provider.Facade")
+    return facade_class.return_value
+
+
+@pytest.fixture
+def settlement_facade(facade):
+    settlements = [
+        Settlement(
+            {
+                "id": "stl_2",
+                "reference": "1234567.2301.02",
+                "createdAt": "2023-01-15T10:00:00+00:00",
+                "settledAt": "2023-01-15T12:00:00+00:00",
+            },
+            None,
+        ),
+        Settlement(
+            {
+                "id": "stl_1",
+                "reference": "1234567.2301.01",
+                "createdAt": "2023-01-01T10:00:00+00:00",
+                "settledAt": "2023-01-01T12:00:00+00:00",
+            },
+            None,
+        ),
+    ]
+    facade.iter_settlements.return_value = iter(settlements)
+    facade.iter_settlement_transactions.side_effect = lambda settlement: iter(
+        [
+            (
+                "payments",
+                MolliePayment(
+                    {
+                        "id": f"tr_{settlement.id}",
+                        "status": "paid",
+                        "amount": {"value": "10.00", "currency": "EUR"},
+                        "settlementAmount": {"value": "9.70", "currency": "EUR"},
+                    },
+                    None,
+                ),
+            ),
+            (
+                "refunds",
+                Refund(
+                    {
+                        "id": f"re_{settlement.id}",
+                        "paymentId": "tr_local",
+                        "amount": {"value": "5.00", "currency": "EUR"},
+                    },
+                    None,
+                ),
+            ),
+            (
+                "chargebacks",
+                Chargeback({"id": f"chb_{settlement.id}", "paymentId": "tr_x"}, None),
+            ),
+        ]
+    )
+    return facade
+
+
+def test_export_mollie_settlements_csv(settlement_facade):
+    payment = PaymentFactory(transaction_id="tr_local", total="15", status="confirmed")
+    stdout = io.StringIO()
+
+    call_command("export_mollie_settlements", "--batch-size=2", stdout=stdout)
+
+    rows = list(csv.DictReader(io.StringIO(stdout.getvalue())))
+    assert [(row["settlement_id"], row["type"], row["mollie_id"]) for row in rows] == [
+        ("stl_2", "payment", "tr_stl_2"),
+        ("stl_2", "refund", "re_stl_2"),
+        ("stl_2", "chargeback", "chb_stl_2"),
+        ("stl_1", "payment", "tr_stl_1"),
+        ("stl_1", "refund", "re_stl_1"),
+        ("stl_1", "chargeback", "chb_stl_1"),
+    ]
+    assert rows[0]["settlement_amount"] == "9.70"
+    assert rows[0]["payment_id"] == "", "Payment is unknown locally"
+
+    refund_row = rows[1]
+    assert refund_row["transaction_id"] == "tr_local"
+    assert refund_row["amount"] == "5.00"
+    assert refund_row["payment_id"] == str(payment.id)
+    assert refund_row["payment_status"] == "confirmed"
+    assert refund_row["payment_total"] == "15.00"
+
+
+def test_export_mollie_settlements_jsonl_since(settlement_facade, tmp_path):
+    output = tmp_path / "export.jsonl"
+
+    call_command(
+        "export_mollie_settlements",
+        "--format=jsonl",
+        f"--output={output}",
+        "--since=2023-01-10",
+    )
+
+    rows = [json.loads(line) for line in output.read_text().splitlines()]
+    assert len(rows) == 3
+    assert {row["settlement_id"] for row in rows} == {"stl_2"}
+
+
+def test_export_mollie_settlements_by_id(settlement_facade):
+    settlement_facade.retrieve_settlement.return_value = Settlement(
+        {"id": "stl_3"}, None
+    )
+    stdout = io.StringIO()
+
+    call_command(
+        "export_mollie_settlements",
+        "--settlement=stl_3",
+        "--format=jsonl",
+        stdout=stdout,
+    )
+
+    settlement_facade.retrieve_settlement.assert_called_once_with("stl_3")
+    settlement_facade.iter_settlements.assert_not_called()
+    assert len(stdout.getvalue().splitlines()) == 3
+
+
+def test_export_mollie_settlements_mollie_error(facade):
+    facade.iter_settlements.side_effect = PaymentError(
+        "Failed to retrieve list at Mollie", gateway_message="Mollie is down"
+    )
+
+    with pytest.raises(CommandError) as excinfo:
+        call_command("export_mollie_settlements", stdout=io.StringIO())
+
+    assert str(excinfo.value) == "Failed to retrieve list at Mollie: Mollie is down"
+
+
+@pytest.fixture
+def oauth_variant(settings, mocker):
+    settings.PAYMENT_VARIANTS = {
+        "mollie": (
+            "django_payments_mollie.provider.MollieProvider",
+            {
+                "client_id": "app_client",
+                "client_secret": "client_secret",
+                "refresh_token_loader": "tests.test_provider.get_refresh_token",
+                "tenant_resolver": "tests.test_provider.get_tenant",
+            },
+        )
+    }
+    return mocker.patch(
+        "django_payments_mollie.provider.TenantTokenManager.get_access_token",
+        side_effect=lambda tenant: f"access_{tenant}",
+    )
+
+
+def test_export_mollie_settlements_for_tenant(settlement_facade, oauth_variant):
+    stdout = io.StringIO()
+
+    call_command("export_mollie_settlements", "--tenant=one", stdout=stdout)
+
+    oauth_variant.assert_called_once_with("one")
+    settlement_facade.setup_with_access_token.assert_called_once_with(
+        "access_one", False
+    )
+    assert len(stdout.getvalue().splitlines()) == 7
+
+
+def test_export_mollie_settlements_requires_tenant(settlement_facade, oauth_variant):
+    with pytest.raises(CommandError) as excinfo:
+        call_command("export_mollie_settlements", stdout=io.StringIO())
+
+    assert "--tenant" in str(excinfo.value)
+    settlement_facade.iter_settlements.assert_not_called()
+
+
+def test_reconcile_mollie_payments(facade, mocker):
+    update_from_mollie = mocker.patch(
+        "django_payments_mollie.provider.MollieProvider.update_from_mollie"
+    )
+    payment = PaymentFactory(variant="mollie", submitted=True)
+    stdout = io.StringIO()
+
+    call_command("reconcile_mollie_payments", "--worker-id=test-worker", stdout=stdout)
+
+    update_from_mollie.assert_called_once_with(payment)
+    assert stdout.getvalue() == "Reconciled 1 payments\n"
+    partition = ReconciliationPartition.objects.get()
+    assert partition.job == "reconcile-mollie"
+    assert partition.owner == "test-worker"
+
+    call_command("reconcile_mollie_payments", stdout=stdout)
+    assert update_from_mollie.call_count == 1, "The job was already completed"
+
+    call_command("reconcile_mollie_payments", "--restart", stdout=stdout)
+    assert update_from_mollie.call_count == 2
+
+
+def test_recover_mollie_payment_intents(facade, mollie_payment):
+    intent = PaymentIntentFactory()
+    payment = intent.payment
+    PaymentIntent.objects.filter(id=intent.id).update(
+        created=timezone.now() - timedelta(minutes=5)
+    )
+    facade.create_payment.return_value = mollie_payment
+
+    stdout = io.StringIO()
+    call_command("recover_mollie_payment_intents", stdout=stdout)
+
+    assert stdout.getvalue() == "Recovered 1 payments\n"
+    payment.refresh_from_db()
+    assert payment.status == PaymentStatus.INPUT
+    assert payment.transaction_id == mollie_payment.id
+
+
+def test_sweep_expired_mollie_payments(settings, mocker):
+    mocker.patch("payments.core.PROVIDER_CACHE", {}, create=True)
+    settings.PAYMENT_VARIANTS = {
+        "mollie": (
+            "django_payments_mollie.provider.MollieProvider",
+            {"api_key": "test_test", "track_checkouts": True},
+        )
+    }
+    payment = PaymentCheckoutFactory(expired=True).payment
+
+    stdout = io.StringIO()
+    call_command("sweep_expired_mollie_payments", "--sample-rate=0", stdout=stdout)
+
+    assert stdout.getvalue() == (
+        "Rejected 1 expired payments, updated 0 payments from Mollie\n"
+    )
+    payment.refresh_from_db()
+    assert payment.status == PaymentStatus.REJECTED
+
+
+def test_sweep_expired_mollie_payments_requires_tracked_checkouts(mocker):
+    mocker.patch("payments.core.PROVIDER_CACHE", {}, create=True)
+    with pytest.raises(CommandError) as excinfo:
+        call_command("sweep_expired_mollie_payments", stdout=io.StringIO())
+
+    assert "track_checkouts" in str(excinfo.value)
+
+
+def test_process_mollie_webhooks(mocker):
+    update_from_mollie = mocker.patch(
+        "django_payments_mollie.provider.MollieProvider.update_from_mollie"
+    )
+    payment = WebhookTaskFactory(
+        payment__submitted=True, leased_until=timezone.now() - timedelta(seconds=1)
+    ).payment
+    stdout = io.StringIO()
+
+    call_command("process_mollie_webhooks", stdout=stdout)
+
+    update_from_mollie.assert_called_once_with(payment)
+    assert stdout.getvalue() == "Processed 1 webhooks, 0 failed\n"
+    assert not WebhookTask.objects.exists()
+
+
+def test_publish_mollie_payment_events(mocker):
+    sink = mocker.Mock()
+    provider = mocker.Mock(event_sinks=[sink])
+    mocker.patch("payments.core.PROVIDER_CACHE", {"mollie": provider}, create=True)
+    payment = PaymentFactory(variant="mollie", status=PaymentStatus.CONFIRMED)
+    PaymentEvent.from_payment(payment, PaymentStatus.INPUT).save()
+    PaymentEvent.objects.create(
+        payment_id=payment.id,
+        variant="mollie",
+        previous_status=PaymentStatus.WAITING,
+        status=PaymentStatus.INPUT,
+        delivered_at=timezone.now() - timedelta(days=30),
+    )
+
+    stdout = io.StringIO()
+    call_command("publish_mollie_payment_events", stdout=stdout)
+
+    assert stdout.getvalue() == (
+        "Published 1 events, 0 failed, deleted 1 delivered events\n"
+    )
+    sink.send.assert_called_once()
+
+
+def test_compact_mollie_payments(tmp_path):
+    payment = PaymentFactory(
+        variant="mollie",
+        status=PaymentStatus.CONFIRMED,
+        extra_data=json.dumps({"id": "tr_12345", "status": "paid"}),
+    )
+    type(payment).objects.filter(id=payment.id).update(
+        modified=timezone.now() - timedelta(days=30)
+    )
+
+    stdout = io.StringIO()
+    call_command(
+        "compact_mollie_payments",
+        "--older-than-days=7",
+        "--archive=file",
+        f"--archive-dir={tmp_path}",
+        "--throttle=0",
+        stdout=stdout,
+    )
+
+    assert stdout.getvalue() == f"Compacted 1 payments, up to payment {payment.id}\n"
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_compact_mollie_payments_requires_archive_dir():
+    with pytest.raises(CommandError):
+        call_command("compact_mollie_payments", "--archive=file")
+
+
+def test_replay_mollie_webhooks():
+    payment = PaymentFactory(
+        variant="mollie",
+        status=PaymentStatus.CONFIRMED,
+        transaction_id="tr_12345",
+        extra_data=json.dumps({"id": "tr_12345", "status": "expired"}),
+    )
+
+    stdout = io.StringIO()
+    call_command("replay_mollie_webhooks", "--process-data", stdout=stdout)
+
+    lines = stdout.getvalue().splitlines()
+    assert lines[0].startswith("parse: replayed 1 payments in ")
+    assert lines[1].startswith("process_data: replayed 1 payments in ")
+    for line, stage in zip(lines[2:4], ["parse", "process_data"]):
+        assert line == (
+            f"Payment {payment.id} (tr_12345) {stage}: recorded ('confirmed', ''), "
+            "replayed ('rejected', \"Mollie payment failed with status 'expired'\")"
+        )
+    assert lines[4:] == ["2 differences, 0 errors"]
+    payment.refresh_from_db()
+    assert payment.status == PaymentStatus.CONFIRMED
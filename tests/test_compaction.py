@@ -0,0 +1,204 @@
+import gzip
+import json
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+from payments import PaymentStatus
+
+from django_payments_mollie.compaction import (
+    COMPACTED_KEY,
+    ExtraDataCompaction,
+    compact_extra_data,
+)
+from django_payments_mollie.facade import Facade
+from django_payments_mollie.models import CompactionCheckpoint, PaymentArchive
+from django_payments_mollie.objects import SlimMolliePayment
+from django_payments_mollie.provider import MollieProvider
+
+from .factories import PaymentFactory
+
+pytestmark = pytest.mark.django_db
+
+MOLLIE_PAYMENT = {
+    "resource": "payment",
+    "id": "tr_12345",
+    "mode": "test",
+    "status": "failed",
+    "amount": {"currency": "EUR", "value": "10.00"},
+    "description": "Order 12345",
+    "method": "creditcard",
+    "createdAt": "2020-01-01T12:00:00+00:00",
+    "failedAt": "2020-01-01T12:05:00+00:00",
+    "details": {
+        "cardNumber": "6787",
+        "failureReason": "possible_fraud",
+        "failureMessage": "Suspected fraud",
+    },
+    "_links": {"self": {"href": "https://api.mollie.com/v2/payments/tr_12345"}},
+}
+
+
+def _old_payment(status=PaymentStatus.REJECTED, **kwargs):
+    kwargs.setdefault("extra_data", json.dumps(MOLLIE_PAYMENT))
+    payment = PaymentFactory(
+        variant="mollie", status=status, transaction_id="tr_12345", **kwargs
+    )
+    type(payment).objects.filter(id=payment.id).update(
+        modified=timezone.now() - timedelta(days=400)
+    )
+    return payment
+
+
+def _compaction(**kwargs):
+    kwargs.setdefault("throttle", 0)
+    return ExtraDataCompaction("mollie", timezone.now() - timedelta(days=365), **kwargs)
+
+
+def test_compact_extra_data_keeps_status_decision():
+    compacted = compact_extra_data(json.dumps(MOLLIE_PAYMENT))
+
+    data = json.loads(compacted)
+    assert data["details"] == {
+        "failureReason": "possible_fraud",
+        "failureMessage": "Suspected fraud",
+    }
+    assert "description" not in data
+    assert "_links" not in data
+    original = Facade.parse_payment_status(SlimMolliePayment(MOLLIE_PAYMENT))
+    parsed = Facade.parse_payment_status(SlimMolliePayment(data))
+    assert parsed[:2] == original[:2]
+    assert compact_extra_data(compacted) is None, "Already compacted"
+
+
+@pytest.mark.parametrize("extra_data", ["", "not json", "[]", '{"foo": "bar"}'])
+def test_compact_extra_data_skips_other_data(extra_data):
+    assert compact_extra_data(extra_data) is None
+
+
+def test_compaction_archives_to_table():
+    payment = _old_payment()
+
+    assert _compaction().run() == {"compacted": 1, "last_payment_id": payment.id}
+
+    payment.refresh_from_db()
+    assert json.loads(payment.extra_data)[COMPACTED_KEY] is True
+    archive = PaymentArchive.objects.get()
+    assert archive.payment_id == payment.id
+    assert archive.transaction_id == "tr_12345"
+    assert json.loads(archive.get_extra_data()) == MOLLIE_PAYMENT
+
+
+def test_compaction_archives_to_files(tmp_path):
+    payments = [_old_payment() for _ in range(3)]
+
+    results = _compaction(batch_size=2, archive="file", archive_dir=tmp_path).run()
+
+    assert results["compacted"] == 3
+    assert not PaymentArchive.objects.exists()
+    records = []
+    for path in sorted(tmp_path.iterdir()):
+        with gzip.open(path, "rt") as file:
+            records.extend(json.loads(line) for line in file)
+    assert [record["payment_id"] for record in records] == [
+        payment.id for payment in payments
+    ]
+    assert json.loads(records[0]["extra_data"]) == MOLLIE_PAYMENT
+
+
+def test_compaction_skips_recent_and_open_payments():
+    recent = PaymentFactory(
+        variant="mollie",
+        status=PaymentStatus.CONFIRMED,
+        extra_data=json.dumps(MOLLIE_PAYMENT),
+    )
+    open_payment = _old_payment(status=PaymentStatus.INPUT)
+
+    assert _compaction(archive="none").run()["compacted"] == 0
+
+    for payment in [recent, open_payment]:
+        payment.refresh_from_db()
+        assert json.loads(payment.extra_data) == MOLLIE_PAYMENT
+
+
+def test_compaction_skips_error_payments():
+    payment = _old_payment(status=PaymentStatus.ERROR)
+
+    assert _compaction(archive="none").run()["compacted"] == 0
+
+    payment.refresh_from_db()
+    assert json.loads(payment.extra_data) == MOLLIE_PAYMENT
+
+
+def test_compaction_skips_payments_updated_by_provider():
+    payment = _old_payment(status=PaymentStatus.INPUT)
+    # A late status change is a conditional update, which skips `auto_now`
+    assert MollieProvider.update_payment_status(payment, PaymentStatus.REJECTED)
+
+    assert _compaction(archive="none").run()["compacted"] == 0
+
+    payment.refresh_from_db()
+    assert json.loads(payment.extra_data) == MOLLIE_PAYMENT
+
+
+def test_compaction_skips_concurrently_updated_payments():
+    payment = _old_payment()
+    compaction = _compaction()
+    rows = compaction.get_batch(0)
+    type(payment).objects.filter(id=payment.id).update(
+        extra_data='{"id": "new"}', modified=timezone.now()
+    )
+
+    assert compaction.compact(rows) == 0
+
+    payment.refresh_from_db()
+    assert payment.extra_data == '{"id": "new"}'
+    assert not PaymentArchive.objects.exists()
+
+
+def test_compaction_updates_batch_at_once(django_assert_num_queries):
+    for _ in range(3):
+        _old_payment()
+    compaction = _compaction(archive="none")
+    rows = compaction.get_batch(0)
+
+    # Savepoint, select for update, update and release
+    with django_assert_num_queries(4):
+        assert compaction.compact(rows) == 3
+
+
+def test_compaction_resumes_from_checkpoint():
+    payments = [_old_payment() for _ in range(3)]
+
+    assert _compaction(batch_size=2).run(max_batches=1)["compacted"] == 2
+    checkpoint = CompactionCheckpoint.objects.get(job="compact-mollie")
+    assert checkpoint.last_payment_id == payments[1].id
+
+    assert _compaction(batch_size=2).run() == {
+        "compacted": 1,
+        "last_payment_id": payments[2].id,
+    }
+    assert CompactionCheckpoint.objects.get().compacted == 3
+
+    compaction = _compaction()
+    compaction.reset()
+    assert compaction.run()["compacted"] == 0, "Already compacted payments are skipped"
+
+
+def test_compaction_is_undone_by_provider_update(mollie_provider, facade):
+    payment = _old_payment()
+    compaction = _compaction()
+    assert compaction.run()["compacted"] == 1
+    facade.parse_payment_status.return_value = (
+        PaymentStatus.REJECTED,
+        "",
+        {"extra_data": json.dumps(MOLLIE_PAYMENT)},
+    )
+
+    payment.refresh_from_db()
+    mollie_provider.update_from_mollie(payment)
+
+    payment.refresh_from_db()
+    assert json.loads(payment.extra_data) == MOLLIE_PAYMENT
+    compaction.reset()
+    assert compaction.run()["compacted"] == 0, "The payment was modified recently"
@@ -0,0 +1,74 @@
+import threading
+
+import pytest
+from django.core.cache import cache
+
+from django_payments_mollie.debounce import WebhookDebouncer, schedule_in_thread
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+
+
+@pytest.fixture
+def schedule(mocker):
+    return mocker.Mock()
+
+
+def test_debounce_calls_first_notification_immediately(mocker, schedule):
+    func = mocker.Mock()
+
+    assert WebhookDebouncer(2).debounce("tr_1", func, schedule)
+
+    func.assert_called_once_with()
+    schedule.assert_not_called()
+
+
+def test_debounce_collapses_burst_into_trailing_call(mocker, schedule):
+    debouncer = WebhookDebouncer(2)
+    func = mocker.Mock()
+
+    assert debouncer.debounce("tr_1", func, schedule), "Leading call"
+    assert debouncer.debounce("tr_1", func, schedule), "Trailing call"
+    # Notifications that arrive before the trailing call are skipped
+    assert not debouncer.debounce("tr_1", func, schedule)
+
+    func.assert_called_once_with()
+    schedule.assert_called_once_with(2, mocker.ANY)
+
+    # The trailing call is made when the window has passed
+    schedule.call_args.args[1]()
+    assert func.call_count == 2
+
+
+def test_debounce_allows_next_trailing_call(mocker, schedule):
+    debouncer = WebhookDebouncer(2)
+    func = mocker.Mock()
+
+    debouncer.debounce("tr_1", func, schedule)
+    debouncer.debounce("tr_1", func, schedule)
+    schedule.call_args.args[1]()
+    # The window is still open, but a new trailing call is needed
+    assert debouncer.debounce("tr_1", func, schedule)
+
+    assert schedule.call_count == 2
+
+
+def test_debounce_per_key(mocker, schedule):
+    debouncer = WebhookDebouncer(2)
+    func = mocker.Mock()
+
+    debouncer.debounce("tr_1", func, schedule)
+    debouncer.debounce("tr_2", func, schedule)
+
+    assert func.call_count == 2
+    schedule.assert_not_called()
+
+
+def test_schedule_in_thread():
+    called = threading.Event()
+
+    schedule_in_thread(0, called.set)
+
+    assert called.wait(timeout=5)
@@ -0,0 +1,155 @@
+import json
+from datetime import timedelta
+
+import pytest
+import requests
+from django.utils import timezone
+from payments import PaymentStatus
+
+from django_payments_mollie.events import (
+    BaseEventSink,
+    FileEventSink,
+    HTTPEventSink,
+    PaymentEventPublisher,
+)
+from django_payments_mollie.models import PaymentEvent
+
+from .factories import PaymentEventFactory, PaymentFactory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def sink(mocker):
+    return mocker.Mock()
+
+
+@pytest.fixture
+def provider(provider, sink):
+    provider.event_sinks = [sink]
+    return provider
+
+
+def test_base_event_sink_requires_send():
+    class IncompleteSink(BaseEventSink):
+        pass
+
+    with pytest.raises(TypeError):
+        IncompleteSink()
+
+
+def test_event_as_dict():
+    event = PaymentEventFactory()
+
+    assert event.as_dict() == {
+        "id": event.id,
+        "payment_id": event.payment_id,
+        "variant": "mollie",
+        "transaction_id": "tr_12345",
+        "previous_status": PaymentStatus.INPUT,
+        "status": PaymentStatus.CONFIRMED,
+        "message": "",
+        "created": event.created.isoformat(),
+    }
+
+
+def test_publisher_delivers_events_in_batches(provider, sink):
+    events = [PaymentEventFactory() for _ in range(3)]
+
+    results = PaymentEventPublisher(provider, "mollie", batch_size=2).run()
+
+    assert results == {"delivered": 3, "failed": 0}
+    assert [call.args[0] for call in sink.send.call_args_list] == [
+        [events[0].as_dict(), events[1].as_dict()],
+        [events[2].as_dict()],
+    ]
+    assert not PaymentEvent.objects.filter(delivered_at__isnull=True).exists()
+    assert PaymentEventPublisher(provider, "mollie").run() == {
+        "delivered": 0,
+        "failed": 0,
+    }
+
+
+def test_publisher_retries_failed_batch_later(provider, sink):
+    event = PaymentEventFactory()
+    sink.send.side_effect = requests.ConnectionError("Connection refused")
+    publisher = PaymentEventPublisher(
+        provider, "mollie", retry_delay=timedelta(seconds=30)
+    )
+
+    assert publisher.run() == {"delivered": 0, "failed": 1}
+    assert publisher.run() == {"delivered": 0, "failed": 0}, "Not retried right away"
+
+    event.refresh_from_db()
+    assert event.delivered_at is None
+    assert event.attempts == 1
+    assert event.last_error == "Connection refused"
+    assert event.leased_until > timezone.now() + timedelta(seconds=25)
+
+    # After the retry delay, the event is delivered
+    PaymentEvent.objects.update(leased_until=timezone.now() - timedelta(seconds=1))
+    sink.send.side_effect = None
+    assert publisher.run() == {"delivered": 1, "failed": 0}
+
+
+def test_publisher_skips_leased_events(provider):
+    PaymentEventFactory(leased_until=timezone.now() + timedelta(minutes=1))
+    expired = PaymentEventFactory(leased_until=timezone.now() - timedelta(minutes=1))
+    PaymentEventFactory(variant="other")
+
+    assert PaymentEventPublisher(provider, "mollie").claim() == [expired]
+
+
+def test_publisher_purges_delivered_events(provider):
+    PaymentEventFactory(delivered_at=timezone.now() - timedelta(days=8))
+    recent = PaymentEventFactory(delivered_at=timezone.now() - timedelta(days=1))
+    pending = PaymentEventFactory()
+
+    assert PaymentEventPublisher(provider, "mollie").purge(timedelta(days=7)) == 1
+    assert set(PaymentEvent.objects.all()) == {recent, pending}
+
+
+def test_file_event_sink(tmp_path):
+    path = tmp_path / "events.jsonl"
+    sink = FileEventSink(path)
+
+    sink.send([{"id": 1}, {"id": 2}])
+    sink.send([{"id": 3}])
+
+    assert [json.loads(line) for line in path.read_text().splitlines()] == [
+        {"id": 1},
+        {"id": 2},
+        {"id": 3},
+    ]
+
+
+def test_http_event_sink(mocker):
+    sink = HTTPEventSink(
+        "https://example.com/events/", headers={"Authorization": "Bearer secret"}
+    )
+    post = mocker.patch.object(sink.session, "post")
+
+    sink.send([{"id": 1}])
+
+    post.assert_called_once_with(
+        "https://example.com/events/", json={"events": [{"id": 1}]}, timeout=10
+    )
+    post.return_value.raise_for_status.assert_called_once_with()
+    assert sink.session.headers["Authorization"] == "Bearer secret"
+
+
+def test_publisher_delivers_events_of_provider(mollie_provider, facade, sink):
+    payment = PaymentFactory(variant="mollie", submitted=True)
+    facade.parse_payment_status.return_value = (PaymentStatus.CONFIRMED, "", {})
+    mollie_provider.event_sinks = [sink]
+
+    mollie_provider.update_from_mollie(payment)
+    results = PaymentEventPublisher(mollie_provider, "mollie").run()
+
+    assert results == {"delivered": 1, "failed": 0}
+    [event] = sink.send.call_args.args[0]
+    assert (event["payment_id"], event["previous_status"], event["status"]) == (
+        payment.id,
+        PaymentStatus.INPUT,
+        PaymentStatus.CONFIRMED,
+    )
@@ -0,0 +1,142 @@
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+from payments import PaymentError, PaymentStatus
+from payments.signals import status_changed
+
+from django_payments_mollie.expiry import EXPIRED_MESSAGE, ExpiredPaymentSweeper
+from django_payments_mollie.models import PaymentCheckout
+
+from .factories import PaymentCheckoutFactory, PaymentFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def _update_status(status):
+    def update_from_mollie(payment):
+        payment.status = status
+
+    return update_from_mollie
+
+
+def test_sweeper_rejects_expired_payments(provider, mocker):
+    payments = [PaymentCheckoutFactory(expired=True).payment for _ in range(3)]
+    handler = mocker.Mock()
+    status_changed.connect(handler)
+
+    results = ExpiredPaymentSweeper(provider, "mollie", sample_rate=0).run()
+
+    status_changed.disconnect(handler)
+    assert results == {"rejected": 3, "confirmed": 0}
+    provider.update_from_mollie.assert_not_called()
+    for payment in payments:
+        payment.refresh_from_db()
+        assert payment.status == PaymentStatus.REJECTED
+        assert payment.message == EXPIRED_MESSAGE
+    assert handler.call_count == 3
+    assert not PaymentCheckout.objects.exists()
+    provider.record_status_changes.assert_called_once_with(
+        [(payment, PaymentStatus.INPUT) for payment in payments]
+    )
+
+
+def test_sweeper_skips_recent_and_changed_payments(provider):
+    recent = PaymentCheckoutFactory(
+        expires_at=timezone.now() - timedelta(minutes=5)
+    ).payment
+    confirmed = PaymentCheckoutFactory(
+        expired=True, payment__status=PaymentStatus.CONFIRMED
+    ).payment
+    recreated = PaymentCheckoutFactory(expired=True).payment
+    PaymentCheckout.objects.filter(payment_id=recreated.id).update(
+        transaction_id="tr_old"
+    )
+
+    results = ExpiredPaymentSweeper(provider, "mollie", sample_rate=0).run()
+
+    assert results == {"rejected": 0, "confirmed": 0}
+    for payment, status in [
+        (recent, PaymentStatus.INPUT),
+        (confirmed, PaymentStatus.CONFIRMED),
+        (recreated, PaymentStatus.INPUT),
+    ]:
+        payment.refresh_from_db()
+        assert payment.status == status
+    assert list(PaymentCheckout.objects.values_list("payment_id", flat=True)) == [
+        recent.id
+    ]
+
+
+def test_sweeper_reject_skips_payments_rejected_concurrently(provider, mocker):
+    payments = [PaymentCheckoutFactory(expired=True).payment for _ in range(2)]
+    # A webhook reports the expiry after the payments were selected
+    PaymentFactory._meta.model.objects.filter(id=payments[0].id).update(
+        status=PaymentStatus.REJECTED, message=EXPIRED_MESSAGE
+    )
+    handler = mocker.Mock()
+    status_changed.connect(handler)
+
+    rejected = ExpiredPaymentSweeper(provider, "mollie").reject(payments)
+
+    status_changed.disconnect(handler)
+    assert rejected == 1
+    handler.assert_called_once_with(
+        signal=status_changed, sender=type(payments[1]), instance=mocker.ANY
+    )
+    assert handler.call_args.kwargs["instance"].id == payments[1].id
+    provider.record_status_changes.assert_called_once_with(
+        [(payments[1], PaymentStatus.INPUT)]
+    )
+
+
+def test_sweeper_confirms_sample_at_mollie(provider):
+    for _ in range(4):
+        PaymentCheckoutFactory(expired=True).payment
+    provider.update_from_mollie.side_effect = _update_status(PaymentStatus.REJECTED)
+
+    results = ExpiredPaymentSweeper(provider, "mollie", sample_rate=0.5).run()
+
+    assert results == {"rejected": 2, "confirmed": 2}
+    assert provider.update_from_mollie.call_count == 2
+
+
+def test_sweeper_confirms_batch_when_sample_disagrees(provider):
+    for _ in range(4):
+        PaymentCheckoutFactory(expired=True).payment
+    provider.update_from_mollie.side_effect = _update_status(PaymentStatus.CONFIRMED)
+
+    results = ExpiredPaymentSweeper(provider, "mollie", sample_rate=0.25).run()
+
+    assert results == {"rejected": 0, "confirmed": 4}
+    assert provider.update_from_mollie.call_count == 4
+
+
+def test_sweeper_keeps_batch_when_mollie_fails(provider):
+    payment = PaymentCheckoutFactory(expired=True).payment
+    provider.update_from_mollie.side_effect = PaymentError(
+        "Failed to retrieve payment at Mollie", gateway_message="Read timed out"
+    )
+
+    results = ExpiredPaymentSweeper(provider, "mollie", sample_rate=1).run()
+
+    assert results == {"rejected": 0, "confirmed": 0}
+    payment.refresh_from_db()
+    assert payment.status == PaymentStatus.INPUT
+    assert PaymentCheckout.objects.filter(payment_id=payment.id).exists()
+
+
+def test_sweeper_confirms_with_provider(mollie_provider, facade):
+    payment = PaymentCheckoutFactory(expired=True).payment
+    facade.parse_payment_status.return_value = (
+        PaymentStatus.REJECTED,
+        EXPIRED_MESSAGE,
+        {},
+    )
+
+    results = ExpiredPaymentSweeper(mollie_provider, "mollie", sample_rate=1).run()
+
+    assert results == {"rejected": 0, "confirmed": 1}
+    payment.refresh_from_db()
+    assert payment.status == PaymentStatus.REJECTED
+    assert payment.message == EXPIRED_MESSAGE
@@ -1,13 +1,22 @@
+import json
+import threading
 from decimal import Decimal
+from unittest import mock
 
 import pytest
 from mollie.api.client import Client as MollieClient
-from mollie.api.error import ResponseHandlingError
+from mollie.api.error import RequestError, ResponseHandlingError
+from mollie.api.objects.chargeback import Chargeback
+from mollie.api.objects.list import PaginationList
 from mollie.api.objects.payment import Payment as MolliePayment
+from mollie.api.objects.refund import Refund
+from mollie.api.objects.settlement import Settlement
 from payments import FraudStatus, PaymentError, PaymentStatus
 
 from django_payments_mollie import __version__ as version
 from django_payments_mollie.facade import Facade
+from django_payments_mollie.objects import SlimMolliePayment
+from django_payments_mollie.transport import RecordReplayTransport, RequestsTransport
 
 from .factories import PaymentFactory
 
@@ -52,6 +61,31 @@ def test_facade_retrieve_payment(facade, mollie_payment):
     assert isinstance(resp, MolliePayment)
 
 
+def test_facade_retrieve_payment_with_embedded_objects(facade, mollie_payment):
+    mollie_payment["_embedded"] = {
+        "refunds": [
+            {"resource": "refund", "id": "re_1", "paymentId": "tr_12345"},
+            {"resource": "refund", "id": "re_2", "paymentId": "tr_12345"},
+        ],
+        "chargebacks": [],
+    }
+    facade.client.payments.get.return_value = mollie_payment
+
+    payment = PaymentFactory(submitted=True)
+    resp = facade.retrieve_payment(
+        payment, embed=["refunds", "chargebacks"], include=["details.qrCode"]
+    )
+
+    facade.client.payments.get.assert_called_once_with(
+        "tr_12345", embed="refunds,chargebacks", include="details.qrCode"
+    )
+    refunds = list(facade.iter_payment_refunds(resp))
+    assert [refund.id for refund in refunds] == ["re_1", "re_2"]
+    assert all(isinstance(refund, Refund) for refund in refunds)
+    assert list(facade.iter_payment_chargebacks(resp)) == []
+    assert facade.get_embedded_objects(resp, "captures") is None
+
+
 def test_facade_retrieve_payment_mollie_error(facade):
     facade.client.payments.get.side_effect = ResponseHandlingError(
         "Unable to decode Mollie API response (status code: 404): ''."
@@ -83,7 +117,23 @@ def test_facade_create_payment(facade, mollie_payment):
         "description": payment.description,
         "redirectUrl": "https://example.com/return-url/",
     }
-    facade.client.payments.create.assert_called_once_with(expected_payload)
+    facade.client.payments.create.assert_called_once_with(
+        expected_payload, idempotency_key=""
+    )
+
+
+def test_facade_create_payment_with_webhook_url_and_metadata(facade):
+    payment = PaymentFactory()
+    facade.create_payment(
+        payment,
+        "https://example.com/return-url/",
+        webhook_url="https://example.com/webhook-url/",
+        metadata={"payment_id": payment.id},
+    )
+
+    payload = facade.client.payments.create.call_args.args[0]
+    assert payload["webhookUrl"] == "https://example.com/webhook-url/"
+    assert payload["metadata"] == {"payment_id": payment.id}
 
 
 def test_facade_create_payment_payment_status_error(facade):
@@ -109,6 +159,37 @@ def test_facade_create_payment_mollie_error(facade):
     )
 
 
+def test_facade_create_payment_idempotent_request_error(facade):
+    facade.client.payments.create.side_effect = RequestError("Read timed out")
+
+    payment = PaymentFactory()
+    with pytest.raises(PaymentError):
+        facade.create_payment(
+            payment, "https://example.com/return-url/", idempotency_key="key"
+        )
+
+    # The request can be repeated with the same key, so the payment isn't failed
+    payment.refresh_from_db()
+    assert payment.status == PaymentStatus.WAITING
+    facade.client.payments.create.assert_called_once_with(
+        mock.ANY, idempotency_key="key"
+    )
+
+
+def test_facade_client_timeout_override():
+    facade = Facade()
+    timeouts = []
+
+    with facade.client.override_timeout(1):
+        timeouts.append(facade.client.timeout)
+        thread = threading.Thread(target=lambda: timeouts.append(facade.client.timeout))
+        thread.start()
+        thread.join()
+    timeouts.append(facade.client.timeout)
+
+    assert timeouts == [1, (2, 10), (2, 10)]
+
+
 def test_facade_create_payment_sanity_checks(facade):
     payment_no_currency = PaymentFactory(currency="")
 
@@ -150,7 +231,7 @@ def test_facade_create_payment_adds_full_billing_address(facade):
         "redirectUrl": "https://example.com/return-url/",
     }
     facade.client.payments.create.assert_called_once_with(
-        expected_payload
+        expected_payload, idempotency_key=""
     ), "Payload should contain billingAddress"
 
 
@@ -189,7 +270,7 @@ def test_facade_create_payment_incomplete_billing_address_warning(facade, omit_k
         "redirectUrl": "https://example.com/return-url/",
     }
     facade.client.payments.create.assert_called_once_with(
-        expected_payload
+        expected_payload, idempotency_key=""
     ), "Payload should not contain an incomplete billingAdddress"
 
 
@@ -249,6 +330,7 @@ def test_facade_create_payment_incomplete_billing_address_warning(facade, omit_k
         ),
     ],
 )
+@pytest.mark.parametrize("payment_class", [MolliePayment, SlimMolliePayment])
 def test_facade_parse_payment_status(
     facade,
     mollie_payment,
@@ -256,8 +338,12 @@ def test_facade_parse_payment_status(
     expected_status,
     expected_message,
     expected_updates,
+    payment_class,
 ):
-    mollie_payment = MolliePayment(payment_data, client=None)
+    if payment_class is SlimMolliePayment:
+        mollie_payment = SlimMolliePayment(payment_data)
+    else:
+        mollie_payment = MolliePayment(payment_data, client=None)
 
     status, status_message, payment_updates = facade.parse_payment_status(
         mollie_payment
@@ -298,7 +384,8 @@ def test_facade_parse_payment_status_failure_details(facade):
     assert payment_updates == {}
 
 
-def test_facade_parse_payment_status_fraud_details(facade):
+@pytest.mark.parametrize("payment_class", [MolliePayment, SlimMolliePayment])
+def test_facade_parse_payment_status_fraud_details(facade, payment_class):
     data = {
         "status": "failed",
         "details": {
@@ -306,7 +393,10 @@ def test_facade_parse_payment_status_fraud_details(facade):
             "failureMessage": "Details about fraud",
         },
     }
-    mollie_payment = MolliePayment(data, client=None)
+    if payment_class is SlimMolliePayment:
+        mollie_payment = SlimMolliePayment(data)
+    else:
+        mollie_payment = MolliePayment(data, client=None)
 
     status, _, payment_updates = facade.parse_payment_status(mollie_payment)
 
@@ -316,3 +406,247 @@ def test_facade_parse_payment_status_fraud_details(facade):
         "fraud_message": "Details about fraud",
         "fraud_status": FraudStatus.REJECT,
     }
+
+
+def _list_page(resource, object_name, ids, next_url=None):
+    """Mock a page of a Mollie list response."""
+    data = {
+        "_embedded": {object_name: [{"id": _id} for _id in ids]},
+        "count": len(ids),
+        "_links": {"next": {"href": next_url} if next_url else None},
+    }
+    return PaginationList(data, resource, None)
+
+
+def test_facade_iter_settlements_fetches_pages_lazily(facade, mocker):
+    settlements = mocker.patch.object(facade.client, "settlements")
+    settlements.object_type = Settlement
+    settlements.list.return_value = _list_page(
+        settlements, "settlements", ["stl_1", "stl_2"], next_url="https://next/"
+    )
+    settlements.perform_api_call.return_value = _list_page(
+        settlements, "settlements", ["stl_3"]
+    )
+
+    iterator = facade.iter_settlements()
+    assert next(iterator).id == "stl_1"
+    assert next(iterator).id == "stl_2"
+    settlements.perform_api_call.assert_not_called()
+
+    assert [settlement.id for settlement in iterator] == ["stl_3"]
+    settlements.list.assert_called_once_with(limit=250)
+    settlements.perform_api_call.assert_called_once_with(
+        settlements.REST_READ, "https://next/"
+    )
+
+
+def test_facade_iter_settlement_transactions(facade, mocker):
+    settlement = mocker.Mock()
+    for object_name, object_type in [
+        ("payments", MolliePayment),
+        ("refunds", Refund),
+        ("chargebacks", Chargeback),
+    ]:
+        resource = getattr(settlement, object_name)
+        resource.object_type = object_type
+        resource.list.return_value = _list_page(
+            resource, object_name, [f"{object_name}_1"]
+        )
+
+    transactions = list(facade.iter_settlement_transactions(settlement))
+
+    assert [(_type, obj["id"]) for _type, obj in transactions] == [
+        ("payments", "payments_1"),
+        ("refunds", "refunds_1"),
+        ("chargebacks", "chargebacks_1"),
+    ]
+
+
+def test_facade_iter_settlements_mollie_error(facade, mocker):
+    settlements = mocker.patch.object(facade.client, "settlements")
+    settlements.list.side_effect = RequestError("Unable to communicate with Mollie")
+
+    with pytest.raises(PaymentError) as excinfo:
+        list(facade.iter_settlements())
+
+    assert str(excinfo.value) == "Failed to retrieve list at Mollie"
+
+
+def test_facade_retrieve_settlement(facade, mocker):
+    settlements = mocker.patch.object(facade.client, "settlements")
+    settlements.get.return_value = Settlement({"id": "stl_1"}, None)
+
+    assert facade.retrieve_settlement("stl_1").id == "stl_1"
+
+    settlements.get.side_effect = RequestError("Unable to communicate with Mollie")
+    with pytest.raises(PaymentError) as excinfo:
+        facade.retrieve_settlement("stl_1")
+    assert str(excinfo.value) == "Failed to retrieve settlement at Mollie"
+
+
+@pytest.fixture(scope="function")
+def slim_facade(mocker):
+    """A Facade instance that returns slim payments, with a patched HTTP call"""
+    facade = Facade(slim_payments=True)
+    facade.setup_with_api_key("test_test")
+    mocker.patch.object(facade.client, "perform_http_call")
+    return facade
+
+
+def test_facade_retrieve_slim_payment(slim_facade, mollie_payment):
+    body = json.dumps(mollie_payment).encode()
+    response = slim_facade.client.perform_http_call.return_value
+    response.status_code = 200
+    response.content = body
+
+    payment = PaymentFactory(submitted=True)
+    resp = slim_facade.retrieve_payment(payment)
+
+    slim_facade.client.perform_http_call.assert_called_once_with(
+        "GET", "payments/tr_12345", params=None
+    )
+    assert isinstance(resp, SlimMolliePayment)
+    assert resp.id == mollie_payment.id
+    assert resp.checkout_url == mollie_payment.checkout_url
+
+    _, _, payment_updates = slim_facade.parse_payment_status(resp)
+    assert payment_updates["extra_data"] == body.decode()
+
+
+def test_facade_retrieve_slim_payment_with_embedded_objects(
+    slim_facade, mollie_payment
+):
+    mollie_payment["_embedded"] = {
+        "chargebacks": [{"resource": "chargeback", "id": "chb_1"}],
+    }
+    response = slim_facade.client.perform_http_call.return_value
+    response.status_code = 200
+    response.content = json.dumps(mollie_payment).encode()
+
+    payment = PaymentFactory(submitted=True)
+    resp = slim_facade.retrieve_payment(payment, embed=["chargebacks"])
+
+    slim_facade.client.perform_http_call.assert_called_once_with(
+        "GET", "payments/tr_12345", params={"embed": "chargebacks"}
+    )
+    chargebacks = slim_facade.get_embedded_objects(resp, "chargebacks")
+    assert [chargeback.id for chargeback in chargebacks] == ["chb_1"]
+    assert isinstance(chargebacks[0], Chargeback)
+
+
+@pytest.mark.parametrize(
+    "json_response, expected_message",
+    [
+        (
+            {"status": 404, "title": "Not Found", "detail": "No payment exists"},
+            "No payment exists",
+        ),
+        (
+            ValueError("No JSON"),
+            "Unable to decode Mollie API response (status code: 404): 'Not found'.",
+        ),
+    ],
+)
+def test_facade_retrieve_slim_payment_mollie_error(
+    slim_facade, json_response, expected_message
+):
+    response = slim_facade.client.perform_http_call.return_value
+    response.status_code = 404
+    response.text = "Not found"
+    response.json.side_effect = [json_response]
+
+    payment = PaymentFactory(submitted=True)
+    with pytest.raises(PaymentError) as excinfo:
+        slim_facade.retrieve_payment(payment)
+
+    assert str(excinfo.value) == "Failed to retrieve payment at Mollie"
+    assert str(excinfo.value.gateway_message) == expected_message
+
+
+@pytest.mark.parametrize("slim_payments", [True, False])
+def test_facade_iter_payments(mocker, slim_payments):
+    facade = Facade(slim_payments=slim_payments)
+    payments = mocker.patch.object(facade.client, "payments")
+    payments.object_type = MolliePayment
+    payments.list.return_value = _list_page(payments, "payments", ["tr_1", "tr_2"])
+
+    result = list(facade.iter_payments(from_="tr_1"))
+
+    payments.list.assert_called_once_with(from_="tr_1", limit=250)
+    assert [payment.id for payment in result] == ["tr_1", "tr_2"]
+    expected_class = SlimMolliePayment if slim_payments else MolliePayment
+    assert all(isinstance(payment, expected_class) for payment in result)
+
+
+@pytest.mark.parametrize("slim_payments", [True, False])
+def test_facade_iter_payments_stream_lists(slim_payments):
+    transport = RecordReplayTransport()
+    next_url = "https://api.mollie.com/v2/payments?from=tr_3&limit=250"
+    transport.add_response(
+        "GET",
+        "https://api.mollie.com/v2/payments?from=tr_1&limit=250",
+        {
+            "count": 2,
+            "_embedded": {"payments": [{"id": "tr_1"}, {"id": "tr_2"}]},
+            "_links": {"next": {"href": next_url}},
+        },
+    )
+    transport.add_response(
+        "GET",
+        next_url,
+        {"count": 1, "_embedded": {"payments": [{"id": "tr_3"}]}, "_links": {}},
+    )
+    facade = Facade(slim_payments=slim_payments, transport=transport, stream_lists=True)
+    facade.setup_with_api_key("test_test")
+
+    result = list(facade.iter_payments(**{"from": "tr_1"}))
+
+    assert [payment.id for payment in result] == ["tr_1", "tr_2", "tr_3"]
+    expected_class = SlimMolliePayment if slim_payments else MolliePayment
+    assert all(isinstance(payment, expected_class) for payment in result)
+
+
+def test_facade_stream_lists_reads_requests_response_in_chunks(mocker):
+    transport = RequestsTransport()
+    request = mocker.patch.object(transport, "request")
+    response = request.return_value
+    response.status_code = 200
+    response.iter_content.return_value = iter(
+        [b'{"_embedded": {"refunds": [{"id": "re_1"}', b"]}}"]
+    )
+    facade = Facade(transport=transport, stream_lists=True)
+    facade.setup_with_api_key("test_test")
+
+    refunds = list(facade.iter_payment_refunds(SlimMolliePayment({"id": "tr_1"})))
+
+    assert [refund.id for refund in refunds] == ["re_1"]
+    assert isinstance(refunds[0], Refund)
+    request.assert_called_once_with(
+        "GET",
+        "https://api.mollie.com/v2/payments/tr_1/refunds?limit=250",
+        headers=mock.ANY,
+        params=None,
+        timeout=facade.client.timeout,
+        stream=True,
+    )
+    assert request.call_args.kwargs["headers"]["Authorization"] == "Bearer test_test"
+    response.iter_content.assert_called_once_with(Facade.STREAM_CHUNK_SIZE)
+    response.close.assert_called_once_with()
+
+
+def test_facade_stream_lists_mollie_error():
+    transport = RecordReplayTransport()
+    transport.add_response(
+        "GET",
+        "https://api.mollie.com/v2/payments?limit=250",
+        {"status": 401, "title": "Unauthorized Request", "detail": "Missing auth"},
+        status_code=401,
+    )
+    facade = Facade(transport=transport, stream_lists=True)
+    facade.setup_with_api_key("test_test")
+
+    with pytest.raises(PaymentError) as excinfo:
+        list(facade.iter_payments())
+
+    assert str(excinfo.value) == "Failed to retrieve list at Mollie"
+    assert "Missing auth" in str(excinfo.value.gateway_message)
@@ -0,0 +1,139 @@
+from datetime import timedelta
+
+import pytest
+from payments import PaymentError, PaymentStatus
+
+from django_payments_mollie.intents import PaymentIntentRecovery
+from django_payments_mollie.models import PaymentIntent
+
+from .factories import PaymentFactory, PaymentIntentFactory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def provider(provider):
+    provider.get_return_url.return_value = "https://example.com/return-url/"
+    provider.get_create_options.return_value = {}
+    provider.complete_payment_intent.return_value = True
+    return provider
+
+
+def _recovery(provider, **kwargs):
+    kwargs.setdefault("min_age", timedelta(0))
+    return PaymentIntentRecovery(provider, "mollie", **kwargs)
+
+
+def test_payment_intent_get_pending():
+    payment = PaymentFactory(variant="mollie")
+    intent = PaymentIntent.get_pending(payment)
+
+    assert PaymentIntent.get_pending(payment) == intent
+    assert intent.variant == "mollie"
+    assert intent.idempotency_key
+
+    PaymentIntent.objects.filter(id=intent.id).update(
+        status=PaymentIntent.STATUS_COMPLETED
+    )
+    assert PaymentIntent.get_pending(payment) != intent
+
+
+def test_recovery_creates_payment_with_idempotency_key(provider, mollie_payment):
+    intent = PaymentIntentFactory()
+    payment = intent.payment
+    facade = provider.get_facade.return_value
+    facade.create_payment.return_value = mollie_payment
+
+    assert _recovery(provider).run() == 1
+
+    facade.create_payment.assert_called_once_with(
+        payment,
+        "https://example.com/return-url/",
+        idempotency_key=intent.idempotency_key,
+    )
+    provider.complete_payment_intent.assert_called_once_with(
+        payment, intent, mollie_payment.id
+    )
+
+
+def test_recovery_skips_recent_intents(provider):
+    PaymentIntentFactory()
+
+    assert _recovery(provider, min_age=timedelta(minutes=1)).run() == 0
+    provider.get_facade.assert_not_called()
+
+
+def test_recovery_runs_in_batches(provider, mollie_payment):
+    for _ in range(3):
+        PaymentIntentFactory()
+    provider.get_facade.return_value.create_payment.return_value = mollie_payment
+
+    assert _recovery(provider, batch_size=2).run() == 3
+
+
+def test_recovery_claims_intent_once(provider):
+    intent = PaymentIntentFactory()
+    recovery = _recovery(provider)
+    stale = PaymentIntent.objects.get(id=intent.id)
+
+    assert recovery.claim(intent)
+    assert not recovery.claim(stale), "Another worker already claimed the intent"
+
+
+def test_recovery_retries_failed_requests(provider):
+    intent = PaymentIntentFactory()
+    provider.get_facade.return_value.create_payment.side_effect = PaymentError(
+        "Failed to create payment at Mollie", gateway_message="Read timed out"
+    )
+
+    recovery = _recovery(provider, max_attempts=2)
+    assert recovery.run() == 0
+    intent.refresh_from_db()
+    assert intent.status == PaymentIntent.STATUS_PENDING
+    assert intent.last_error == "Failed to create payment at Mollie: Read timed out"
+
+    assert recovery.run() == 0
+    intent.refresh_from_db()
+    assert intent.status == PaymentIntent.STATUS_FAILED
+    assert intent.attempts == 2
+
+
+def test_recovery_fails_refused_payments(provider):
+    intent = PaymentIntentFactory()
+
+    def refuse(payment, *args, **kwargs):
+        payment.change_status(PaymentStatus.ERROR, "Refused")
+        raise PaymentError("Failed to create payment at Mollie")
+
+    provider.get_facade.return_value.create_payment.side_effect = refuse
+
+    assert _recovery(provider).run() == 0
+    intent.refresh_from_db()
+    assert intent.status == PaymentIntent.STATUS_FAILED
+    provider.record_create_error.assert_called_once()
+
+
+def test_recovery_fails_payments_that_are_not_waiting(provider):
+    intent = PaymentIntentFactory(payment__status=PaymentStatus.REJECTED)
+
+    assert _recovery(provider).run() == 0
+    intent.refresh_from_db()
+    assert intent.status == PaymentIntent.STATUS_FAILED
+    assert intent.last_error == "The payment status is 'rejected'"
+    provider.get_facade.assert_not_called()
+
+
+def test_recovery_completes_intent_with_provider(
+    mollie_provider, facade, mollie_payment
+):
+    intent = PaymentIntentFactory()
+    facade.create_payment.return_value = mollie_payment
+
+    assert _recovery(mollie_provider).run() == 1
+
+    intent.refresh_from_db()
+    assert intent.status == PaymentIntent.STATUS_COMPLETED
+    assert intent.transaction_id == mollie_payment.id
+    intent.payment.refresh_from_db()
+    assert intent.payment.status == PaymentStatus.INPUT
+    assert intent.payment.transaction_id == mollie_payment.id
@@ -0,0 +1,72 @@
+import logging
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+
+from django_payments_mollie import leases
+from django_payments_mollie.models import WebhookTask
+
+from .factories import WebhookTaskFactory
+
+pytestmark = pytest.mark.django_db
+
+LEASE = timedelta(minutes=5)
+
+
+def test_get_retry_delay():
+    delays = [
+        leases.get_retry_delay(attempts, timedelta(minutes=1), timedelta(minutes=5))
+        for attempts in range(1, 5)
+    ]
+    assert delays == [timedelta(minutes=minutes) for minutes in (1, 2, 4, 5)]
+
+
+def test_claim_available_rows(caplog):
+    leased = WebhookTaskFactory(owner="other", leased_until=timezone.now() + LEASE)
+    expired = WebhookTaskFactory(owner="crashed", leased_until=timezone.now() - LEASE)
+    released = WebhookTaskFactory()
+    tasks = WebhookTask.objects.order_by("id")
+
+    with caplog.at_level(logging.INFO, logger="django_payments_mollie.leases"):
+        assert leases.claim(tasks, "worker", LEASE, limit=10) == [expired, released]
+    assert leases.claim(tasks, "second", LEASE, limit=10) == []
+
+    leased.refresh_from_db()
+    assert leased.owner == "other"
+    assert caplog.messages == [f"Reclaimed webhook task {expired.id} from crashed"]
+
+
+def test_renew():
+    task = WebhookTaskFactory(owner="worker", leased_until=timezone.now())
+
+    leased_until = leases.renew(WebhookTask.objects.filter(id=task.id), "worker", LEASE)
+    assert leased_until > timezone.now() + LEASE - timedelta(seconds=10)
+    task.refresh_from_db()
+    assert task.leased_until == leased_until
+
+    assert leases.renew(WebhookTask.objects.filter(id=task.id), "other", LEASE) is None
+
+
+def test_fail_releases_rows():
+    first = WebhookTaskFactory(owner="worker", attempts=2)
+    second = WebhookTaskFactory(owner="worker")
+    taken_over = WebhookTaskFactory(owner="other")
+
+    attempts = leases.fail(
+        [first, second, taken_over],
+        "worker",
+        ValueError("Failed"),
+        timedelta(minutes=1),
+        timedelta(hours=1),
+    )
+
+    assert attempts == 3
+    first.refresh_from_db()
+    second.refresh_from_db()
+    taken_over.refresh_from_db()
+    assert (first.owner, first.attempts, first.last_error) == ("", 3, "Failed")
+    assert second.attempts == 1
+    # The delay of the task that failed most often applies to the batch
+    assert second.leased_until > timezone.now() + timedelta(minutes=3)
+    assert (taken_over.owner, taken_over.attempts) == ("other", 0)
@@ -0,0 +1,21 @@
+import threading
+
+from django_payments_mollie.metrics import Counter
+
+
+def test_counter():
+    counter = Counter("updates")
+
+    threads = [
+        threading.Thread(target=lambda: [counter.increment() for _ in range(100)])
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert counter.value == 400
+    assert repr(counter) == "<Counter updates=400>"
+    counter.reset()
+    assert counter.value == 0
@@ -55,3 +55,81 @@ def test_model_ignores_explicit_not_updated_fields_during_save():
     assert (
         payment.description == "My updated payment description"
     ), "Description is correct and should be updated"
+
+
+def test_model_skips_validation_for_unchanged_required_fields(mocker):
+    payment = MollieTestPayment.objects.create(
+        total=Decimal("13.37"),
+        currency="EUR",
+        description="My test payment",
+    )
+    spy = mocker.spy(MollieTestPayment, "validate_mollie_required_fields")
+
+    payment.change_status("confirmed")
+    payment.billing_city = "Amsterdam"
+    payment.save()
+
+    loaded_payment = MollieTestPayment.objects.get(id=payment.id)
+    loaded_payment.save()
+
+    assert spy.call_count == 0, "Unchanged required fields should not be validated"
+
+
+def test_model_validates_only_changed_required_fields(mocker):
+    payment = MollieTestPayment.objects.create(
+        total=Decimal("13.37"),
+        currency="EUR",
+        description="My test payment",
+    )
+    # Bypass validation, the field is invalid in the database
+    MollieTestPayment.objects.filter(id=payment.id).update(currency="")
+
+    loaded_payment = MollieTestPayment.objects.get(id=payment.id)
+    loaded_payment.description = ""
+    with pytest.raises(ValidationError) as excinfo:
+        loaded_payment.save()
+
+    assert excinfo.value.message_dict == {
+        "description": ["Mollie requires 'description' to be set"],
+    }
+
+
+def test_model_bulk_create_validates_required_fields():
+    payments = [
+        MollieTestPayment(total=Decimal("1"), currency="EUR", description="First"),
+        MollieTestPayment(total=Decimal("0"), currency="EUR", description="Second"),
+        MollieTestPayment(total="0.0", currency="EUR", description="Third"),
+    ]
+
+    with pytest.raises(ValidationError) as excinfo:
+        MollieTestPayment.objects.bulk_create(payments)
+
+    assert excinfo.value.message_dict == {
+        "total": ["Mollie requires 'total' to be set (2 of 3 payments)"],
+    }
+    assert excinfo.value.error_dict["total"][0].params == {"indexes": [1, 2]}
+    assert not MollieTestPayment.objects.exists()
+
+    MollieTestPayment.objects.bulk_create(payments[:1])
+    assert MollieTestPayment.objects.count() == 1
+
+
+def test_model_bulk_update_validates_updated_required_fields():
+    payments = MollieTestPayment.objects.bulk_create(
+        [
+            MollieTestPayment(total=Decimal("1"), currency="EUR", description="1"),
+            MollieTestPayment(total=Decimal("2"), currency="EUR", description="2"),
+        ]
+    )
+    payments[1].currency = ""
+    payments[1].billing_city = "Amsterdam"
+
+    # The invalid field is not updated
+    MollieTestPayment.objects.bulk_update(payments, ["billing_city"])
+
+    with pytest.raises(ValidationError) as excinfo:
+        MollieTestPayment.objects.bulk_update(payments, ["currency"])
+
+    assert excinfo.value.messages == [
+        "Mollie requires 'currency' to be set (1 of 2 payments)"
+    ]
@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from django_payments_mollie.objects import SlimMolliePayment
+
+PAYMENT_RESPONSE = {
+    "resource": "payment",
+    "id": "tr_12345",
+    "mode": "test",
+    "status": "failed",
+    "amount": {"value": "10.00", "currency": "EUR"},
+    "amountRefunded": {"value": "0.00", "currency": "EUR"},
+    "description": "My payment",
+    "method": "creditcard",
+    "details": {
+        "cardNumber": "6787",
+        "failureReason": "possible_fraud",
+        "failureMessage": "Details about fraud",
+    },
+    "_links": {
+        "self": {"href": "https://api.mollie.com/v2/payments/tr_12345"},
+        "checkout": {"href": "https://mollie.test/checkout/", "type": "text/html"},
+    },
+}
+
+
+def test_slim_payment_from_response():
+    body = json.dumps(PAYMENT_RESPONSE).encode()
+
+    payment = SlimMolliePayment.from_response(body)
+
+    assert payment.id == "tr_12345"
+    assert payment.status == "failed"
+    assert payment.amount == {"value": "10.00", "currency": "EUR"}
+    assert payment.amount_refunded == {"value": "0.00", "currency": "EUR"}
+    assert payment.amount_captured is None
+    assert payment.details == {
+        "failureReason": "possible_fraud",
+        "failureMessage": "Details about fraud",
+    }
+    assert payment.checkout_url == "https://mollie.test/checkout/"
+    assert payment.to_json() == body.decode(), "The response body should be kept"
+    assert repr(payment) == "<SlimMolliePayment tr_12345 (failed)>"
+
+
+def test_slim_payment_has_no_instance_dict():
+    payment = SlimMolliePayment({"id": "tr_12345"})
+
+    assert not hasattr(payment, "__dict__")
+    with pytest.raises(AttributeError):
+        payment.description = "Not a field of the projection"
+
+
+def test_slim_payment_to_json_without_body():
+    payment = SlimMolliePayment(
+        {"id": "tr_12345", "status": "paid", "paidAt": "2018-03-20T09:28:37+00:00"}
+    )
+
+    assert payment.details is None
+    assert payment.checkout_url is None
+    assert json.loads(payment.to_json()) == {
+        "id": "tr_12345",
+        "status": "paid",
+        "paidAt": "2018-03-20T09:28:37+00:00",
+    }
+
+
+@pytest.mark.parametrize(
+    "status, expected_method",
+    [
+        ("open", "is_open"),
+        ("pending", "is_pending"),
+        ("canceled", "is_canceled"),
+        ("expired", "is_expired"),
+        ("failed", "is_failed"),
+    ],
+)
+def test_slim_payment_status_methods(status, expected_method):
+    payment = SlimMolliePayment({"status": status})
+
+    for method in ["is_open", "is_pending", "is_canceled", "is_expired", "is_failed"]:
+        assert getattr(payment, method)() == (method == expected_method)
+    assert not payment.is_paid()
@@ -0,0 +1,91 @@
+import logging
+
+import pytest
+from django.http import HttpRequest
+from django.urls import reverse
+from payments import PaymentStatus, get_payment_model
+
+from django_payments_mollie import profiling
+from django_payments_mollie.provider import MollieProvider
+
+from .factories import PaymentFactory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def clear_profiles():
+    profiling.recent_profiles.clear()
+
+
+def test_profile_records_spans_and_queries(caplog):
+    caplog.set_level(logging.INFO, logger="django_payments_mollie.profiling")
+
+    with profiling.profile("get_form", 1, payment_id=1):
+        with profiling.span("db"):
+            get_payment_model().objects.count()
+        with profiling.span("mollie"):
+            pass
+
+    (profile,) = profiling.recent_profiles
+    assert profile["name"] == "get_form"
+    assert profile["payment_id"] == 1
+    assert profile["queries"] == 1
+    assert [(span["name"], span["queries"]) for span in profile["spans"]] == [
+        ("db", 1),
+        ("mollie", 0),
+    ]
+    assert "Profiled get_form" in caplog.text
+
+
+def test_profile_sampling(mocker):
+    mocker.patch("django_payments_mollie.profiling.random.random", return_value=0.5)
+
+    with profiling.profile("get_form", 0.1):
+        assert profiling.get_current_profile() is None
+    with profiling.profile("get_form", 0.9):
+        assert profiling.get_current_profile() is not None
+
+    assert len(profiling.recent_profiles) == 1
+
+
+def test_span_without_profile():
+    with profiling.span("db"):
+        PaymentFactory()
+
+    assert not profiling.recent_profiles
+
+
+def test_provider_profiles_process_data(mocker, facade):
+    provider = MollieProvider(api_key="test_test", profiling_sample_rate=1)
+    provider.facade.parse_payment_status.return_value = (
+        PaymentStatus.CONFIRMED,
+        "",
+        {"extra_data": "{}"},
+    )
+    request = HttpRequest()
+    request.method = "POST"
+
+    provider.process_data(PaymentFactory(submitted=True), request)
+
+    (profile,) = profiling.recent_profiles
+    assert profile["name"] == "process_data"
+    assert profile["method"] == "POST"
+    assert [span["name"] for span in profile["spans"]] == [
+        "mollie",
+        "serialization",
+        "db",
+        "signals",
+    ]
+
+
+def test_profiles_view(client, admin_user):
+    with profiling.profile("get_form", 1):
+        pass
+    url = reverse("django_payments_mollie:profiles")
+
+    assert client.get(url).status_code == 302, "Anonymous users are redirected"
+
+    client.force_login(admin_user)
+    response = client.get(url)
+    assert [profile["name"] for profile in response.json()["profiles"]] == ["get_form"]
@@ -1,15 +1,30 @@
+from datetime import timedelta
 from decimal import Decimal
 from http import HTTPStatus
 
 import pytest
+from django.db import transaction
 from django.http import HttpRequest, HttpResponse, HttpResponseRedirect
-from payments import PaymentStatus, RedirectNeeded
+from django.utils import timezone
+from mollie.api.objects.chargeback import Chargeback
+from mollie.api.objects.payment import Payment as MolliePayment
+from mollie.api.objects.refund import Refund
+from payments import PaymentError, PaymentStatus, RedirectNeeded, get_payment_model
 from payments.core import provider_factory
+from payments.signals import status_changed
 
+from django_payments_mollie import metrics
 from django_payments_mollie.facade import Facade
+from django_payments_mollie.models import (
+    PaymentCheckout,
+    PaymentEvent,
+    PaymentIntent,
+    PaymentRefund,
+    WebhookTask,
+)
 from django_payments_mollie.provider import MollieProvider
 
-from .factories import PaymentFactory
+from .factories import PaymentCheckoutFactory, PaymentFactory
 
 pytestmark = pytest.mark.django_db
 
@@ -31,6 +46,73 @@ def test_provider_initializes_facade(mocker):
     provider.facade.setup_with_api_key.assert_called_once_with("test_test")
 
 
+def test_provider_initializes_facade_with_access_token(mocker):
+    setup = mocker.patch(
+        "django_payments_mollie.provider.Facade.setup_with_access_token"
+    )
+    provider = MollieProvider(access_token="access_test", testmode=True)
+
+    setup.assert_called_once_with("access_test", True)
+    assert provider.get_facade(PaymentFactory()) is provider.facade
+
+
+def get_refresh_token(tenant):
+    return f"refresh_{tenant}"
+
+
+def get_tenant(payment):
+    return payment.description
+
+
+def test_provider_uses_facade_per_tenant(mocker):
+    get_access_token = mocker.patch(
+        "django_payments_mollie.provider.TenantTokenManager.get_access_token",
+        side_effect=lambda tenant: f"access_{tenant}",
+    )
+    provider = MollieProvider(
+        client_id="app_client",
+        client_secret="client_secret",
+        refresh_token_loader="tests.test_provider.get_refresh_token",
+        tenant_resolver="tests.test_provider.get_tenant",
+        testmode=True,
+    )
+    assert provider.token_manager.get_refresh_token("one") == "refresh_one"
+
+    facade_one = provider.get_facade(PaymentFactory(description="one"))
+    facade_two = provider.get_facade(PaymentFactory(description="two"))
+
+    assert facade_one is not facade_two
+    assert facade_one.client.api_key == "access_one"
+    assert facade_one.client.testmode
+    assert facade_two.client.api_key == "access_two"
+    assert provider.get_facade(PaymentFactory(description="one")) is facade_one
+    assert get_access_token.call_count == 3
+
+
+def test_provider_configures_slim_payments(mocker):
+    facade_class = mocker.patch("django_payments_mollie.provider.Facade")
+    MollieProvider(api_key="test_test", slim_payments=True)
+
+    facade_class.assert_called_once_with(
+        slim_payments=True, transport=None, stream_lists=False
+    )
+
+
+def test_provider_configures_stream_lists(mocker):
+    facade_class = mocker.patch("django_payments_mollie.provider.Facade")
+    MollieProvider(api_key="test_test", stream_lists=True)
+
+    facade_class.assert_called_once_with(
+        slim_payments=False, transport=None, stream_lists=True
+    )
+
+
+def test_provider_configures_api_endpoint():
+    provider = MollieProvider(api_key="test_test", api_endpoint="http://localhost:8765")
+
+    assert provider.facade.client.api_endpoint == "http://localhost:8765"
+
+
 def test_provider_get_form_creates_mollie_payment(mocker, mollie_payment):
     mocker.patch("django_payments_mollie.provider.Facade")
 
@@ -66,8 +148,222 @@ def test_provider_get_form_redirects_to_mollie(mocker, mollie_payment):
     assert str(excinfo.value) == mollie_payment.checkout_url
 
 
-def test_provider_process_data_updates_payment(mocker):
+def test_provider_get_form_sends_webhook_url_and_metadata(mocker, mollie_payment):
+    mocker.patch("django_payments_mollie.provider.Facade")
+    provider = MollieProvider(
+        api_key="test_test",
+        send_webhook_url=True,
+        payment_metadata="django_payments_mollie.provider.get_payment_metadata",
+    )
+    provider.facade.create_payment.return_value = mollie_payment
+
+    payment = PaymentFactory(variant="mollie")
+    with pytest.raises(RedirectNeeded):
+        provider.get_form(payment)
+
+    return_url = provider.get_return_url(payment)
+    provider.facade.create_payment.assert_called_once_with(
+        payment,
+        return_url,
+        timeout=None,
+        webhook_url=return_url,
+        metadata={"payment_id": payment.id, "variant": "mollie"},
+    )
+
+
+def test_provider_get_form_with_payment_intents(mocker, mollie_payment):
+    mocker.patch("django_payments_mollie.provider.Facade")
+    provider = MollieProvider(
+        api_key="test_test", payment_intents=True, create_timeout=(1, 3)
+    )
+    provider.facade.create_payment.return_value = mollie_payment
+
+    payment = PaymentFactory()
+    with pytest.raises(RedirectNeeded):
+        provider.get_form(payment)
+
+    intent = PaymentIntent.objects.get(payment_id=payment.id)
+    assert intent.status == PaymentIntent.STATUS_COMPLETED
+    assert intent.transaction_id == mollie_payment.id
+    provider.facade.create_payment.assert_called_once_with(
+        payment,
+        mocker.ANY,
+        idempotency_key=intent.idempotency_key,
+        timeout=(1, 3),
+    )
+
+    payment.refresh_from_db()
+    assert payment.status == PaymentStatus.INPUT
+    assert payment.transaction_id == mollie_payment.id
+
+
+def test_provider_get_form_with_payment_intents_retry(mocker, mollie_payment):
+    mocker.patch("django_payments_mollie.provider.Facade")
+    provider = MollieProvider(api_key="test_test", payment_intents=True)
+    provider.facade.create_payment.side_effect = [
+        PaymentError("Failed to create payment at Mollie"),
+        mollie_payment,
+    ]
+
+    payment = PaymentFactory()
+    with pytest.raises(PaymentError):
+        provider.get_form(payment)
+    intent = PaymentIntent.objects.get(payment_id=payment.id)
+    assert intent.status == PaymentIntent.STATUS_PENDING
+
+    with pytest.raises(RedirectNeeded):
+        provider.get_form(payment)
+
+    # The retry uses the same intent, so Mollie creates the payment only once
+    keys = [
+        call.kwargs["idempotency_key"]
+        for call in provider.facade.create_payment.call_args_list
+    ]
+    assert keys == [intent.idempotency_key, intent.idempotency_key]
+    intent.refresh_from_db()
+    assert intent.status == PaymentIntent.STATUS_COMPLETED
+
+
+def test_provider_get_form_reuses_checkout(mocker, mollie_payment):
+    mocker.patch("django_payments_mollie.provider.Facade")
+    provider = MollieProvider(api_key="test_test", reuse_checkout=True)
+    mollie_payment["expiresAt"] = (timezone.now() + timedelta(minutes=15)).isoformat()
+    provider.facade.create_payment.return_value = mollie_payment
+
+    payment = PaymentFactory()
+    with pytest.raises(RedirectNeeded):
+        provider.get_form(payment)
+    checkout = PaymentCheckout.objects.get(payment_id=payment.id)
+    assert checkout.transaction_id == mollie_payment.id
+    assert checkout.checkout_url == mollie_payment.checkout_url
+
+    # Reloading the payment page sends the user to the same checkout
+    payment.refresh_from_db()
+    with pytest.raises(RedirectNeeded) as excinfo:
+        provider.get_form(payment)
+
+    assert str(excinfo.value) == mollie_payment.checkout_url
+    provider.facade.create_payment.assert_called_once()
+    provider.facade.retrieve_payment.assert_not_called()
+
+
+def test_provider_get_form_tracks_checkouts_without_reuse(mocker, mollie_payment):
     mocker.patch("django_payments_mollie.provider.Facade")
+    provider = MollieProvider(api_key="test_test", track_checkouts=True)
+    mollie_payment["expiresAt"] = "2030-01-01T12:00:00+00:00"
+    provider.facade.create_payment.return_value = mollie_payment
+
+    payment = PaymentFactory()
+    with pytest.raises(RedirectNeeded):
+        provider.get_form(payment)
+    checkout = PaymentCheckout.objects.get(payment_id=payment.id)
+    assert checkout.expires_at.isoformat() == "2030-01-01T12:00:00+00:00"
+
+    # The checkout isn't reused, a new Mollie payment is created
+    payment.refresh_from_db()
+    with pytest.raises(RedirectNeeded):
+        provider.get_form(payment)
+    assert provider.facade.create_payment.call_count == 2
+
+
+def _expired_checkout_payment(mollie_status):
+    payment = PaymentFactory(status=PaymentStatus.INPUT, transaction_id="tr_old")
+    PaymentCheckoutFactory(
+        payment=payment,
+        checkout_url="https://mollie.test/checkout/old/",
+        expires_at=timezone.now() - timedelta(minutes=1),
+    )
+    old_mollie_payment = MolliePayment({"id": "tr_old", "status": mollie_status}, None)
+    return payment, old_mollie_payment
+
+
+def test_provider_get_form_recreates_expired_checkout(mocker, mollie_payment):
+    mocker.patch("django_payments_mollie.provider.Facade")
+    provider = MollieProvider(api_key="test_test", reuse_checkout=True)
+    payment, old_mollie_payment = _expired_checkout_payment("expired")
+    provider.facade.retrieve_payment.return_value = old_mollie_payment
+    provider.facade.create_payment.return_value = mollie_payment
+
+    with pytest.raises(RedirectNeeded) as excinfo:
+        provider.get_form(payment)
+
+    assert str(excinfo.value) == mollie_payment.checkout_url
+    payment.refresh_from_db()
+    assert payment.status == PaymentStatus.INPUT
+    assert payment.transaction_id == mollie_payment.id
+    checkout = PaymentCheckout.objects.get(payment_id=payment.id)
+    assert checkout.transaction_id == mollie_payment.id
+
+
+def test_provider_get_form_keeps_paid_checkout(mocker):
+    mocker.patch("django_payments_mollie.provider.Facade")
+    provider = MollieProvider(api_key="test_test", reuse_checkout=True)
+    payment, old_mollie_payment = _expired_checkout_payment("pending")
+    provider.facade.retrieve_payment.return_value = old_mollie_payment
+
+    with pytest.raises(PaymentError):
+        provider.get_form(payment)
+
+    provider.facade.create_payment.assert_not_called()
+    payment.refresh_from_db()
+    assert payment.status == PaymentStatus.INPUT
+    assert payment.transaction_id == "tr_old"
+
+
+def test_provider_update_from_mollie_stores_checkout(mocker, mollie_payment):
+    mocker.patch("django_payments_mollie.provider.Facade")
+    provider = MollieProvider(api_key="test_test", track_checkouts=True)
+    mollie_payment["expiresAt"] = "2030-01-01T12:00:00+00:00"
+    provider.facade.retrieve_payment.return_value = mollie_payment
+    provider.facade.parse_payment_status.side_effect = Facade.parse_payment_status
+
+    payment = PaymentFactory(submitted=True, transaction_id=mollie_payment.id)
+    provider.update_from_mollie(payment)
+
+    checkout = PaymentCheckout.objects.get(payment_id=payment.id)
+    assert checkout.expires_at.isoformat() == "2030-01-01T12:00:00+00:00"
+
+
+def test_provider_save_checkout_skips_unchanged_checkout(
+    mollie_payment, django_assert_num_queries
+):
+    provider = MollieProvider(api_key="test_test", track_checkouts=True)
+    mollie_payment["expiresAt"] = "2030-01-01T12:00:00+00:00"
+    payment = PaymentFactory(submitted=True, transaction_id=mollie_payment.id)
+    provider.save_checkout(payment, mollie_payment)
+
+    with django_assert_num_queries(1):
+        provider.save_checkout(payment, mollie_payment)
+
+    mollie_payment["expiresAt"] = "2030-01-01T13:00:00+00:00"
+    with django_assert_num_queries(2):
+        checkout = provider.save_checkout(payment, mollie_payment)
+    checkout.refresh_from_db()
+    assert checkout.expires_at.isoformat() == "2030-01-01T13:00:00+00:00"
+
+
+def test_provider_save_checkout_without_tracking(
+    mollie_payment, django_assert_num_queries
+):
+    provider = MollieProvider(api_key="test_test")
+    payment = PaymentFactory(submitted=True, transaction_id=mollie_payment.id)
+
+    with django_assert_num_queries(0):
+        assert provider.save_checkout(payment, mollie_payment) is None
+
+
+def test_provider_complete_payment_intent_once(mocker):
+    mocker.patch("django_payments_mollie.provider.Facade")
+    provider = MollieProvider(api_key="test_test")
+    payment = PaymentFactory()
+    intent = PaymentIntent.get_pending(payment)
+
+    assert provider.complete_payment_intent(payment, intent, "tr_12345")
+    assert not provider.complete_payment_intent(payment, intent, "tr_12345")
+    assert payment.status == PaymentStatus.INPUT
+
+
+def test_provider_process_data_updates_payment(mocker, facade):
 
     provider = MollieProvider(api_key="test_test")
     # Configure mock
@@ -89,9 +385,8 @@ def test_provider_process_data_updates_payment(mocker):
     assert payment.captured_amount == Decimal("13.37")
 
 
-def test_provider_process_data_confirmed_payment_uses_own_amount(mocker):
+def test_provider_process_data_confirmed_payment_uses_own_amount(mocker, facade):
     """If Mollie returns no captured amount, the `payment.total` is used."""
-    mocker.patch("django_payments_mollie.provider.Facade")
 
     provider = MollieProvider(api_key="test_test")
     # Configure mock
@@ -120,8 +415,9 @@ def test_provider_process_data_confirmed_payment_uses_own_amount(mocker):
         (PaymentStatus.ERROR, "failure"),
     ],
 )
-def test_provider_process_data_returns_result_redirect(mocker, status, redirect):
-    mocker.patch("django_payments_mollie.provider.Facade")
+def test_provider_process_data_returns_result_redirect(
+    mocker, status, redirect, facade
+):
 
     provider = MollieProvider(api_key="test_test")
     # Configure mock
@@ -140,8 +436,7 @@ def test_provider_process_data_returns_result_redirect(mocker, status, redirect)
     assert result.url == f"https://example.com/{redirect}"
 
 
-def test_provider_process_data_webhook_request_returns_http_200(mocker):
-    mocker.patch("django_payments_mollie.provider.Facade")
+def test_provider_process_data_webhook_request_returns_http_200(mocker, facade):
 
     provider = MollieProvider(api_key="test_test")
     # Configure mock
@@ -158,3 +453,628 @@ def test_provider_process_data_webhook_request_returns_http_200(mocker):
     result = provider.process_data(payment, webhook_request)
     assert isinstance(result, HttpResponse)
     assert result.status_code == HTTPStatus.OK
+
+
+def test_provider_process_data_sends_status_changed_signal(mocker, facade):
+    receiver = mocker.Mock()
+    status_changed.connect(receiver)
+
+    provider = MollieProvider(api_key="test_test")
+    # Configure mock
+    provider.facade.parse_payment_status.return_value = (
+        PaymentStatus.REJECTED,
+        "rejected",
+        {},
+    )
+
+    payment = PaymentFactory(submitted=True)
+    request = HttpRequest()
+    request.method = "POST"
+
+    try:
+        provider.process_data(payment, request)
+        provider.process_data(payment, request)
+    finally:
+        status_changed.disconnect(receiver)
+
+    receiver.assert_called_once_with(
+        signal=status_changed, sender=type(payment), instance=payment
+    )
+
+
+def test_provider_process_data_records_status_change_event(mocker, tmp_path, facade):
+    provider = MollieProvider(
+        api_key="test_test",
+        event_sinks=[
+            (
+                "django_payments_mollie.events.FileEventSink",
+                {"path": tmp_path / "events.jsonl"},
+            )
+        ],
+    )
+    provider.facade.parse_payment_status.return_value = (
+        PaymentStatus.REJECTED,
+        "rejected",
+        {},
+    )
+
+    payment = PaymentFactory(submitted=True)
+    request = HttpRequest()
+    request.method = "POST"
+    provider.process_data(payment, request)
+    provider.process_data(payment, request)
+
+    event = PaymentEvent.objects.get()
+    assert event.payment_id == payment.id
+    assert event.previous_status == PaymentStatus.INPUT
+    assert event.status == PaymentStatus.REJECTED
+    assert event.message == "rejected"
+    assert event.delivered_at is None
+
+
+def _provider_with_events(tmp_path, **kwargs):
+    return MollieProvider(
+        api_key="test_test",
+        event_sinks=[
+            (
+                "django_payments_mollie.events.FileEventSink",
+                {"path": tmp_path / "events.jsonl"},
+            )
+        ],
+        **kwargs,
+    )
+
+
+@pytest.mark.parametrize("payment_intents", [False, True])
+def test_provider_get_form_records_status_change_event(
+    mocker, tmp_path, mollie_payment, payment_intents
+):
+    mocker.patch("django_payments_mollie.provider.Facade")
+    provider = _provider_with_events(tmp_path, payment_intents=payment_intents)
+    provider.facade.create_payment.return_value = mollie_payment
+    receiver = mocker.Mock()
+    status_changed.connect(receiver)
+
+    payment = PaymentFactory()
+    try:
+        with pytest.raises(RedirectNeeded):
+            provider.get_form(payment)
+    finally:
+        status_changed.disconnect(receiver)
+
+    event = PaymentEvent.objects.get()
+    assert event.previous_status == PaymentStatus.WAITING
+    assert event.status == PaymentStatus.INPUT
+    assert event.transaction_id == mollie_payment.id
+    receiver.assert_called_once()
+
+
+def test_provider_get_form_records_create_error_event(mocker, tmp_path):
+    mocker.patch("django_payments_mollie.provider.Facade")
+    provider = _provider_with_events(tmp_path)
+
+    def create_payment(payment, *args, **kwargs):
+        payment.change_status(PaymentStatus.ERROR, "refused")
+        raise PaymentError("Failed to create payment at Mollie")
+
+    provider.facade.create_payment.side_effect = create_payment
+
+    payment = PaymentFactory()
+    with pytest.raises(PaymentError):
+        provider.get_form(payment)
+
+    event = PaymentEvent.objects.get()
+    assert event.previous_status == PaymentStatus.WAITING
+    assert event.status == PaymentStatus.ERROR
+    assert event.message == "refused"
+
+
+def test_provider_update_from_mollie_sends_signal_after_commit(
+    mocker, tmp_path, facade
+):
+    provider = MollieProvider(
+        api_key="test_test",
+        event_sinks=[
+            (
+                "django_payments_mollie.events.FileEventSink",
+                {"path": tmp_path / "events.jsonl"},
+            )
+        ],
+    )
+    provider.facade.parse_payment_status.return_value = (
+        PaymentStatus.REJECTED,
+        "rejected",
+        {},
+    )
+    receiver = mocker.Mock(side_effect=RuntimeError("Receiver failed"))
+    status_changed.connect(receiver)
+
+    payment = PaymentFactory(submitted=True)
+    try:
+        with pytest.raises(RuntimeError):
+            provider.update_from_mollie(payment)
+    finally:
+        status_changed.disconnect(receiver)
+
+    # The failing receiver doesn't roll back the committed update
+    payment.refresh_from_db()
+    assert payment.status == PaymentStatus.REJECTED
+    assert PaymentEvent.objects.filter(payment_id=payment.id).exists()
+
+
+def test_provider_update_from_mollie_without_transaction(mocker, facade):
+    atomic = mocker.spy(transaction, "atomic")
+    provider = MollieProvider(api_key="test_test")
+    provider.facade.parse_payment_status.return_value = (
+        PaymentStatus.REJECTED,
+        "rejected",
+        {},
+    )
+
+    provider.update_from_mollie(PaymentFactory(submitted=True))
+
+    atomic.assert_not_called()
+
+
+def test_provider_process_data_without_event_sinks_records_no_events(mocker, facade):
+    provider = MollieProvider(api_key="test_test")
+    provider.facade.parse_payment_status.return_value = (
+        PaymentStatus.REJECTED,
+        "rejected",
+        {},
+    )
+
+    request = HttpRequest()
+    request.method = "POST"
+    provider.process_data(PaymentFactory(submitted=True), request)
+
+    assert not PaymentEvent.objects.exists()
+
+
+def test_provider_process_data_stale_update_does_not_regress_status(mocker, facade):
+    """A late Mollie response should not overwrite a concurrently saved update."""
+
+    provider = MollieProvider(api_key="test_test")
+    # Configure mock
+    provider.facade.parse_payment_status.return_value = (
+        "",
+        "",
+        {"extra_data": '{"status": "open"}'},
+    )
+
+    payment = PaymentFactory(submitted=True)
+    # A concurrent request confirms the payment, after our instance was loaded
+    get_payment_model().objects.filter(id=payment.id).update(
+        status=PaymentStatus.CONFIRMED, extra_data='{"status": "paid"}'
+    )
+    request = HttpRequest()
+    request.method = "GET"
+
+    result = provider.process_data(payment, request)
+
+    payment.refresh_from_db()
+    assert payment.status == PaymentStatus.CONFIRMED
+    assert payment.extra_data == '{"status": "paid"}', "Stale data was saved"
+    assert result.url == "https://example.com/failure"
+
+
+def test_provider_process_data_repeated_confirmation(mocker, facade):
+    """A repeated confirmation doesn't update the status or captured amount again."""
+
+    provider = MollieProvider(api_key="test_test")
+    # Configure mock
+    provider.facade.parse_payment_status.return_value = (
+        PaymentStatus.CONFIRMED,
+        "",
+        {"extra_data": '{"status": "paid"}'},
+    )
+
+    payment = PaymentFactory(submitted=True, total="47")
+    get_payment_model().objects.filter(id=payment.id).update(
+        status=PaymentStatus.CONFIRMED, captured_amount="13.37"
+    )
+    request = HttpRequest()
+    request.method = "GET"
+
+    result = provider.process_data(payment, request)
+
+    payment.refresh_from_db()
+    assert payment.status == PaymentStatus.CONFIRMED
+    assert payment.captured_amount == Decimal("13.37"), "Captured amount was updated"
+    assert payment.extra_data == '{"status": "paid"}', "Mollie data should be updated"
+    assert result.url == "https://example.com/success"
+
+
+@pytest.mark.parametrize(
+    "current_status, next_status, expected",
+    [
+        (PaymentStatus.WAITING, PaymentStatus.INPUT, True),
+        (PaymentStatus.INPUT, PaymentStatus.CONFIRMED, True),
+        (PaymentStatus.ERROR, PaymentStatus.CONFIRMED, True),
+        (PaymentStatus.CONFIRMED, PaymentStatus.REFUNDED, True),
+        (PaymentStatus.INPUT, PaymentStatus.INPUT, False),
+        (PaymentStatus.CONFIRMED, PaymentStatus.REJECTED, False),
+        (PaymentStatus.REJECTED, PaymentStatus.ERROR, False),
+        (PaymentStatus.CONFIRMED, PaymentStatus.INPUT, False),
+    ],
+)
+def test_provider_advance_payment_status(current_status, next_status, expected):
+    payment = PaymentFactory(status=current_status)
+
+    result = MollieProvider.advance_payment_status(payment, next_status, "message")
+
+    assert result == expected
+    payment.refresh_from_db()
+    assert payment.status == (next_status if expected else current_status)
+
+
+def test_provider_process_data_redirects_to_pending_page(mocker, facade):
+    provider = MollieProvider(api_key="test_test", pending_page=True)
+    provider.facade.parse_payment_status.return_value = ("", "", {})
+
+    payment = PaymentFactory(submitted=True)
+    request = HttpRequest()
+    request.method = "GET"
+    response = provider.process_data(payment, request)
+
+    assert isinstance(response, HttpResponseRedirect)
+    assert response.url == f"/mollie/pending/{payment.token}/"
+
+
+def test_provider_bulk_update_from_mollie(mocker, django_assert_num_queries):
+    mocker.patch("django_payments_mollie.provider.Facade")
+    provider = MollieProvider(api_key="test_test")
+    payments = [PaymentFactory(submitted=True) for _ in range(6)]
+    confirmed, rejected, first_open, second_open, unchanged, failed = payments
+    results = {
+        confirmed.id: (PaymentStatus.CONFIRMED, "", {"extra_data": "{}"}),
+        rejected.id: (PaymentStatus.REJECTED, "canceled", {"extra_data": "{}"}),
+        first_open.id: ("", "", {"extra_data": '{"id": 1}'}),
+        second_open.id: ("", "", {"extra_data": '{"id": 2}'}),
+        unchanged.id: ("", "", {"extra_data": unchanged.extra_data}),
+    }
+
+    def retrieve_payment(payment, embed):
+        if payment == failed:
+            raise PaymentError("Failed to retrieve payment at Mollie")
+        return payment.id
+
+    provider.facade.retrieve_payment.side_effect = retrieve_payment
+    provider.facade.parse_payment_status.side_effect = results.get
+    handler = mocker.Mock()
+    status_changed.connect(handler)
+
+    # The stored statuses are locked with one query, and every group of payments
+    # with the same status change is updated with one query, in a savepoint
+    with django_assert_num_queries(6):
+        result = provider.bulk_update_from_mollie(payments, max_workers=2)
+
+    status_changed.disconnect(handler)
+    assert result == {
+        "changed": [confirmed, rejected, first_open, second_open],
+        "unchanged": [unchanged],
+        "errors": [failed],
+    }
+    assert handler.call_count == 2
+
+    confirmed.refresh_from_db()
+    assert confirmed.status == PaymentStatus.CONFIRMED
+    assert confirmed.captured_amount == confirmed.total
+    rejected.refresh_from_db()
+    assert rejected.status == PaymentStatus.REJECTED
+    assert rejected.message == "canceled"
+    second_open.refresh_from_db()
+    assert second_open.extra_data == '{"id": 2}'
+
+
+def test_provider_bulk_update_from_mollie_keeps_concurrent_status_change(mocker):
+    mocker.patch("django_payments_mollie.provider.Facade")
+    provider = MollieProvider(api_key="test_test")
+    paid, open_payment = [PaymentFactory(submitted=True) for _ in range(2)]
+    results = {
+        paid.id: (PaymentStatus.CONFIRMED, "", {"extra_data": '{"status": "paid"}'}),
+        open_payment.id: ("", "", {"extra_data": '{"status": "open"}'}),
+    }
+    provider.facade.retrieve_payment.side_effect = lambda payment, embed: payment.id
+    provider.facade.parse_payment_status.side_effect = results.get
+    # A webhook confirms the open payment after both payments were loaded
+    MollieProvider.advance_payment_status(
+        get_payment_model().objects.get(id=open_payment.id),
+        PaymentStatus.CONFIRMED,
+        captured_amount=open_payment.total,
+        extra_data='{"status": "paid"}',
+    )
+
+    result = provider.bulk_update_from_mollie([paid, open_payment])
+
+    assert result["changed"] == [paid]
+    assert result["unchanged"] == [open_payment]
+    assert open_payment.status == PaymentStatus.CONFIRMED
+    open_payment.refresh_from_db()
+    assert open_payment.status == PaymentStatus.CONFIRMED
+    assert open_payment.captured_amount == open_payment.total
+    assert open_payment.extra_data == '{"status": "paid"}'
+    paid.refresh_from_db()
+    assert paid.status == PaymentStatus.CONFIRMED
+    assert paid.captured_amount == paid.total
+
+
+def test_provider_bulk_update_from_mollie_advances_concurrently_changed(mocker):
+    mocker.patch("django_payments_mollie.provider.Facade")
+    provider = MollieProvider(api_key="test_test")
+    payment = PaymentFactory(submitted=True)
+    provider.facade.parse_payment_status.return_value = (
+        PaymentStatus.CONFIRMED,
+        "",
+        {"extra_data": '{"status": "paid"}'},
+    )
+    handler = mocker.Mock()
+    status_changed.connect(handler)
+    # The payment was loaded before it was moved to preauth
+    MollieProvider.update_payment_status(
+        get_payment_model().objects.get(id=payment.id), PaymentStatus.PREAUTH
+    )
+
+    result = provider.bulk_update_from_mollie([payment])
+
+    status_changed.disconnect(handler)
+    assert result["changed"] == [payment]
+    handler.assert_called_once()
+    payment.refresh_from_db()
+    assert payment.status == PaymentStatus.CONFIRMED
+    assert payment.captured_amount == payment.total
+
+
+def test_provider_bulk_update_from_mollie_keeps_newer_status(mocker):
+    mocker.patch("django_payments_mollie.provider.Facade")
+    provider = MollieProvider(api_key="test_test")
+    payment = PaymentFactory(status=PaymentStatus.CONFIRMED, transaction_id="tr_1")
+    provider.facade.parse_payment_status.return_value = (
+        PaymentStatus.ERROR,
+        "unexpected",
+        {"extra_data": payment.extra_data},
+    )
+
+    result = provider.bulk_update_from_mollie([payment])
+
+    assert result["unchanged"] == [payment]
+    payment.refresh_from_db()
+    assert payment.status == PaymentStatus.CONFIRMED
+
+
+def test_provider_process_data_debounces_webhooks(
+    mocker, facade, django_capture_on_commit_callbacks
+):
+    debounce = mocker.patch(
+        "django_payments_mollie.provider.WebhookDebouncer.debounce",
+        return_value=False,
+    )
+    schedule_in_thread = mocker.patch(
+        "django_payments_mollie.workers.schedule_in_thread"
+    )
+    provider = MollieProvider(api_key="test_test", webhook_debounce=2)
+    provider.facade.parse_payment_status.return_value = ("", "", {})
+
+    payment = PaymentFactory(submitted=True)
+    request = HttpRequest()
+    request.method = "POST"
+    response = provider.process_data(payment, request)
+
+    assert response.content == b"webhook processed"
+    debounce.assert_called_once_with("tr_12345", mocker.ANY, mocker.ANY)
+    provider.facade.retrieve_payment.assert_not_called()
+
+    # The debounced function updates the payment
+    debounce.call_args.args[1]()
+    provider.facade.retrieve_payment.assert_called_once_with(payment, embed=[])
+
+    # The trailing call is stored, and made after the window
+    trailing_call = mocker.Mock()
+    with django_capture_on_commit_callbacks(execute=True):
+        debounce.call_args.args[2](2, trailing_call)
+    task = WebhookTask.objects.get()
+    assert task.payment_id == payment.id
+    assert task.leased_until > timezone.now() + timedelta(seconds=2)
+    schedule_in_thread.assert_called_once_with(2, mocker.ANY)
+
+
+def test_provider_process_data_queues_webhook(
+    mocker, facade, django_capture_on_commit_callbacks
+):
+    provider = MollieProvider(api_key="test_test", webhook_workers=2)
+    provider.facade.parse_payment_status.return_value = (PaymentStatus.INPUT, "", {})
+    submit = mocker.patch.object(provider.webhook_queue.pool, "submit")
+
+    payment = PaymentFactory(submitted=True)
+    request = HttpRequest()
+    request.method = "POST"
+    with django_capture_on_commit_callbacks(execute=True):
+        response = provider.process_data(payment, request)
+
+    assert response.content == b"webhook processed"
+    submit.assert_called_once_with("tr_12345", mocker.ANY)
+    provider.facade.retrieve_payment.assert_not_called()
+    # The webhook is stored before Mollie gets a response
+    assert WebhookTask.objects.filter(payment_id=payment.id).exists()
+
+    # The worker updates the payment, and deletes the stored webhook
+    submit.call_args.args[1]()
+    provider.facade.retrieve_payment.assert_called_once_with(payment, embed=[])
+    assert not WebhookTask.objects.exists()
+
+
+def _refund_provider(mocker, **payment_data):
+    mocker.patch("django_payments_mollie.provider.Facade")
+    provider = MollieProvider(api_key="test_test", track_refunds=True)
+    provider.facade.retrieve_payment.return_value = MolliePayment(
+        {
+            "id": "tr_12345",
+            "status": "paid",
+            "paidAt": "2023-01-01T12:00:00+00:00",
+            "amount": {"currency": "EUR", "value": "20.00"},
+            **payment_data,
+        },
+        None,
+    )
+    provider.facade.parse_payment_status.side_effect = Facade.parse_payment_status
+    return provider
+
+
+def test_provider_update_from_mollie_tracks_refunds(mocker):
+    provider = _refund_provider(
+        mocker, amountRefunded={"currency": "EUR", "value": "5.00"}
+    )
+    provider.facade.iter_payment_refunds.return_value = [
+        Refund(
+            {
+                "id": "re_1",
+                "status": "refunded",
+                "amount": {"currency": "EUR", "value": "5.00"},
+            },
+            None,
+        )
+    ]
+    payment = PaymentFactory(submitted=True, total=Decimal("20.00"))
+
+    provider.update_from_mollie(payment)
+
+    # Only the refunds changed, so no chargebacks are retrieved
+    provider.facade.iter_payment_chargebacks.assert_not_called()
+    refund = PaymentRefund.objects.get()
+    assert (refund.payment_id, refund.mollie_id, refund.type, refund.amount) == (
+        payment.id,
+        "re_1",
+        PaymentRefund.TYPE_REFUND,
+        Decimal("5.00"),
+    )
+    payment.refresh_from_db()
+    assert payment.status == PaymentStatus.CONFIRMED
+    assert payment.captured_amount == Decimal("15.00")
+
+    # The refunds are unchanged on the next update
+    provider.update_from_mollie(payment)
+    provider.facade.iter_payment_refunds.assert_called_once()
+
+
+def test_provider_bulk_update_from_mollie_tracks_refunds(mocker):
+    provider = _refund_provider(
+        mocker, amountRefunded={"currency": "EUR", "value": "5.00"}
+    )
+    provider.facade.iter_payment_refunds.return_value = [
+        Refund(
+            {
+                "id": "re_1",
+                "status": "refunded",
+                "amount": {"currency": "EUR", "value": "5.00"},
+            },
+            None,
+        )
+    ]
+    payment = PaymentFactory(submitted=True, total=Decimal("20.00"))
+
+    result = provider.bulk_update_from_mollie([payment])
+
+    # The same update as update_from_mollie() makes
+    assert result["changed"] == [payment]
+    refund = PaymentRefund.objects.get()
+    assert (refund.payment_id, refund.mollie_id, refund.amount) == (
+        payment.id,
+        "re_1",
+        Decimal("5.00"),
+    )
+    payment.refresh_from_db()
+    assert payment.status == PaymentStatus.CONFIRMED
+    assert payment.captured_amount == Decimal("15.00")
+
+    # The same Mollie payment is skipped on the next update
+    metrics.skipped_updates.reset()
+    result = provider.bulk_update_from_mollie([payment])
+    assert result["unchanged"] == [payment]
+    assert metrics.skipped_updates.value == 1
+    provider.facade.iter_payment_refunds.assert_called_once()
+
+
+def test_provider_bulk_update_from_mollie_stores_checkout(mocker, mollie_payment):
+    mocker.patch("django_payments_mollie.provider.Facade")
+    provider = MollieProvider(api_key="test_test", track_checkouts=True)
+    mollie_payment["expiresAt"] = "2030-01-01T12:00:00+00:00"
+    provider.facade.retrieve_payment.return_value = mollie_payment
+    provider.facade.parse_payment_status.side_effect = Facade.parse_payment_status
+    payment = PaymentFactory(submitted=True, transaction_id=mollie_payment.id)
+
+    provider.bulk_update_from_mollie([payment])
+
+    checkout = PaymentCheckout.objects.get(payment_id=payment.id)
+    assert checkout.expires_at.isoformat() == "2030-01-01T12:00:00+00:00"
+
+
+def test_provider_update_from_mollie_embeds_refunds(mocker, mollie_payment):
+    mocker.patch("django_payments_mollie.provider.Facade")
+    provider = MollieProvider(
+        api_key="test_test", track_refunds=True, embed_refunds=True
+    )
+    provider.facade.retrieve_payment.return_value = mollie_payment
+    provider.facade.parse_payment_status.return_value = ("", "", {})
+    payment = PaymentFactory(submitted=True)
+
+    provider.update_from_mollie(payment)
+
+    provider.facade.retrieve_payment.assert_called_once_with(
+        payment, embed=["refunds", "chargebacks"]
+    )
+
+
+def test_provider_update_from_mollie_tracks_chargebacks(mocker):
+    provider = _refund_provider(
+        mocker, amountChargedBack={"currency": "EUR", "value": "20.00"}
+    )
+    provider.facade.iter_payment_chargebacks.return_value = [
+        Chargeback(
+            {"id": "chb_1", "amount": {"currency": "EUR", "value": "20.00"}}, None
+        ),
+        Chargeback(
+            {
+                "id": "chb_2",
+                "amount": {"currency": "EUR", "value": "20.00"},
+                "reversedAt": "2023-01-02T12:00:00+00:00",
+            },
+            None,
+        ),
+    ]
+    payment = PaymentFactory(
+        status=PaymentStatus.CONFIRMED, transaction_id="tr_1", total=Decimal("20.00")
+    )
+
+    provider.update_from_mollie(payment)
+
+    assert PaymentRefund.get_totals(payment.id) == {
+        PaymentRefund.TYPE_CHARGEBACK: Decimal("20.00")
+    }
+    payment.refresh_from_db()
+    assert payment.status == PaymentStatus.REFUNDED
+    assert payment.captured_amount == Decimal("0.00")
+
+
+def test_provider_update_from_mollie_skips_unchanged_payment(mocker, facade):
+    provider = MollieProvider(api_key="test_test")
+    provider.facade.parse_payment_status.return_value = (
+        PaymentStatus.CONFIRMED,
+        "",
+        {"extra_data": '{"id": "tr_12345", "status": "paid"}'},
+    )
+    handler = mocker.Mock()
+    status_changed.connect(handler)
+    metrics.skipped_updates.reset()
+
+    payment = PaymentFactory(submitted=True)
+    provider.update_from_mollie(payment)
+    assert metrics.skipped_updates.value == 0
+
+    # A repeated notification for the same payment writes nothing
+    update = mocker.spy(provider, "update_payment_if_status")
+    provider.update_from_mollie(payment)
+
+    status_changed.disconnect(handler)
+    assert metrics.skipped_updates.value == 1
+    assert handler.call_count == 1
+    update.assert_not_called()
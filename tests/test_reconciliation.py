@@ -0,0 +1,168 @@
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+from payments import PaymentError, PaymentStatus
+
+from django_payments_mollie.models import ReconciliationPartition
+from django_payments_mollie.reconciliation import PartitionedReconciliation
+
+from .factories import PaymentFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def _reconciliation(provider, worker_id, **kwargs):
+    return PartitionedReconciliation(
+        provider, "mollie", worker_id=worker_id, partition_size=10, **kwargs
+    )
+
+
+def test_reconciliation_candidates():
+    candidates = [
+        PaymentFactory(variant="mollie", submitted=True),
+        PaymentFactory(
+            variant="mollie", status=PaymentStatus.ERROR, transaction_id="x"
+        ),
+    ]
+    # Not a candidate: final, not submitted to Mollie or a different variant
+    PaymentFactory(variant="mollie", status=PaymentStatus.CONFIRMED, transaction_id="x")
+    PaymentFactory(variant="mollie")
+    PaymentFactory(variant="other", submitted=True)
+
+    reconciliation = _reconciliation(None, "worker")
+    assert list(reconciliation.get_candidates().order_by("id")) == candidates
+
+
+def test_reconciliation_create_partitions_aligned():
+    payments = [PaymentFactory(variant="mollie", submitted=True) for _ in range(3)]
+    # Spread the payment ids over several partitions
+    for index, payment in enumerate(payments):
+        PaymentFactory._meta.model.objects.filter(id=payment.id).update(
+            id=15 + index * 10
+        )
+
+    first = _reconciliation(None, "first")
+    second = _reconciliation(None, "second")
+    assert first.create_partitions() == 3
+    assert second.create_partitions() == 0, "The job already has partitions"
+
+    assert list(
+        ReconciliationPartition.objects.order_by("start_id").values_list(
+            "start_id", "end_id"
+        )
+    ) == [(10, 20), (20, 30), (30, 40)]
+
+
+def test_reconciliation_claim_partition_once():
+    PaymentFactory(variant="mollie", submitted=True)
+    first = _reconciliation(None, "first")
+    second = _reconciliation(None, "second")
+    first.create_partitions()
+
+    partition = first.claim_partition()
+    assert partition.owner == "first"
+    assert second.claim_partition() is None, "The partition is leased by 'first'"
+
+
+def test_reconciliation_reclaims_expired_lease():
+    PaymentFactory(variant="mollie", submitted=True)
+    crashed = _reconciliation(None, "crashed")
+    crashed.create_partitions()
+    partition = crashed.claim_partition()
+    ReconciliationPartition.objects.filter(id=partition.id).update(
+        leased_until=timezone.now() - timedelta(seconds=1)
+    )
+
+    second = _reconciliation(None, "second")
+    reclaimed = second.claim_partition()
+    assert reclaimed.id == partition.id
+    assert reclaimed.owner == "second"
+
+    assert not crashed.heartbeat(partition), "The crashed worker lost its lease"
+    assert second.heartbeat(reclaimed)
+
+
+def test_reconciliation_run(provider):
+    payments = [PaymentFactory(variant="mollie", submitted=True) for _ in range(3)]
+    provider.update_from_mollie.side_effect = [
+        None,
+        PaymentError("Failed to retrieve payment at Mollie", gateway_message="404"),
+        None,
+    ]
+
+    reconciliation = _reconciliation(provider, "worker")
+    assert reconciliation.run() == 3
+
+    assert [call.args[0] for call in provider.update_from_mollie.call_args_list] == (
+        payments
+    )
+    partitions = ReconciliationPartition.objects.all()
+    assert all(partition.completed_at for partition in partitions)
+    assert sum(partition.processed for partition in partitions) == 3
+
+    provider.update_from_mollie.side_effect = None
+    assert reconciliation.run() == 0, "A completed job should stay completed"
+    assert _reconciliation(provider, "late worker").run() == 0
+
+    assert reconciliation.restart() == 1
+    assert reconciliation.run() == 3, "A new run of the job should be started"
+
+
+def test_reconciliation_stops_when_lease_is_lost(provider, mocker):
+    for _ in range(3):
+        PaymentFactory(variant="mollie", submitted=True)
+    reconciliation = _reconciliation(
+        provider, "worker", lease_duration=timedelta(seconds=0)
+    )
+    mocker.patch.object(reconciliation, "heartbeat", return_value=False)
+
+    reconciliation.create_partitions()
+    partition = reconciliation.claim_partition()
+    assert reconciliation.reconcile_partition(partition) == 1
+
+    partition.refresh_from_db()
+    assert partition.completed_at is None
+
+
+def test_reconciliation_releases_failed_partition(provider):
+    PaymentFactory(variant="mollie", submitted=True)
+    provider.update_from_mollie.side_effect = ValueError("Unexpected")
+    reconciliation = _reconciliation(provider, "worker")
+
+    with pytest.raises(ValueError):
+        reconciliation.run()
+
+    partition = ReconciliationPartition.objects.get()
+    assert (partition.owner, partition.attempts) == ("", 1)
+    assert partition.last_error == "Unexpected"
+    assert partition.leased_until > timezone.now()
+    assert _reconciliation(provider, "second").claim_partition() is None
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_reconciliation_selects_candidates_in_read_database(provider):
+    payments = [PaymentFactory(variant="mollie", submitted=True) for _ in range(2)]
+    # Only the first payment is a candidate in the replica
+    payments[0].save(using="replica")
+    payments[1].status = PaymentStatus.CONFIRMED
+    payments[1].save(using="replica")
+
+    reconciliation = _reconciliation(provider, "worker", read_database="replica")
+    assert reconciliation.run() == 1
+
+    provider.update_from_mollie.assert_called_once_with(payments[0])
+    updated_payment = provider.update_from_mollie.call_args.args[0]
+    assert updated_payment._state.db == "default", "Updates use the default database"
+
+
+def test_reconciliation_updates_payments_with_provider(mollie_provider, facade):
+    payment = PaymentFactory(variant="mollie", submitted=True)
+    facade.parse_payment_status.return_value = (PaymentStatus.CONFIRMED, "", {})
+
+    assert _reconciliation(mollie_provider, "worker").run() == 1
+
+    payment.refresh_from_db()
+    assert payment.status == PaymentStatus.CONFIRMED
+    assert payment.captured_amount == payment.total
+    assert ReconciliationPartition.objects.get().completed_at is not None
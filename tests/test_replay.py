@@ -0,0 +1,167 @@
+import json
+from uuid import uuid4
+
+import pytest
+from payments import PaymentStatus
+from payments.signals import status_changed
+
+from django_payments_mollie.replay import WebhookReplay, is_same_decision, muted
+
+from .factories import PaymentFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def _payment(mollie_payment, status, mollie_status, **kwargs):
+    transaction_id = f"tr_{uuid4().hex[:10]}"
+    data = dict(mollie_payment, id=transaction_id, status=mollie_status)
+    if mollie_status == "paid":
+        data["paidAt"] = "2024-01-01T12:00:00+00:00"
+    return PaymentFactory(
+        variant="mollie",
+        status=status,
+        transaction_id=transaction_id,
+        extra_data=json.dumps(data),
+        **kwargs,
+    )
+
+
+@pytest.mark.parametrize(
+    "recorded, replayed, expected",
+    [
+        ((PaymentStatus.INPUT, ""), ("", ""), True),
+        ((PaymentStatus.CONFIRMED, ""), ("", ""), False),
+        ((PaymentStatus.CONFIRMED, ""), (PaymentStatus.CONFIRMED, ""), True),
+        ((PaymentStatus.REFUNDED, ""), (PaymentStatus.CONFIRMED, ""), True),
+        ((PaymentStatus.REJECTED, "a"), (PaymentStatus.REJECTED, "b"), False),
+    ],
+)
+def test_is_same_decision(recorded, replayed, expected):
+    assert is_same_decision(recorded, replayed) is expected
+
+
+@pytest.mark.parametrize("slim_payments", [True, False])
+def test_replay_reports_differences(settings, mollie_payment, slim_payments):
+    settings.PAYMENT_VARIANTS = {
+        "mollie": (
+            "django_payments_mollie.provider.MollieProvider",
+            {"api_key": "live_secret", "slim_payments": slim_payments},
+        )
+    }
+    _payment(mollie_payment, PaymentStatus.CONFIRMED, "paid")
+    _payment(mollie_payment, PaymentStatus.INPUT, "open")
+    changed = _payment(mollie_payment, PaymentStatus.CONFIRMED, "canceled")
+    PaymentFactory(variant="mollie", transaction_id="tr_12345")
+
+    report = WebhookReplay("mollie", batch_size=2).run()
+
+    assert report["payments"] == 3
+    assert report["errors"] == []
+    assert report["differences"] == [
+        {
+            "payment_id": changed.id,
+            "transaction_id": changed.transaction_id,
+            "stage": "parse",
+            "recorded": (PaymentStatus.CONFIRMED, ""),
+            "replayed": (
+                PaymentStatus.REJECTED,
+                "Mollie payment failed with status 'canceled'",
+            ),
+        }
+    ]
+    assert set(report["durations"]) == {"parse"}
+
+
+def test_replay_oauth_variant(settings, mocker, mollie_payment):
+    settings.PAYMENT_VARIANTS = {
+        "mollie": (
+            "django_payments_mollie.provider.MollieProvider",
+            {
+                "client_id": "app_client",
+                "client_secret": "client_secret",
+                "refresh_token_loader": "tests.test_provider.get_refresh_token",
+                "tenant_resolver": "tests.test_provider.get_tenant",
+            },
+        )
+    }
+    get_access_token = mocker.patch(
+        "django_payments_mollie.tokens.TenantTokenManager.get_access_token"
+    )
+    _payment(mollie_payment, PaymentStatus.CONFIRMED, "paid")
+
+    report = WebhookReplay("mollie", process_data=True).run()
+
+    assert report["payments"] == 1
+    assert report["differences"] == []
+    assert report["errors"] == []
+    # All tenants are replayed from the transport, without access tokens
+    get_access_token.assert_not_called()
+
+
+def test_replay_reports_errors(mollie_payment):
+    payment = PaymentFactory(
+        variant="mollie", transaction_id=mollie_payment["id"], extra_data="not json"
+    )
+
+    report = WebhookReplay("mollie").run()
+
+    assert report["differences"] == []
+    assert [error["payment_id"] for error in report["errors"]] == [payment.id]
+
+
+def test_replay_process_data_rolls_back(mollie_payment):
+    payment = _payment(
+        mollie_payment,
+        PaymentStatus.REJECTED,
+        "expired",
+        message="Mollie payment failed with status 'expired'",
+    )
+
+    report = WebhookReplay("mollie", process_data=True).run()
+
+    assert report["differences"] == []
+    assert report["errors"] == []
+    assert set(report["durations"]) == {"parse", "process_data"}
+    stored_payment = type(payment).objects.get(id=payment.id)
+    assert stored_payment.status == PaymentStatus.REJECTED
+    assert stored_payment.extra_data == payment.extra_data
+
+
+@pytest.mark.parametrize("allow_signals", [False, True])
+def test_replay_process_data_signals(mocker, mollie_payment, allow_signals):
+    _payment(
+        mollie_payment,
+        PaymentStatus.REJECTED,
+        "expired",
+        message="Mollie payment failed with status 'expired'",
+    )
+    receiver = mocker.Mock()
+    status_changed.connect(receiver)
+    try:
+        WebhookReplay("mollie", process_data=True, allow_signals=allow_signals).run()
+
+        assert receiver.called == allow_signals
+        # The receivers are connected again after the replay
+        status_changed.send(sender=None, instance=None)
+        assert receiver.called
+    finally:
+        status_changed.disconnect(receiver)
+
+
+def test_muted_signal(mocker):
+    receiver = mocker.Mock()
+    status_changed.connect(receiver)
+    try:
+        with muted(status_changed):
+            status_changed.send(sender=None, instance=None)
+        receiver.assert_not_called()
+    finally:
+        status_changed.disconnect(receiver)
+
+
+def test_replay_stops_at_limit(mollie_payment):
+    for _ in range(3):
+        _payment(mollie_payment, PaymentStatus.CONFIRMED, "paid")
+
+    assert WebhookReplay("mollie", batch_size=2, limit=3).run()["payments"] == 3
+    assert WebhookReplay("mollie", batch_size=2, limit=1).run()["payments"] == 1
@@ -0,0 +1,130 @@
+import json
+import threading
+
+import pytest
+
+from django_payments_mollie.streaming import (
+    ListStreamError,
+    ListStreamParser,
+    iter_list_stream,
+)
+
+PAGE = {
+    "count": 3,
+    "_embedded": {
+        "payments": [
+            {"id": "tr_1", "amount": {"currency": "EUR", "value": "10.00"}},
+            {"id": "tr_2", "description": 'Bestelling €12 [2/3] {"x"}'},
+            {"id": "tr_3", "metadata": {"nested": [1, 2.5, None, True]}},
+        ],
+        "other": [{"id": "ignored"}],
+    },
+    "_links": {
+        "next": {"href": "https://api.mollie.com/v2/payments?from=tr_4&limit=3"},
+        "self": {"href": "https://api.mollie.com/v2/payments?limit=3"},
+    },
+}
+
+
+def _chunks(data, size):
+    body = json.dumps(data, ensure_ascii=False, indent=1).encode()
+    return [body[start:][:size] for start in range(0, len(body), size)]
+
+
+def _parse(chunks, object_name="payments"):
+    parser = ListStreamParser(object_name)
+    items = []
+    for chunk in chunks:
+        items.extend(parser.feed(chunk))
+    items.extend(parser.close())
+    return items, parser
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 100000])
+def test_parser_yields_items_of_any_chunk_size(chunk_size):
+    items, parser = _parse(_chunks(PAGE, chunk_size))
+
+    assert items == PAGE["_embedded"]["payments"]
+    assert parser.next_url == PAGE["_links"]["next"]["href"]
+
+
+def test_parser_yields_items_before_the_response_is_complete():
+    body = json.dumps(PAGE).encode()
+    parser = ListStreamParser("payments")
+
+    first_item_end = body.index(b"}}") + 2
+    assert list(parser.feed(body[:first_item_end])) == [
+        PAGE["_embedded"]["payments"][0]
+    ]
+    assert len(list(parser.feed(body[first_item_end:]))) == 2
+    assert list(parser.close()) == []
+
+
+def test_parser_without_next_page():
+    page = {"_links": {"next": None}, "count": 0, "_embedded": {"payments": []}}
+
+    items, parser = _parse(_chunks(page, 3))
+
+    assert items == []
+    assert parser.next_url is None
+
+
+@pytest.mark.parametrize("body", [b'{"_embedded": {"payments": [{"id"', b"[]", b""])
+def test_parser_invalid_response(body):
+    with pytest.raises(ListStreamError):
+        _parse([body])
+
+
+def _pages(*pages):
+    """Fetch the pages by URL, and record the requests."""
+    requests = []
+
+    def fetch(url, params):
+        requests.append((url, params))
+        return _chunks(pages[len(requests) - 1], 16)
+
+    return fetch, requests
+
+
+def test_iter_list_stream_chains_pages():
+    last_page = {"_embedded": {"payments": [{"id": "tr_4"}]}, "_links": {}}
+    fetch, requests = _pages(PAGE, last_page)
+
+    items = iter_list_stream(fetch, "payments", {"limit": 3}, "payments")
+
+    assert next(items) == PAGE["_embedded"]["payments"][0]
+    assert [item["id"] for item in items] == ["tr_2", "tr_3", "tr_4"]
+    assert requests == [
+        ("payments", {"limit": 3}),
+        (PAGE["_links"]["next"]["href"], None),
+    ]
+
+
+def test_iter_list_stream_raises_fetch_errors():
+    def fetch(url, params):
+        yield b'{"_embedded": {"payments": [{"id": "tr_1"},'
+        raise ConnectionError("Connection reset")
+
+    items = iter_list_stream(fetch, "payments", {}, "payments")
+
+    assert next(items) == {"id": "tr_1"}
+    with pytest.raises(ConnectionError):
+        next(items)
+
+
+def test_iter_list_stream_stops_producer_when_iteration_stops():
+    closed = threading.Event()
+
+    def fetch(url, params):
+        try:
+            yield b'{"_embedded": {"payments": ['
+            while True:
+                yield b'{"id": "tr_1"},'
+        finally:
+            closed.set()
+
+    items = iter_list_stream(fetch, "payments", {}, "payments")
+    assert next(items) == {"id": "tr_1"}
+    items.close()
+
+    assert closed.wait(timeout=5)
@@ -0,0 +1,105 @@
+import time
+
+import pytest
+import requests
+from django.core.cache import cache
+from payments import PaymentError
+
+from django_payments_mollie.tokens import TenantTokenManager
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def token_post(mocker):
+    post = mocker.patch("django_payments_mollie.tokens.requests.post")
+    post.return_value.json.return_value = {
+        "access_token": "access_new",
+        "refresh_token": "refresh_tenant",
+        "expires_in": 3600,
+        "token_type": "bearer",
+    }
+    return post
+
+
+@pytest.fixture
+def manager():
+    return TenantTokenManager(
+        "app_client", "client_secret", lambda tenant: f"refresh_{tenant}"
+    )
+
+
+def test_token_manager_requests_token_when_none_is_cached(manager, token_post):
+    assert manager.get_access_token("tenant") == "access_new"
+
+    token_post.assert_called_once_with(
+        "https://api.mollie.com/oauth2/tokens",
+        data={"grant_type": "refresh_token", "refresh_token": "refresh_tenant"},
+        auth=("app_client", "client_secret"),
+        timeout=(2, 10),
+    )
+    token = cache.get("django_payments_mollie:token:app_client:tenant")
+    assert token["access_token"] == "access_new"
+    assert token["expires_at"] == pytest.approx(time.time() + 3600, abs=5)
+
+
+def test_token_manager_uses_cached_token(manager, token_post):
+    cache.set(
+        "django_payments_mollie:token:app_client:tenant",
+        {"access_token": "access_cached", "expires_at": time.time() + 3000},
+    )
+
+    assert manager.get_access_token("tenant") == "access_cached"
+    token_post.assert_not_called()
+
+
+def test_token_manager_refreshes_expiring_token_in_background(
+    manager, token_post, mocker
+):
+    cache.set(
+        "django_payments_mollie:token:app_client:tenant",
+        {"access_token": "access_expiring", "expires_at": time.time() + 60},
+    )
+    schedule_refresh = mocker.spy(manager, "schedule_refresh")
+
+    # The current token is used, while a new token is requested
+    assert manager.get_access_token("tenant") == "access_expiring"
+    future = schedule_refresh.spy_return
+    assert future.result(timeout=5)["access_token"] == "access_new"
+
+    assert manager.get_access_token("tenant") == "access_new"
+    assert token_post.call_count == 1
+    assert not cache.get("django_payments_mollie:token:app_client:tenant:refresh")
+
+
+def test_token_manager_refreshes_once_across_workers(manager, token_post):
+    cache.add("django_payments_mollie:token:app_client:tenant:refresh", True)
+
+    assert manager.schedule_refresh("tenant") is None, "Another worker refreshes"
+    token_post.assert_not_called()
+
+
+def test_token_manager_refresh_error(manager, token_post):
+    token_post.return_value.raise_for_status.side_effect = requests.HTTPError(
+        "401 Client Error: Unauthorized"
+    )
+
+    with pytest.raises(PaymentError) as excinfo:
+        manager.get_access_token("tenant")
+
+    assert str(excinfo.value) == "Failed to refresh Mollie access token"
+    assert str(excinfo.value.gateway_message) == "401 Client Error: Unauthorized"
+
+    cache.set(
+        "django_payments_mollie:token:app_client:tenant",
+        {"access_token": "access_expiring", "expires_at": time.time() + 60},
+    )
+    future = manager.schedule_refresh("tenant")
+    with pytest.raises(PaymentError):
+        future.result(timeout=5)
+    assert not cache.get("django_payments_mollie:token:app_client:tenant:refresh")
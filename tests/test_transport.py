@@ -0,0 +1,160 @@
+import json
+
+import pytest
+import requests
+from django.core.exceptions import ImproperlyConfigured
+from mollie.api.objects.payment import Payment as MolliePayment
+from payments import PaymentError
+
+from django_payments_mollie.facade import Facade
+from django_payments_mollie.objects import SlimMolliePayment
+from django_payments_mollie.provider import MollieProvider
+from django_payments_mollie.transport import (
+    BaseTransport,
+    HTTPXTransport,
+    RecordReplayTransport,
+    RequestsTransport,
+)
+
+from .factories import PaymentFactory
+
+pytestmark = pytest.mark.django_db
+
+PAYMENT_URL = "https://api.mollie.com/v2/payments/tr_12345"
+
+
+@pytest.fixture
+def replay_transport(mollie_payment):
+    transport = RecordReplayTransport()
+    transport.add_response("GET", PAYMENT_URL, dict(mollie_payment, id="tr_12345"))
+    return transport
+
+
+@pytest.mark.parametrize("slim_payments", [True, False])
+def test_facade_retrieve_payment_over_replay_transport(replay_transport, slim_payments):
+    facade = Facade(slim_payments=slim_payments, transport=replay_transport)
+    facade.setup_with_api_key("test_test")
+
+    payment = PaymentFactory(submitted=True)
+    mollie_payment = facade.retrieve_payment(payment)
+
+    assert isinstance(
+        mollie_payment, SlimMolliePayment if slim_payments else MolliePayment
+    )
+    assert mollie_payment.id == "tr_12345"
+    status, _, _ = facade.parse_payment_status(mollie_payment)
+    assert status == ""
+
+
+def test_replay_transport_missing_response(replay_transport):
+    facade = Facade(transport=replay_transport)
+    facade.setup_with_api_key("test_test")
+
+    payment = PaymentFactory(transaction_id="tr_unknown")
+    with pytest.raises(PaymentError) as excinfo:
+        facade.retrieve_payment(payment)
+
+    assert str(excinfo.value.gateway_message) == (
+        "Unable to communicate with Mollie: No recorded response for "
+        "GET https://api.mollie.com/v2/payments/tr_unknown"
+    )
+
+
+def test_replay_transport_replays_in_order():
+    transport = RecordReplayTransport()
+    transport.add_response("GET", PAYMENT_URL, {"status": "open"})
+    transport.add_response("GET", PAYMENT_URL, {"status": "paid"})
+
+    statuses = [transport.request("GET", PAYMENT_URL).json()["status"] for _ in "123"]
+
+    assert statuses == ["open", "paid", "paid"], "The last response is repeated"
+
+
+def test_record_transport_saves_cassette(mocker, tmp_path):
+    cassette = tmp_path / "cassette.json"
+    inner = mocker.Mock()
+    inner.request.return_value.status_code = 201
+    inner.request.return_value.text = '{"id": "tr_12345"}'
+    inner.request.return_value.headers = {"Content-Type": "application/hal+json"}
+
+    recorder = RecordReplayTransport(cassette, mode="record", inner=inner)
+    response = recorder.request(
+        "POST", "https://api.mollie.com/v2/payments", data='{"amount": {}}', timeout=5
+    )
+
+    inner.request.assert_called_once_with(
+        "POST",
+        "https://api.mollie.com/v2/payments",
+        headers=None,
+        data='{"amount": {}}',
+        timeout=5,
+    )
+    assert response.status_code == 201
+    assert response.json() == {"id": "tr_12345"}
+
+    replayer = RecordReplayTransport(cassette)
+    replayed = replayer.request("POST", "https://api.mollie.com/v2/payments")
+    assert replayed.status_code == 201
+    assert replayed.content == b'{"id": "tr_12345"}'
+    assert replayed.headers["content-type"] == "application/hal+json"
+    assert json.loads(cassette.read_text())[0]["url"] == (
+        "https://api.mollie.com/v2/payments"
+    )
+
+
+def test_record_replay_transport_unknown_mode():
+    with pytest.raises(ImproperlyConfigured):
+        RecordReplayTransport(mode="rewind")
+
+
+def test_base_transport_requires_request():
+    class IncompleteTransport(BaseTransport):
+        pass
+
+    with pytest.raises(TypeError):
+        IncompleteTransport()
+
+
+def test_requests_transport_pool_size():
+    transport = RequestsTransport(pool_maxsize=50)
+
+    adapter = transport.get_adapter("https://api.mollie.com/")
+    assert adapter._pool_maxsize == 50
+    assert adapter.max_retries.connect == 3
+
+
+def test_httpx_transport():
+    httpx = pytest.importorskip("httpx")
+
+    transport = HTTPXTransport(http2=False)
+    transport.client = httpx.Client(
+        transport=httpx.MockTransport(
+            lambda request: httpx.Response(200, json={"timeout": request.extensions})
+        )
+    )
+
+    response = transport.request("GET", PAYMENT_URL, timeout=(2, 10))
+    assert response.status_code == 200
+    assert response.json()["timeout"]["timeout"]["connect"] == 2
+    assert response.json()["timeout"]["timeout"]["read"] == 10
+
+    transport.client = httpx.Client(transport=httpx.MockTransport(_raise_connect_error))
+    with pytest.raises(requests.exceptions.ConnectionError):
+        transport.request("GET", PAYMENT_URL)
+    transport.close()
+
+
+def _raise_connect_error(request):
+    import httpx
+
+    raise httpx.ConnectError("Connection refused", request=request)
+
+
+def test_provider_configures_transport():
+    provider = MollieProvider(
+        api_key="test_test",
+        transport="django_payments_mollie.transport.RequestsTransport",
+        transport_options={"pool_maxsize": 25},
+    )
+
+    assert isinstance(provider.facade.client._client, RequestsTransport)
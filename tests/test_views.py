@@ -0,0 +1,181 @@
+import json
+
+import pytest
+from django.urls import reverse
+from payments import PaymentStatus
+
+from django_payments_mollie.provider import MollieProvider
+from django_payments_mollie.views import PaymentStatusMixin
+
+from .factories import PaymentFactory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(mocker):
+    return mocker.patch("django_payments_mollie.views.time.sleep")
+
+
+def _url(name, payment):
+    return reverse(f"django_payments_mollie:{name}", kwargs={"token": payment.token})
+
+
+def test_pending_view_renders_page(client):
+    payment = PaymentFactory(submitted=True)
+
+    response = client.get(_url("payment-pending", payment))
+
+    assert response.status_code == 200
+    assert _url("payment-status", payment).encode() in response.content
+    assert _url("payment-status-stream", payment).encode() not in response.content
+    assert b'<meta http-equiv="refresh" content="2">' in response.content
+    assert b"var pollInterval = 2000;" in response.content
+
+
+def test_pending_view_options(client, mocker):
+    payment = PaymentFactory(variant="mollie", submitted=True)
+    provider = MollieProvider(
+        api_key="test_test", pending_poll_interval=0.5, pending_stream=True
+    )
+    mocker.patch("payments.core.PROVIDER_CACHE", {"mollie": provider}, create=True)
+
+    response = client.get(_url("payment-pending", payment))
+
+    assert _url("payment-status-stream", payment).encode() in response.content
+    assert b'<meta http-equiv="refresh" content="1">' in response.content
+    assert b"var pollInterval = 500;" in response.content
+
+
+@pytest.mark.parametrize(
+    "status, expected_url",
+    [
+        (PaymentStatus.CONFIRMED, "https://example.com/success"),
+        (PaymentStatus.REJECTED, "https://example.com/failure"),
+    ],
+)
+def test_pending_view_redirects_final_payments(client, status, expected_url):
+    payment = PaymentFactory(status=status)
+
+    response = client.get(_url("payment-pending", payment))
+
+    assert response.status_code == 302
+    assert response.url == expected_url
+
+
+def test_pending_view_unknown_token(client):
+    response = client.get(
+        reverse("django_payments_mollie:payment-pending", kwargs={"token": "x"})
+    )
+    assert response.status_code == 404
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_status_view_polls_read_database(client, mocker):
+    mocker.patch(
+        "django_payments_mollie.views.provider_factory",
+        return_value=MollieProvider(api_key="test_test", read_database="replica"),
+    )
+    payment = PaymentFactory(variant="mollie", submitted=True)
+    # The replica has a different status, to check which database is polled
+    payment.status = PaymentStatus.CONFIRMED
+    payment.save(using="replica")
+
+    response = client.get(_url("payment-status", payment))
+
+    assert response.json()["status"] == PaymentStatus.CONFIRMED
+
+
+def test_status_view_waits_for_status_change(client, mocker):
+    payment = PaymentFactory(submitted=True)
+    get_status = mocker.patch.object(
+        PaymentStatusMixin,
+        "get_status",
+        side_effect=[PaymentStatus.INPUT, PaymentStatus.CONFIRMED],
+    )
+
+    response = client.get(_url("payment-status", payment), {"status": "input"})
+
+    assert response.json() == {
+        "status": PaymentStatus.CONFIRMED,
+        "redirect_url": "https://example.com/success",
+    }
+    assert get_status.call_count == 2
+
+
+def test_status_view_returns_changed_status_immediately(client, mocker):
+    payment = PaymentFactory(status=PaymentStatus.REJECTED)
+    get_status = mocker.patch.object(PaymentStatusMixin, "get_status")
+
+    response = client.get(_url("payment-status", payment), {"status": "input"})
+
+    assert response.json()["redirect_url"] == "https://example.com/failure"
+    get_status.assert_not_called()
+
+
+def test_status_view_default_timeout(client, mocker):
+    payment = PaymentFactory(submitted=True)
+    wait_for_status_change = mocker.spy(PaymentStatusMixin, "wait_for_status_change")
+
+    client.get(_url("payment-status", payment))
+
+    assert wait_for_status_change.call_args.args[3] == 2
+
+
+def test_status_view_timeout(client, mocker):
+    payment = PaymentFactory(variant="mollie", submitted=True)
+    provider = MollieProvider(api_key="test_test", pending_poll_timeout=0)
+    mocker.patch("payments.core.PROVIDER_CACHE", {"mollie": provider}, create=True)
+    wait_for_status_change = mocker.spy(PaymentStatusMixin, "wait_for_status_change")
+
+    response = client.get(_url("payment-status", payment))
+
+    assert response.json() == {"status": PaymentStatus.INPUT, "redirect_url": None}
+    assert wait_for_status_change.call_args.args[3] == 0
+
+
+def test_status_stream_view(client, mocker):
+    payment = PaymentFactory(submitted=True)
+    mocker.patch.object(
+        PaymentStatusMixin,
+        "get_status",
+        side_effect=[PaymentStatus.INPUT, PaymentStatus.CONFIRMED],
+    )
+
+    response = client.get(_url("payment-status-stream", payment))
+
+    assert response["Content-Type"] == "text/event-stream"
+    events = [
+        json.loads(event.partition("data: ")[2])
+        for event in b"".join(response.streaming_content).decode().split("\n\n")
+        if event
+    ]
+    assert [event["status"] for event in events] == [
+        PaymentStatus.INPUT,
+        PaymentStatus.CONFIRMED,
+    ]
+
+
+def test_status_stream_view_ends_after_duration(client, mocker):
+    payment = PaymentFactory(variant="mollie", submitted=True)
+    provider = MollieProvider(api_key="test_test", pending_stream_duration=0)
+    mocker.patch("payments.core.PROVIDER_CACHE", {"mollie": provider}, create=True)
+
+    response = client.get(_url("payment-status-stream", payment))
+
+    assert b"".join(response.streaming_content).count(b"data: ") == 1
+
+
+def test_webhook_workers_view(client, admin_user, mocker):
+    provider = MollieProvider(api_key="test_test", webhook_workers=2)
+    mocker.patch("payments.core.PROVIDER_CACHE", {"mollie": provider}, create=True)
+    url = reverse("django_payments_mollie:webhook-workers")
+
+    assert client.get(url).status_code == 302, "Anonymous users are redirected"
+
+    client.force_login(admin_user)
+    response = client.get(url)
+    assert [shard["queue_depth"] for shard in response.json()["pools"]["mollie"]] == [
+        0,
+        0,
+    ]
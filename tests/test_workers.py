@@ -0,0 +1,221 @@
+import threading
+from datetime import timedelta
+
+import pytest
+from django.db import transaction
+from django.utils import timezone
+from payments import PaymentError
+
+from django_payments_mollie.models import WebhookTask
+from django_payments_mollie.workers import ShardedWorkerPool, WebhookQueue
+
+from .factories import PaymentFactory, WebhookTaskFactory
+
+
+def test_pool_processes_tasks_per_key_in_order():
+    pool = ShardedWorkerPool(shards=4)
+    results = {key: [] for key in ["tr_1", "tr_2", "tr_3"]}
+    for index in range(20):
+        for key, processed in results.items():
+            pool.submit(
+                key, lambda processed=processed, index=index: processed.append(index)
+            )
+    pool.join()
+    pool.shutdown()
+
+    assert all(processed == list(range(20)) for processed in results.values())
+    assert sum(stats["processed"] for stats in pool.get_stats()) == 60
+
+
+def test_pool_assigns_key_to_one_shard():
+    pool = ShardedWorkerPool(shards=8)
+
+    assert pool.get_shard("tr_12345") == pool.get_shard("tr_12345")
+    assert len({pool.get_shard(f"tr_{index}") for index in range(100)}) == 8
+
+
+def test_pool_stats_show_queue_depth_and_lag():
+    pool = ShardedWorkerPool(shards=2)
+    started = threading.Event()
+    blocked = threading.Event()
+
+    def block():
+        started.set()
+        blocked.wait()
+
+    shard = pool.submit("tr_1", block)
+    started.wait()
+    pool.submit("tr_1", lambda: None)
+    pool.submit("tr_1", lambda: None)
+
+    stats = pool.get_stats()[shard]
+    blocked.set()
+    pool.join()
+    pool.shutdown()
+
+    assert stats["queue_depth"] == 2
+    assert stats["lag"] > 0
+    assert pool.get_stats()[shard] == {
+        "shard": shard,
+        "queue_depth": 0,
+        "lag": 0.0,
+        "processed": 3,
+    }
+
+
+def test_pool_continues_after_failed_task(caplog):
+    pool = ShardedWorkerPool(shards=1)
+    processed = []
+
+    pool.submit("tr_1", lambda: 1 / 0)
+    pool.submit("tr_1", lambda: processed.append(True))
+    pool.join()
+    pool.shutdown()
+
+    assert processed == [True]
+    assert "Task in shard 0 of mollie-worker failed" in caplog.text
+
+
+@pytest.fixture
+def webhook_queue(mocker):
+    webhook_queue = WebhookQueue(mocker.Mock())
+    mocker.patch.object(webhook_queue.pool, "submit")
+    return webhook_queue
+
+
+@pytest.mark.django_db
+def test_webhook_queue_stores_task_until_processed(
+    mocker, webhook_queue, django_capture_on_commit_callbacks
+):
+    payment = PaymentFactory(submitted=True)
+    func = mocker.Mock()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        task = webhook_queue.enqueue(payment, func)
+
+    assert task.owner == webhook_queue.owner
+    assert task.leased_until > timezone.now()
+    webhook_queue.pool.submit.assert_called_once_with("tr_12345", mocker.ANY)
+
+    webhook_queue.pool.submit.call_args.args[1]()
+    func.assert_called_once_with()
+    assert not WebhookTask.objects.exists()
+
+
+@pytest.mark.django_db
+def test_webhook_queue_delays_task_in_timer(
+    mocker, webhook_queue, django_capture_on_commit_callbacks
+):
+    schedule_in_thread = mocker.patch(
+        "django_payments_mollie.workers.schedule_in_thread"
+    )
+    payment = PaymentFactory(submitted=True)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        task = webhook_queue.enqueue(payment, mocker.Mock(), delay=10)
+
+    assert task.leased_until > timezone.now() + timedelta(seconds=10)
+    webhook_queue.pool.submit.assert_not_called()
+    schedule_in_thread.assert_called_once_with(10, mocker.ANY)
+    schedule_in_thread.call_args.args[1]()
+    webhook_queue.pool.submit.assert_called_once_with("tr_12345", mocker.ANY)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_webhook_queue_waits_for_commit(mocker, webhook_queue):
+    schedule_in_thread = mocker.patch(
+        "django_payments_mollie.workers.schedule_in_thread"
+    )
+    payment = PaymentFactory(submitted=True)
+    func = mocker.Mock()
+
+    # Like a request with `ATOMIC_REQUESTS`
+    with transaction.atomic():
+        task = webhook_queue.enqueue(payment, func)
+        webhook_queue.enqueue(payment, mocker.Mock(), delay=10)
+        webhook_queue.pool.submit.assert_not_called()
+        schedule_in_thread.assert_not_called()
+
+    webhook_queue.pool.submit.assert_called_once_with("tr_12345", mocker.ANY)
+    schedule_in_thread.assert_called_once_with(10, mocker.ANY)
+    # The committed task is processed, instead of waiting for its lease to expire
+    webhook_queue.pool.submit.call_args.args[1]()
+    func.assert_called_once_with()
+    assert not WebhookTask.objects.filter(id=task.id).exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_webhook_queue_drops_rolled_back_task(mocker, webhook_queue):
+    payment = PaymentFactory(submitted=True)
+
+    with pytest.raises(ValueError), transaction.atomic():
+        webhook_queue.enqueue(payment, mocker.Mock())
+        raise ValueError("Request failed")
+
+    webhook_queue.pool.submit.assert_not_called()
+    assert not WebhookTask.objects.exists()
+
+
+@pytest.mark.django_db
+def test_webhook_queue_releases_failed_task(mocker, webhook_queue):
+    payment = PaymentFactory(submitted=True)
+    func = mocker.Mock(side_effect=ValueError("Oops"))
+    task = webhook_queue.enqueue(payment, func)
+
+    with pytest.raises(ValueError):
+        webhook_queue.run_task(task, func)
+
+    task.refresh_from_db()
+    assert task.owner == ""
+    assert task.attempts == 1
+    assert task.leased_until > timezone.now()
+
+
+@pytest.mark.django_db
+def test_webhook_queue_skips_task_taken_over(mocker, webhook_queue):
+    payment = PaymentFactory(submitted=True)
+    task = webhook_queue.enqueue(payment, mocker.Mock())
+    WebhookTask.objects.filter(id=task.id).update(owner="other")
+    func = mocker.Mock()
+
+    assert not webhook_queue.run_task(task, func)
+
+    func.assert_not_called()
+    assert WebhookTask.objects.filter(id=task.id).exists()
+
+
+@pytest.mark.django_db
+def test_webhook_queue_process_pending(mocker):
+    process = mocker.Mock()
+    webhook_queue = WebhookQueue(process)
+    payment, failing = [PaymentFactory(submitted=True) for _ in range(2)]
+    expired = timezone.now() - timedelta(seconds=1)
+    left_behind = [
+        WebhookTaskFactory(payment=task_payment, owner="crashed", leased_until=expired)
+        for task_payment in [payment, payment, failing]
+    ]
+    # Still leased by a running process
+    leased = WebhookTaskFactory(
+        payment=payment,
+        owner="running",
+        leased_until=timezone.now() + timedelta(minutes=5),
+    )
+
+    def process_payment(task_payment):
+        if task_payment == failing:
+            raise PaymentError("Failed to retrieve payment at Mollie")
+
+    process.side_effect = process_payment
+
+    results = webhook_queue.process_pending(payment.variant, batch_size=2)
+
+    assert results == {"processed": 2, "failed": 1}
+    # The tasks of a payment in a batch are processed by one update
+    assert [call.args[0] for call in process.call_args_list] == [payment, failing]
+    assert set(WebhookTask.objects.values_list("id", flat=True)) == {
+        left_behind[2].id,
+        leased.id,
+    }
+    failed_task = WebhookTask.objects.get(id=left_behind[2].id)
+    assert failed_task.attempts == 1
+    assert failed_task.leased_until > timezone.now()